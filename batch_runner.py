@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+豆包离线批量任务
+从JSONL清单或图片目录读取任务，通过并发工作池调用 DoubaoAPI，
+结果逐条追加写入输出文件，并维护完成索引，崩溃后重启会跳过已完成的任务
+
+清单格式（每行一个JSON对象）:
+    {"id": "0001", "prompt": "描述这张图片", "image": "images/0001.png"}
+    {"id": "0002", "prompt": "写一句口号", "system_prompt": "你是文案专家"}
+
+用法:
+    python batch_runner.py manifest.jsonl -o results.jsonl --concurrency 16
+    python batch_runner.py ./images --prompt "请描述这张图片" -o captions.jsonl
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, Optional, Set
+
+import numpy as np
+from PIL import Image
+
+from nodes import (
+    IMAGE_FORMATS,
+    DoubaoAPI,
+    DoubaoConfig,
+    DoubaoMessage,
+    MessageRole,
+    RetryPolicy,
+    resolve_max_pixels,
+    tensor_to_base64,
+)
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff"}
+
+
+def iter_manifest(source: str, prompt: str = "") -> Iterator[Dict[str, Any]]:
+    """Yield tasks from a JSONL manifest or an image directory"""
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+                    continue
+                path = os.path.join(root, name)
+                yield {
+                    "id": os.path.relpath(path, source),
+                    "prompt": prompt,
+                    "image": path,
+                }
+        return
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            task = json.loads(line)
+            task.setdefault("id", str(line_number))
+            task["id"] = str(task["id"])
+            task.setdefault("prompt", prompt)
+            if task.get("image") and not os.path.isabs(task["image"]):
+                task["image"] = os.path.join(base_dir, task["image"])
+            yield task
+
+
+def truncate_partial_line(path: str, chunk_size: int = 65536):
+    """Cut a line left unfinished by a crash off the end of an append-only file"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - chunk_size)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position != end:
+            f.truncate(position)
+
+
+class BatchRunner:
+    """Resumable batch runner writing results to an append-only JSONL file
+
+    Completed task ids are appended to "<output>.idx" after their result is
+    written, so a restart skips them. Failed tasks are written with an
+    "error" field but not checkpointed, so they are retried on the next run.
+    A crash between the two writes can repeat a task (at-least-once).
+    """
+
+    def __init__(
+        self,
+        api: DoubaoAPI,
+        config: DoubaoConfig,
+        output_path: str,
+        system_prompt: str = "",
+        concurrency: int = 8,
+        image_format: str = "JPEG",
+        image_quality: int = 90,
+        max_megapixels: float = -1.0,
+        progress_interval: float = 10.0,
+    ):
+        self.api = api
+        self.config = config
+        self.output_path = output_path
+        self.index_path = output_path + ".idx"
+        self.system_prompt = system_prompt
+        self.concurrency = concurrency
+        self.image_format = image_format
+        self.image_quality = image_quality
+        self.max_pixels = resolve_max_pixels(config.model, max_megapixels)
+        self.progress_interval = progress_interval
+
+    def load_completed(self) -> Set[str]:
+        """Read the checkpoint index (rebuilt from the output file if missing)"""
+        completed = set()
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                completed.update(line.rstrip("\n") for line in f if line.strip())
+        elif os.path.exists(self.output_path):
+            with open(self.output_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Truncated last line after a crash
+                    if "error" not in record:
+                        completed.add(record["id"])
+        return completed
+
+    def _build_messages(self, task: Dict[str, Any]):
+        messages = []
+        system_prompt = task.get("system_prompt", self.system_prompt)
+        if system_prompt and system_prompt.strip():
+            messages.append(
+                DoubaoMessage.create_text_message(
+                    MessageRole.system, system_prompt.strip()
+                )
+            )
+
+        if task.get("image"):
+            with Image.open(task["image"]) as image:
+                array = np.asarray(image.convert("RGB"))
+            image_base64 = tensor_to_base64(
+                array,
+                self.image_format,
+                self.image_quality,
+                max_pixels=self.max_pixels,
+                cache=None,  # Every manifest image is encoded once
+            )
+            messages.append(
+                DoubaoMessage.create_multimodal_message(
+                    MessageRole.user,
+                    task["prompt"],
+                    image_base64,
+                    mime_type=IMAGE_FORMATS[self.image_format],
+                )
+            )
+        else:
+            messages.append(
+                DoubaoMessage.create_text_message(MessageRole.user, task["prompt"])
+            )
+        return messages
+
+    def _run_task(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        record = {"id": task["id"]}
+        try:
+            response, usage = self.api.chat_completions_with_usage(
+                self._build_messages(task), self.config
+            )
+            record["response"] = response
+            record["usage"] = {
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "total_tokens": usage.total_tokens,
+                "seconds": round(usage.total_seconds, 3),
+            }
+        except Exception as e:
+            record["error"] = str(e)
+        return record
+
+    def run(
+        self, tasks: Iterator[Dict[str, Any]], max_tasks: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Process all pending tasks, returns a summary"""
+        # Appending after a partial line would corrupt the next record too
+        truncate_partial_line(self.output_path)
+        truncate_partial_line(self.index_path)
+        completed = self.load_completed()
+        if completed and not os.path.exists(self.index_path):
+            # Persist the rebuilt index, or the next run would trust an index
+            # holding only this run's ids and repeat the rebuilt tasks
+            partial_path = self.index_path + ".tmp"
+            with open(partial_path, "w", encoding="utf-8") as index:
+                index.writelines(task_id + "\n" for task_id in sorted(completed))
+            os.replace(partial_path, self.index_path)
+        pending = [task for task in tasks if task["id"] not in completed]
+        if max_tasks is not None:
+            pending = pending[:max_tasks]
+        total = len(pending)
+        print(f"Batch: {len(completed)} already done, {total} to run")
+
+        done = failed = 0
+        start = last_report = time.monotonic()
+        queue = iter(pending)
+        in_flight = set()
+
+        with open(self.output_path, "a", encoding="utf-8") as output, open(
+            self.index_path, "a", encoding="utf-8"
+        ) as index, ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+
+            def submit_next() -> bool:
+                task = next(queue, None)
+                if task is None:
+                    return False
+                in_flight.add(executor.submit(self._run_task, task))
+                return True
+
+            # Keep a bounded window in flight so images are not all loaded at once
+            for _ in range(self.concurrency * 2):
+                if not submit_next():
+                    break
+
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    in_flight.discard(future)
+                    record = future.result()
+                    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    output.flush()
+                    if "error" in record:
+                        failed += 1
+                    else:
+                        # Checkpoint only after the result is on disk
+                        index.write(record["id"] + "\n")
+                        index.flush()
+                    done += 1
+                    submit_next()
+
+                now = time.monotonic()
+                if now - last_report >= self.progress_interval or not in_flight:
+                    last_report = now
+                    rate = done / (now - start) if now > start else 0.0
+                    eta = (total - done) / rate if rate else float("inf")
+                    print(
+                        f"Batch: {done}/{total} done, {failed} failed, "
+                        f"{rate:.2f} items/s, ETA {eta:.0f}s"
+                    )
+
+        elapsed = time.monotonic() - start
+        return {
+            "total": total,
+            "done": done,
+            "failed": failed,
+            "seconds": elapsed,
+            "items_per_second": done / elapsed if elapsed else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="豆包离线批量任务")
+    parser.add_argument("source", help="JSONL清单文件或图片目录")
+    parser.add_argument("-o", "--output", required=True, help="结果输出文件（JSONL，追加写入）")
+    parser.add_argument("--prompt", default="Please describe this image.", help="默认提示词")
+    parser.add_argument("--system-prompt", default="", help="系统提示词")
+    parser.add_argument("--model", default="doubao-seed-1.6-flash-250615")
+    parser.add_argument("--max-tokens", type=int, default=1000)
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-attempts", type=int, default=5)
+    parser.add_argument("--image-format", choices=list(IMAGE_FORMATS), default="JPEG")
+    parser.add_argument("--image-quality", type=int, default=90)
+    parser.add_argument("--max-megapixels", type=float, default=-1.0)
+    parser.add_argument("--endpoint", default="https://ark.cn-beijing.volces.com/api/v3")
+    parser.add_argument("--api-key", default=None, help="默认读取 DOUBAO_API_KEY 环境变量")
+    parser.add_argument("--limit", type=int, default=None, help="本次最多处理的任务数")
+    args = parser.parse_args()
+
+    api = DoubaoAPI(
+        api_key=args.api_key,
+        endpoint=args.endpoint,
+        pool_maxsize=max(10, args.concurrency),
+        retry_policy=RetryPolicy(max_attempts=args.max_attempts),
+    )
+    config = DoubaoConfig(
+        model=args.model,
+        max_tokens=args.max_tokens,
+        temperature=args.temperature,
+        seed=args.seed,
+    )
+    runner = BatchRunner(
+        api,
+        config,
+        args.output,
+        system_prompt=args.system_prompt,
+        concurrency=args.concurrency,
+        image_format=args.image_format,
+        image_quality=args.image_quality,
+        max_megapixels=args.max_megapixels,
+    )
+    summary = runner.run(iter_manifest(args.source, args.prompt), max_tasks=args.limit)
+    print(
+        f"Batch finished: {summary['done']} done, {summary['failed']} failed "
+        f"in {summary['seconds']:.1f}s ({summary['items_per_second']:.2f} items/s)"
+    )
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+豆包节点负载基准测试
+在可控并发下驱动 DoubaoTextChatNode.chat / DoubaoVisionChatNode.vision_chat，
+默认对接本地模拟服务（mock_server.py），无需网络
+
+用法:
+    python benchmark.py --mode text --requests 200 --concurrency 16
+    python benchmark.py --mode vision --image-size 1920x1080 --stream
+    python benchmark.py --latency tail:0.2,5,0.05 --hedge-percentile 90
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from mock_server import MockArkServer
+from nodes import (
+    DoubaoAPINode,
+    DoubaoConfig,
+    DoubaoTextChatNode,
+    DoubaoVisionChatNode,
+    METRICS,
+    encode_image,
+    get_hedge_stats,
+)
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+
+def percentile(values, q: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def make_image(width: int, height: int):
+    """ComfyUI IMAGE batch of one [1, H, W, 3] float image in [0, 1]"""
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 1, width, dtype=np.float32)[None, :, None]
+    image = np.broadcast_to(gradient, (height, width, 3)).copy()
+    image += rng.normal(0, 0.02, image.shape).astype(np.float32)
+    np.clip(image, 0, 1, out=image)
+    image = image[None]
+    return torch.from_numpy(image) if torch is not None else image
+
+
+def run_benchmark(args, endpoint: str, hedge_percentile: float = 0.0):
+    api = DoubaoAPINode().create_api(
+        api_key=args.api_key,
+        endpoint=endpoint,
+        pool_maxsize=max(10, args.concurrency),
+        max_attempts=args.max_attempts,
+        hedge_percentile=hedge_percentile,
+    )[0]
+    config = DoubaoConfig(model=args.model, stream=args.stream)
+
+    if args.mode == "vision":
+        width, height = (int(x) for x in args.image_size.lower().split("x"))
+        image = make_image(width, height)
+        node = DoubaoVisionChatNode()
+
+        def call(i):
+            return node.vision_chat(
+                image, f"describe image {i}", api, config, ignore_errors=True
+            )[0]
+
+    else:
+        node = DoubaoTextChatNode()
+
+        def call(i):
+            return node.chat(f"prompt {i}", api, config, ignore_errors=True)[0]
+
+    latencies = []
+    failures = 0
+
+    def timed_call(i):
+        start = time.perf_counter()
+        response = call(i)
+        return time.perf_counter() - start, response
+
+    METRICS.reset()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for latency, response in executor.map(timed_call, range(args.requests)):
+            latencies.append(latency)
+            if not response:
+                failures += 1
+    wall = time.perf_counter() - start
+
+    print(
+        f"mode={args.mode} stream={args.stream} requests={args.requests} "
+        f"concurrency={args.concurrency} hedge_percentile={hedge_percentile}"
+    )
+    print(f"  wall time      {wall:8.2f} s")
+    print(f"  throughput     {args.requests / wall:8.1f} req/s")
+    print(f"  latency p50    {percentile(latencies, 50) * 1000:8.1f} ms")
+    print(f"  latency p95    {percentile(latencies, 95) * 1000:8.1f} ms")
+    print(f"  latency p99    {percentile(latencies, 99) * 1000:8.1f} ms")
+    print(f"  latency mean   {statistics.mean(latencies) * 1000:8.1f} ms")
+    print(f"  failures       {failures:8d}")
+    retries = sum(
+        value
+        for (name, _), value in METRICS.counters.items()
+        if name == "doubao_retries_total"
+    )
+    print(f"  retries        {int(retries):8d}")
+    if hedge_percentile > 0:
+        hedges = get_hedge_stats()
+        print(f"  hedges sent    {hedges['hedges']:8d}")
+        print(f"  hedges won     {hedges['wins']:8d}")
+        print(f"  extra requests {hedges['extra_request_rate'] * 100:7.1f}%")
+
+    if args.mode == "vision":
+        single = image[0]
+        encode_times = []
+        for _ in range(5):
+            t = time.perf_counter()
+            encode_image(single, "JPEG", 95)
+            encode_times.append(time.perf_counter() - t)
+        print(f"  encode/image   {min(encode_times) * 1000:8.1f} ms ({args.image_size})")
+
+    return latencies
+
+
+def run_all(args, endpoint: str):
+    if args.hedge_percentile <= 0:
+        run_benchmark(args, endpoint)
+        return
+
+    # Same load with and without hedging, to show the tail latency reduction
+    baseline = run_benchmark(args, endpoint)
+    print()
+    hedged = run_benchmark(args, endpoint, args.hedge_percentile)
+    print()
+    for q in (50, 95, 99):
+        before, after = percentile(baseline, q), percentile(hedged, q)
+        change = (after / before - 1) * 100 if before else 0.0
+        print(f"  p{q} {before * 1000:8.1f} ms -> {after * 1000:8.1f} ms ({change:+6.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="豆包节点负载基准测试")
+    parser.add_argument("--mode", choices=["text", "vision"], default="text")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--stream", action="store_true", help="使用流式响应")
+    parser.add_argument("--image-size", default="1024x1024", help="视觉模式的图像尺寸 WxH")
+    parser.add_argument("--model", default="doubao-seed-1.6-flash-250615")
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--latency", default="lognormal:0.2,0.5", help="模拟服务的延迟分布")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务返回500的比例")
+    parser.add_argument("--burst-429-every", type=float, default=0.0)
+    parser.add_argument("--burst-429-duration", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--endpoint", default=None, help="压测真实端点（默认启动本地模拟服务）"
+    )
+    parser.add_argument("--api-key", default="mock-key")
+    parser.add_argument(
+        "--hedge-percentile", type=float, default=0.0,
+        help="对冲请求的延迟百分位，大于0时对比开启与关闭对冲的尾延迟",
+    )
+    args = parser.parse_args()
+
+    if args.endpoint:
+        run_all(args, args.endpoint)
+        return
+
+    with MockArkServer(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        burst_429_every=args.burst_429_every,
+        burst_429_duration=args.burst_429_duration,
+        retry_after=0.2,
+        seed=args.seed,
+    ) as server:
+        run_all(args, server.url)
+
+
+if __name__ == "__main__":
+    main()
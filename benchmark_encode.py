@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+图像编码微基准测试
+对比旧版 tensor_to_base64 流程与新版编码流程的每百万像素耗时，
+以及含图片请求体的旧版（pydantic dict + 标准库json）、新版序列化与流式上传的耗时和内存峰值
+
+用法: python benchmark_encode.py [--repeat N] [--quality Q]
+"""
+
+import argparse
+import base64
+import json
+import os
+import time
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from nodes import (
+    IMAGE_FORMATS,
+    DoubaoAPI,
+    DoubaoConfig,
+    DoubaoMessage,
+    MessageRole,
+    RequestBody,
+    encode_image,
+    encode_request_body,
+)
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+# (名称, 高, 宽)
+SIZES = [
+    ("1MP", 1024, 1024),
+    ("1080p", 1080, 1920),
+    ("4K", 2160, 3840),
+]
+
+
+def legacy_encode(image: np.ndarray) -> str:
+    """旧版流程：全量max扫描、乘法、clamp、类型转换、PIL、JPEG q95、base64"""
+    if image.max() <= 1.0:
+        image = image * 255
+    image = np.clip(image, 0, 255).astype(np.uint8)
+    pil_image = Image.fromarray(image, mode="RGB")
+    buffer = BytesIO()
+    pil_image.save(buffer, format="JPEG", quality=95)
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def new_encode(image, image_format: str, quality: int) -> str:
+    return base64.b64encode(encode_image(image, image_format, quality)).decode("ascii")
+
+
+def measure(func, repeat: int) -> float:
+    func()  # 预热
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(func) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_serialization(repeat: int):
+    """Request body of a vision call with 1-4 images of ~2 MiB each"""
+    api = DoubaoAPI(api_key="benchmark")
+    config = DoubaoConfig()
+    print(f"\n{'images':>6} {'serializer':>14} {'ms':>9} {'peak MiB':>9}")
+    for count in (1, 4):
+        images = [
+            base64.b64encode(os.urandom(2 * 1024 * 1024)).decode("ascii")
+            for _ in range(count)
+        ]
+        messages = [
+            DoubaoMessage.create_text_message(MessageRole.system, "system prompt"),
+            DoubaoMessage.create_multimodal_message(MessageRole.user, "describe", images),
+        ]
+
+        def legacy():
+            # 旧版：msg.dict() 后由 requests 的 json= 参数编码
+            data = api._build_request_data(messages, config)
+            data["messages"] = [msg.dict() for msg in messages]
+            return json.dumps(data, allow_nan=False).encode("utf-8")
+
+        def new():
+            return encode_request_body(api._build_request_data(messages, config))
+
+        def streamed():
+            # 流式上传：逐块编码写入socket，不生成完整请求体
+            for _ in RequestBody(api._build_request_data(messages, config)):
+                pass
+
+        for label, func in [("legacy", legacy), ("new", new), ("streamed", streamed)]:
+            seconds = measure(func, repeat)
+            peak_mib = peak_memory(func) / 1024 / 1024
+            print(f"{count:>6} {label:>14} {seconds * 1000:9.1f} {peak_mib:9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图像编码微基准测试")
+    parser.add_argument("--repeat", type=int, default=5, help="每项测试的重复次数")
+    parser.add_argument("--quality", type=int, default=95, help="JPEG/WebP质量")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'size':>6} {'pipeline':>14} {'ms':>9} {'ms/MP':>9} {'KiB':>9}")
+    for name, height, width in SIZES:
+        megapixels = height * width / 1e6
+        # 平滑渐变加少量噪声，接近真实图像的压缩特性
+        gradient = np.linspace(0, 1, width, dtype=np.float32)[None, :, None]
+        image = np.broadcast_to(gradient, (height, width, 3)).copy()
+        image += rng.normal(0, 0.02, image.shape).astype(np.float32)
+        np.clip(image, 0, 1, out=image)
+        tensor = torch.from_numpy(image) if torch is not None else image
+
+        cases = [("legacy JPEG", lambda: legacy_encode(image))]
+        for image_format in IMAGE_FORMATS:
+            cases.append(
+                (
+                    f"new {image_format}",
+                    lambda f=image_format: new_encode(tensor, f, args.quality),
+                )
+            )
+
+        for label, func in cases:
+            seconds = measure(func, args.repeat)
+            size_kib = len(func()) * 3 / 4 / 1024
+            print(
+                f"{name:>6} {label:>14} {seconds * 1000:9.1f} "
+                f"{seconds * 1000 / megapixels:9.1f} {size_kib:9.0f}"
+            )
+
+    benchmark_serialization(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3239 @@
+"""Doubao API client, caches and image helpers used by the ComfyUI nodes
+
+Imported lazily by nodes.py on first use so that loading the custom node
+package does not pull in torch, PIL, numpy, requests or pydantic.
+"""
+
+import os
+import json
+import asyncio
+import bisect
+import collections
+import contextvars
+import copy
+import functools
+import weakref
+import base64
+import hashlib
+import heapq
+import itertools
+import email.utils
+import random
+import socket
+import sqlite3
+import threading
+import time
+import requests
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+import urllib3.connection
+import urllib3.connectionpool
+from urllib3.util.retry import Retry
+from io import BytesIO
+from PIL import Image
+import numpy as np
+import torch
+from typing import List, Dict, Optional, Any, Callable, Iterable, Iterator, Tuple, Union
+from pydantic import BaseModel
+from enum import Enum
+
+# Option lists shown on the nodes live in a module without imports of its own
+if __package__:
+    from .doubao_constants import IMAGE_FORMATS, POOL_STRATEGIES, SAMPLING_METHODS
+else:
+    from doubao_constants import IMAGE_FORMATS, POOL_STRATEGIES, SAMPLING_METHODS
+
+# Doubao LLM supported model list (based on latest API documentation)
+doubao_models = [
+    # Latest Doubao 1.6 series models (recommended)
+    "doubao-seed-1.6-250615",
+    "doubao-seed-1.6-flash-250615",
+    "doubao-seed-1.6-thinking-250615",
+    # Doubao 1.5 series models
+    "doubao-1.5-thinking-vision-pro-250428",
+    "doubao-1.5-thinking-pro-250415",
+    "doubao-1.5-thinking-pro-m-250428",
+    "doubao-1.5-vision-pro-250328",
+    "doubao-1.5-pro-32k",
+    "doubao-1.5-pro-256k",
+    "doubao-1.5-lite-32k",
+    # DeepSeek models
+    "deepseek-r1-250528",
+    "deepseek-r1-250120",
+    "deepseek-r1-distill-qwen-32b-250120",
+    "deepseek-r1-distill-qwen-7b-250120",
+]
+
+# Models that support vision understanding
+doubao_vision_models = [
+    # Latest Doubao 1.6 series vision models (recommended)
+    "doubao-seed-1.6-250615",
+    "doubao-seed-1.6-flash-250615",
+    "doubao-seed-1.6-thinking-250615",
+    # Doubao 1.5 series vision models
+    "doubao-1.5-thinking-vision-pro-250428",
+    "doubao-1.5-thinking-pro-m-250428",
+    "doubao-1.5-vision-pro-250328",
+    "doubao-1.5-vision-pro-32k",
+]
+
+# Default upload pixel budget per vision model. The server downsamples larger
+# images internally, so uploading more pixels only costs encode time and
+# bandwidth. Endpoint IDs and unknown models use DEFAULT_VISION_MAX_PIXELS.
+DEFAULT_VISION_MAX_PIXELS = 2048 * 2048
+doubao_vision_max_pixels = {
+    "doubao-seed-1.6-250615": 2048 * 2048,
+    "doubao-seed-1.6-flash-250615": 2048 * 2048,
+    "doubao-seed-1.6-thinking-250615": 2048 * 2048,
+    "doubao-1.5-thinking-vision-pro-250428": 2048 * 2048,
+    "doubao-1.5-thinking-pro-m-250428": 1792 * 1792,
+    "doubao-1.5-vision-pro-250328": 1792 * 1792,
+    "doubao-1.5-vision-pro-32k": 1280 * 1280,
+}
+
+
+class DoubaoConfig(BaseModel):
+    """Doubao LLM configuration"""
+
+    model: str = (
+        "doubao-seed-1.6-flash-250615"  # Default to latest Doubao 1.6 model, can also use Endpoint ID
+    )
+    max_tokens: int = 1000
+    temperature: float = 0.7
+    top_p: float = 0.9
+    stream: bool = False
+    seed: Optional[int] = None
+
+
+class MessageRole(str, Enum):
+    """Message role enumeration"""
+
+    system = "system"
+    user = "user"
+    assistant = "assistant"
+
+
+class DoubaoMessage(BaseModel):
+    """Doubao message format"""
+
+    role: MessageRole
+    content: List[Dict[str, Any]]
+
+    @classmethod
+    def create_text_message(cls, role: MessageRole, text: str):
+        """Create text-only message"""
+        return cls(role=role, content=[{"type": "text", "text": text}])
+
+    @classmethod
+    def create_multimodal_message(
+        cls,
+        role: MessageRole,
+        text: str,
+        image_base64: Union[str, List[str]],
+        mime_type: str = "image/jpeg",
+        detail: Union[None, str, List[Optional[str]]] = None,
+    ):
+        """Create multimodal message (text + one or more images)
+
+        detail is the "low" / "high" resolution hint, either one for all
+        images or one per image. None or "auto" leaves it to the server.
+        """
+        images = [image_base64] if isinstance(image_base64, str) else image_base64
+        details = detail if isinstance(detail, list) else [detail] * len(images)
+
+        content = [{"type": "text", "text": text}]
+        for payload, image_detail in zip(images, details):
+            image_url = {"url": f"data:{mime_type};base64,{payload}"}
+            if image_detail and image_detail != "auto":
+                image_url["detail"] = image_detail
+            content.append({"type": "image_url", "image_url": image_url})
+        return cls(role=role, content=content)
+
+    def to_payload(self) -> Dict[str, Any]:
+        """Request body form of the message, sharing the content parts instead of copying them"""
+        return {"role": self.role.value, "content": self.content}
+
+
+class DoubaoUsage(BaseModel):
+    """Token usage and timing of one (or several aggregated) chat completion calls"""
+
+    model: str = ""
+    requests: int = 0
+    attempts: int = 0
+    cache_hits: int = 0
+    coalesced: int = 0  # Calls that shared an identical in-flight request
+    hedged: int = 0  # Calls that sent a duplicate request because they were slow
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    reasoning_tokens: int = 0
+    cached_tokens: int = 0  # Prompt tokens served from the server-side context cache
+    total_tokens: int = 0
+    connect_seconds: float = 0.0  # DNS + TCP connect, 0 on reused connections
+    tls_seconds: float = 0.0
+    ttfb_seconds: float = 0.0  # Until response headers arrived
+    first_token_seconds: float = 0.0
+    total_seconds: float = 0.0
+    request_bytes: int = 0
+    response_bytes: int = 0
+
+    def add_server_usage(self, usage: Optional[Dict[str, Any]]):
+        """Copy the API response's usage block"""
+        if not usage:
+            return
+        self.prompt_tokens = usage.get("prompt_tokens") or 0
+        self.completion_tokens = usage.get("completion_tokens") or 0
+        self.total_tokens = usage.get("total_tokens") or 0
+        details = usage.get("completion_tokens_details") or {}
+        self.reasoning_tokens = details.get("reasoning_tokens") or 0
+        details = usage.get("prompt_tokens_details") or {}
+        self.cached_tokens = details.get("cached_tokens") or 0
+
+    def merge(self, other: "DoubaoUsage") -> "DoubaoUsage":
+        """Sum two usages (e.g. over a batch)"""
+        merged = {}
+        for name, value in self.dict().items():
+            if name == "model":
+                merged[name] = value or other.model
+            else:
+                merged[name] = value + getattr(other, name)
+        return DoubaoUsage(**merged)
+
+
+# Shared keep-alive sessions, keyed by endpoint and pool settings.
+# ComfyUI creates a new DoubaoAPI every time the graph is re-run, so the
+# sessions live at module level to keep connections warm across executions.
+_session_pool: Dict[tuple, requests.Session] = {}
+_session_pool_lock = threading.Lock()
+
+
+# Connection setup timings of the current thread's request, filled in by the
+# instrumented urllib3 connections below (zero when a keep-alive connection is reused)
+_connection_timings = threading.local()
+
+
+def reset_connection_timings():
+    _connection_timings.tcp = 0.0
+    _connection_timings.connect = 0.0
+
+
+def get_connection_timings() -> Tuple[float, float]:
+    """(DNS + TCP connect seconds, TLS handshake seconds) of the current thread's request"""
+    tcp = getattr(_connection_timings, "tcp", 0.0)
+    connect = getattr(_connection_timings, "connect", 0.0)
+    return tcp, max(0.0, connect - tcp)
+
+
+# Cancel events of the current thread's request, set by DoubaoAPI around a
+# request that may be cancelled from another thread (e.g. a losing hedge)
+_request_cancel = threading.local()
+
+# Cancel event of the node call a request belongs to (e.g. a DoubaoFuture).
+# Threads fanning a call out run their work in a copy of the caller's context.
+_call_cancel: contextvars.ContextVar = contextvars.ContextVar("doubao_call_cancel", default=None)
+
+
+def with_call_context(function: Callable) -> Callable:
+    """function bound to the caller's context, to run on another thread"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(function, *args, **kwargs)
+
+
+def _cancel_events(cancel: Optional[threading.Event]) -> Tuple[threading.Event, ...]:
+    """A request's own cancel event plus that of the node call it belongs to"""
+    return tuple(event for event in (cancel, _call_cancel.get()) if event is not None)
+
+
+def _is_cancelled(events: Tuple[threading.Event, ...]) -> bool:
+    return any(event.is_set() for event in events)
+
+
+class CancelEvent(threading.Event):
+    """Cancel flag that also aborts the connections still waiting for a response
+
+    A connection is attached from sending a request until its response
+    headers arrive. Setting the event shuts their sockets down, so waiting
+    threads fail at once instead of holding the connection until read_timeout.
+    """
+
+    def __init__(self, on_sent: Optional[Callable[[], None]] = None):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._on_sent = on_sent
+
+    def mark_sent(self):
+        """Called as the request goes out (after rate limiting), only the first call counts"""
+        on_sent, self._on_sent = self._on_sent, None
+        if on_sent is not None:
+            on_sent()
+
+    def attach(self, connection):
+        with self._lock:
+            if not self.is_set():
+                self._connections.add(connection)
+
+    def detach(self, connection):
+        with self._lock:
+            self._connections.discard(connection)
+
+    def set(self):
+        # Shut down under the lock: once detached a connection may be reused
+        with self._lock:
+            super().set()
+            for connection in self._connections:
+                sock = getattr(connection, "sock", None)
+                if sock is not None:
+                    try:
+                        # Plain socket shutdown, leaving TLS state to the reading thread
+                        socket.socket.shutdown(sock, socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+            self._connections.clear()
+
+
+class _TimedConnectionMixin:
+    def request(self, *args, **kwargs):
+        for cancel in getattr(_request_cancel, "events", ()):
+            if isinstance(cancel, CancelEvent):
+                cancel.attach(self)
+        return super().request(*args, **kwargs)
+
+    def getresponse(self, *args, **kwargs):
+        try:
+            return super().getresponse(*args, **kwargs)
+        finally:
+            for cancel in getattr(_request_cancel, "events", ()):
+                if isinstance(cancel, CancelEvent):
+                    cancel.detach(self)
+
+    def _new_conn(self):
+        start = time.perf_counter()
+        try:
+            return super()._new_conn()
+        finally:
+            _connection_timings.tcp = (
+                getattr(_connection_timings, "tcp", 0.0) + time.perf_counter() - start
+            )
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            _connection_timings.connect = (
+                getattr(_connection_timings, "connect", 0.0)
+                + time.perf_counter()
+                - start
+            )
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, urllib3.connection.HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, urllib3.connection.HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(urllib3.connectionpool.HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(urllib3.connectionpool.HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class InstrumentedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections record connect and TLS handshake time"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+def get_shared_session(
+    endpoint: str,
+    pool_connections: int = 10,
+    pool_maxsize: int = 10,
+    max_retries: int = 0,
+) -> requests.Session:
+    """Get (or create) the pooled keep-alive session for an endpoint"""
+    key = (endpoint.rstrip("/"), pool_connections, pool_maxsize, max_retries)
+    with _session_pool_lock:
+        session = _session_pool.get(key)
+        if session is None:
+            # Only retry connection errors here: the request was never sent,
+            # so retrying cannot cause a duplicate (billed) completion.
+            retries = Retry(
+                total=max_retries,
+                connect=max_retries,
+                read=0,
+                status=0,
+                other=0,
+                allowed_methods=None,
+            )
+            adapter = InstrumentedHTTPAdapter(
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+                max_retries=retries,
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session_pool[key] = session
+        return session
+
+
+def close_shared_sessions():
+    """Close all pooled sessions (e.g. on shutdown)"""
+    with _session_pool_lock:
+        for session in _session_pool.values():
+            session.close()
+        _session_pool.clear()
+
+
+# Default location of the on-disk response cache
+DEFAULT_CACHE_DIR = os.getenv(
+    "DOUBAO_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+)
+
+
+class ResponseCache:
+    """Persistent content-addressed response cache backed by SQLite
+
+    Entries expire after ttl_seconds and the least recently used entries are
+    evicted once the stored responses exceed max_bytes.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: float = 7 * 24 * 3600,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(request_data: Dict[str, Any]) -> str:
+        """Stable hash of model, messages and sampling parameters"""
+        fields = {k: v for k, v in request_data.items() if k != "stream"}
+        serialized = json.dumps(
+            fields, sort_keys=True, ensure_ascii=False, separators=(",", ":")
+        )
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        # Drop expired entries, then least recently used ones until under budget
+        self._conn.execute(
+            "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+        )
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ).fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total,
+        }
+
+
+_response_caches: Dict[str, ResponseCache] = {}
+_response_caches_lock = threading.Lock()
+
+
+def get_response_cache(
+    path: Optional[str] = None,
+    max_bytes: int = 64 * 1024 * 1024,
+    ttl_seconds: float = 7 * 24 * 3600,
+) -> ResponseCache:
+    """Get (or open) the shared response cache stored at path"""
+    path = os.path.abspath(path or os.path.join(DEFAULT_CACHE_DIR, "responses.sqlite"))
+    with _response_caches_lock:
+        cache = _response_caches.get(path)
+        if cache is None:
+            cache = ResponseCache(path, max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+            _response_caches[path] = cache
+        else:
+            # Limits follow the latest node settings
+            cache.max_bytes = max_bytes
+            cache.ttl_seconds = ttl_seconds
+        return cache
+
+
+# Rough token cost of one image part, used for client-side TPM budgeting
+IMAGE_TOKEN_ESTIMATE = 1000
+
+
+def estimate_prompt_tokens(messages: List[DoubaoMessage]) -> int:
+    """Cheap upper-bound estimate of prompt tokens
+
+    Counts ~3 UTF-8 bytes per token (one token per CJK character, a little
+    pessimistic for English) plus a fixed cost per image part.
+    """
+    total = 0
+    for msg in messages:
+        for part in msg.content:
+            if part.get("type") == "text":
+                total += len(part.get("text", "").encode("utf-8")) // 3 + 1
+            elif part.get("type") == "image_url":
+                total += IMAGE_TOKEN_ESTIMATE
+    return total
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute, holding one minute of budget"""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.tokens = min(
+            self.capacity, self.tokens + elapsed * self.rate_per_minute / 60.0
+        )
+        self.updated_at = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until amount tokens are available (after refill)"""
+        # Never wait for more than a full bucket, or large requests would block forever
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / self.rate_per_minute
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """Client-side requests/min and tokens/min limiter
+
+    Callers over budget are queued (blocked) until the buckets refill instead
+    of failing. A limit of 0 disables that bucket.
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self._condition = threading.Condition()
+        self.waiting = 0
+        self.total_requests = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.configure(requests_per_minute, tokens_per_minute)
+
+    def configure(self, requests_per_minute: int, tokens_per_minute: int):
+        with self._condition:
+            self.requests_per_minute = requests_per_minute
+            self.tokens_per_minute = tokens_per_minute
+            self._request_bucket = (
+                TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+            )
+            self._token_bucket = (
+                TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+            )
+            self._condition.notify_all()
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Block until one request and the estimated tokens fit the budget, return seconds waited"""
+        start = time.monotonic()
+        with self._condition:
+            self.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = 0.0
+                    for bucket, amount in (
+                        (self._request_bucket, 1),
+                        (self._token_bucket, tokens),
+                    ):
+                        if bucket is not None:
+                            bucket.refill(now)
+                            wait = max(wait, bucket.time_until(amount))
+                    if wait <= 0:
+                        break
+                    self._condition.wait(wait)
+
+                if self._request_bucket is not None:
+                    self._request_bucket.consume(1)
+                if self._token_bucket is not None:
+                    self._token_bucket.consume(tokens)
+            finally:
+                self.waiting -= 1
+
+            waited = time.monotonic() - start
+            self.total_requests += 1
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            return waited
+
+    def refund(self, requests: int = 0, tokens: int = 0):
+        """Give back budget taken by acquire for a request that was cancelled"""
+        with self._condition:
+            for bucket, amount in (
+                (self._request_bucket, requests),
+                (self._token_bucket, tokens),
+            ):
+                if bucket is not None and amount:
+                    bucket.tokens = min(bucket.capacity, bucket.tokens + amount)
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and wait-time counters"""
+        with self._condition:
+            return {
+                "queue_depth": self.waiting,
+                "requests": self.total_requests,
+                "total_wait_seconds": self.total_wait_seconds,
+                "avg_wait_seconds": (
+                    self.total_wait_seconds / self.total_requests
+                    if self.total_requests
+                    else 0.0
+                ),
+                "max_wait_seconds": self.max_wait_seconds,
+            }
+
+
+_rate_limiters: Dict[tuple, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(
+    api_key: str, endpoint: str, requests_per_minute: int, tokens_per_minute: int
+) -> RateLimiter:
+    """Get the limiter shared by every client of the same api_key and endpoint"""
+    key = (hashlib.sha256(api_key.encode("utf-8")).hexdigest(), endpoint.rstrip("/"))
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+            _rate_limiters[key] = limiter
+        elif (limiter.requests_per_minute, limiter.tokens_per_minute) != (
+            requests_per_minute,
+            tokens_per_minute,
+        ):
+            # Limits follow the latest node settings
+            limiter.configure(requests_per_minute, tokens_per_minute)
+        return limiter
+
+
+class DoubaoAPIError(Exception):
+    """Doubao API call failure
+
+    retryable marks transient failures (429, 5xx, connection errors, timeouts);
+    retry_after carries the server's Retry-After hint in seconds, if any.
+    """
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        retryable: bool = False,
+        retry_after: Optional[float] = None,
+        reason: str = "error",
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class RequestCancelled(DoubaoAPIError):
+    """Raised inside a request whose result is no longer needed (it lost a hedge race)"""
+
+    def __init__(self, message: str = "Request cancelled"):
+        super().__init__(message, reason="cancelled")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy(BaseModel):
+    """Retry policy for chat completion requests"""
+
+    max_attempts: int = 3
+    backoff_base: float = 1.0  # Delay before the first retry, doubled every attempt
+    backoff_max: float = 30.0
+    jitter: float = 0.5  # Fraction of the delay randomised away
+    respect_retry_after: bool = True
+    max_retry_after: float = 120.0
+    retry_statuses: List[int] = [408, 409, 429, 500, 502, 503, 504]
+    retry_on_read_timeout: bool = True
+
+    def get_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Delay before retrying after the given (1-based) failed attempt"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        delay *= 1.0 - self.jitter * random.random()
+        if self.respect_retry_after and retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_retry_after))
+        return delay
+
+    def classify(self, error: requests.exceptions.RequestException) -> DoubaoAPIError:
+        """Wrap a requests exception, marking whether it is worth retrying"""
+        message = f"Request failed: {str(error)}"
+        if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+            status = error.response.status_code
+            return DoubaoAPIError(
+                message,
+                status_code=status,
+                retryable=status in self.retry_statuses,
+                retry_after=parse_retry_after(error.response.headers.get("Retry-After")),
+                reason=f"http_{status}",
+            )
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            # Connect timeouts never reached the server
+            return DoubaoAPIError(message, retryable=True, reason="connect_timeout")
+        if isinstance(error, requests.exceptions.ReadTimeout):
+            return DoubaoAPIError(
+                message, retryable=self.retry_on_read_timeout, reason="read_timeout"
+            )
+        if isinstance(error, requests.exceptions.ConnectionError):
+            return DoubaoAPIError(message, retryable=True, reason="connection_error")
+        return DoubaoAPIError(message, reason="request_error")
+
+
+class HedgePolicy(BaseModel):
+    """When to send a duplicate (hedge) of a slow request
+
+    The hedge goes out once the request has waited longer than the given
+    percentile of recent latencies (time to first token when streaming),
+    clamped to [min_delay, max_delay]. Until min_samples latencies are known
+    max_delay is used, so a cold start does not double every request.
+    """
+
+    percentile: float = 95.0
+    min_delay: float = 0.2
+    max_delay: float = 10.0
+    min_samples: int = 20
+
+    def get_delay(self, tracker: "LatencyTracker") -> float:
+        latency = tracker.percentile(self.percentile, self.min_samples)
+        if latency is None:
+            return self.max_delay
+        return min(self.max_delay, max(self.min_delay, latency))
+
+
+# Context caches are only worth creating for prefixes at least this long
+CONTEXT_CACHE_MIN_TOKENS = 1024
+
+# Statuses meaning the endpoint / model has no context cache support
+CONTEXT_UNSUPPORTED_STATUSES = (400, 403, 404, 405, 501)
+
+
+class ContextCache:
+    """Lifecycle of server-side Ark context caches for shared message prefixes
+
+    The leading system messages of a request are hashed with the model name.
+    The first request with a new prefix creates a context on the server
+    (/context/create), later requests reuse its id and send only the
+    remaining messages. Contexts are recreated in the background once less
+    than refresh_margin seconds of their TTL are left. If creation fails with
+    a status in CONTEXT_UNSUPPORTED_STATUSES the model is not tried again for
+    unsupported_backoff seconds and requests go out with the full prefix.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = 3600,
+        refresh_margin: float = 300.0,
+        min_prefix_tokens: int = CONTEXT_CACHE_MIN_TOKENS,
+        unsupported_backoff: float = 3600.0,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self.min_prefix_tokens = min_prefix_tokens
+        self.unsupported_backoff = unsupported_backoff
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}  # key -> {"id", "expires_at"}
+        self._pending: Dict[str, threading.Event] = {}
+        self._unsupported: Dict[str, float] = {}  # model -> retry after (monotonic)
+        self.counts = collections.Counter()
+
+    @staticmethod
+    def split_prefix(messages: List[DoubaoMessage]) -> int:
+        """Number of leading system messages (the cacheable prefix)"""
+        count = 0
+        while count < len(messages) - 1 and messages[count].role == MessageRole.system:
+            count += 1
+        return count
+
+    @staticmethod
+    def make_key(model: str, prefix: List[DoubaoMessage]) -> str:
+        payload = json.dumps(
+            [model.strip()] + [msg.to_payload() for msg in prefix],
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, result: str):
+        # Called with self._lock held
+        self.counts[result] += 1
+        METRICS.inc("doubao_context_cache_total", result=result)
+
+    def lookup(
+        self,
+        model: str,
+        prefix: List[DoubaoMessage],
+        create: Callable[[List[DoubaoMessage], int], str],
+    ) -> Optional[str]:
+        """Context id for this prefix, creating one if needed
+
+        create(prefix, ttl_seconds) must return the new context id. Returns
+        None when the prefix should be sent in full instead.
+        """
+        if not prefix or estimate_prompt_tokens(prefix) < self.min_prefix_tokens:
+            return None
+
+        key = self.make_key(model, prefix)
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                if self._unsupported.get(model, 0) > now:
+                    return None
+                entry = self._entries.get(key)
+                if entry is not None and now < entry["expires_at"]:
+                    if (
+                        now >= entry["expires_at"] - self.refresh_margin
+                        and key not in self._pending
+                    ):
+                        self._pending[key] = threading.Event()
+                        threading.Thread(
+                            target=self._create,
+                            args=(key, model, prefix, create),
+                            daemon=True,
+                        ).start()
+                    self._count("hit")
+                    return entry["id"]
+
+                pending = self._pending.get(key)
+                if pending is None:
+                    self._pending[key] = threading.Event()
+                    break
+
+            # Another thread is creating this context, wait for it
+            if not pending.wait(timeout=30):
+                return None
+
+        return self._create(key, model, prefix, create)
+
+    def _create(
+        self,
+        key: str,
+        model: str,
+        prefix: List[DoubaoMessage],
+        create: Callable[[List[DoubaoMessage], int], str],
+    ) -> Optional[str]:
+        context_id = None
+        try:
+            context_id = create(prefix, self.ttl_seconds)
+            with self._lock:
+                self._entries[key] = {
+                    "id": context_id,
+                    "expires_at": time.monotonic() + self.ttl_seconds,
+                }
+                self._count("created")
+        except Exception as e:
+            status = getattr(e, "status_code", None)
+            if status in CONTEXT_UNSUPPORTED_STATUSES:
+                with self._lock:
+                    self._unsupported[model] = (
+                        time.monotonic() + self.unsupported_backoff
+                    )
+                    self._count("unsupported")
+                print(f"Doubao context cache unsupported for {model}, sending full prompts: {str(e)}")
+            else:
+                with self._lock:
+                    self._count("create_failed")
+                print(f"Doubao context cache creation failed (ignored): {str(e)}")
+        finally:
+            with self._lock:
+                self._pending.pop(key).set()
+        return context_id
+
+    def invalidate(self, model: str, prefix: List[DoubaoMessage]):
+        """Forget a context the server no longer knows (expired or deleted)"""
+        with self._lock:
+            self._entries.pop(self.make_key(model, prefix), None)
+            self._count("invalidated")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), **self.counts}
+
+
+_context_caches: Dict[tuple, ContextCache] = {}
+_context_caches_lock = threading.Lock()
+
+
+def get_context_cache(api_key: str, endpoint: str, ttl_seconds: int = 3600) -> ContextCache:
+    """Get the context cache registry shared by every client of the same api_key and endpoint"""
+    key = (hashlib.sha256(api_key.encode("utf-8")).hexdigest(), endpoint.rstrip("/"))
+    with _context_caches_lock:
+        cache = _context_caches.get(key)
+        if cache is None:
+            cache = _context_caches[key] = ContextCache(ttl_seconds=ttl_seconds)
+        else:
+            # TTL follows the latest node settings
+            cache.ttl_seconds = ttl_seconds
+        return cache
+
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+BYTES_BUCKETS = [1024 * 4**i for i in range(10)]  # 1 KiB .. 256 MiB
+
+
+class Histogram:
+    """Fixed-bucket histogram"""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile (upper bound of the bucket it falls in)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    """In-process registry of counters, histograms and recent per-call records
+
+    Export with to_prometheus() (text exposition format) or export_jsonl().
+    Set DOUBAO_METRICS_JSONL to also append every call record to a file.
+    """
+
+    def __init__(self, max_records: int = 1000):
+        self._lock = threading.Lock()
+        self.counters: Dict[tuple, float] = {}
+        self.histograms: Dict[tuple, Histogram] = {}
+        self.records = collections.deque(maxlen=max_records)
+        self.jsonl_path = os.getenv("DOUBAO_METRICS_JSONL")
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> tuple:
+        return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(
+        self, name: str, value: float, buckets: List[float] = LATENCY_BUCKETS, **labels
+    ):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def get_counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self.counters.get(self._key(name, labels), 0)
+
+    def get_histogram(self, name: str, **labels) -> Optional[Histogram]:
+        with self._lock:
+            return self.histograms.get(self._key(name, labels))
+
+    def record_call(self, usage: DoubaoUsage, endpoint: str, status: str):
+        """Record one chat completion call"""
+        labels = {"model": usage.model, "status": status}
+        self.inc("doubao_requests_total", **labels)
+        if usage.cache_hits:
+            self.inc("doubao_response_cache_hits_total", model=usage.model)
+        if usage.coalesced:
+            self.inc("doubao_coalesced_requests_total", model=usage.model)
+        for kind in ("prompt", "completion", "reasoning", "cached"):
+            tokens = getattr(usage, f"{kind}_tokens")
+            if tokens:
+                self.inc("doubao_tokens_total", tokens, model=usage.model, kind=kind)
+        if not usage.cache_hits and not usage.coalesced:
+            for phase in ("connect", "tls", "ttfb", "first_token", "total"):
+                self.observe(
+                    "doubao_request_seconds", getattr(usage, f"{phase}_seconds"), phase=phase
+                )
+            self.observe(
+                "doubao_payload_bytes", usage.request_bytes, BYTES_BUCKETS, direction="sent"
+            )
+            self.observe(
+                "doubao_payload_bytes",
+                usage.response_bytes,
+                BYTES_BUCKETS,
+                direction="received",
+            )
+
+        record = {"timestamp": time.time(), "endpoint": endpoint, "status": status}
+        record.update(usage.dict())
+        with self._lock:
+            self.records.append(record)
+            jsonl_path = self.jsonl_path
+        if jsonl_path:
+            try:
+                with open(jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"Doubao metrics: failed to write {jsonl_path}: {str(e)}")
+
+    def to_prometheus(self) -> str:
+        """Render all metrics in Prometheus text exposition format"""
+
+        def fmt_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            seen = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} counter")
+                    seen.add(name)
+                lines.append(f"{name}{fmt_labels(labels)} {value}")
+
+            for (name, labels), histogram in sorted(
+                self.histograms.items(), key=lambda item: item[0]
+            ):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} histogram")
+                    seen.add(name)
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f"{name}_bucket{fmt_labels(labels, [('le', bound)])} {cumulative}"
+                    )
+                lines.append(
+                    f"{name}_bucket{fmt_labels(labels, [('le', '+Inf')])} {histogram.count}"
+                )
+                lines.append(f"{name}_sum{fmt_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{fmt_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def export_jsonl(self, path: str) -> int:
+        """Write the recent call records to a JSONL file, returns the number written"""
+        with self._lock:
+            records = list(self.records)
+        with open(path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return len(records)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.records.clear()
+
+
+# Process-wide metrics registry
+METRICS = MetricsRegistry()
+
+
+def record_retry(reason: str):
+    METRICS.inc("doubao_retries_total", reason=reason)
+
+
+def get_retry_stats() -> Dict[str, int]:
+    """Number of retries performed so far, by reason"""
+    with METRICS._lock:
+        return {
+            dict(labels)["reason"]: int(value)
+            for (name, labels), value in METRICS.counters.items()
+            if name == "doubao_retries_total"
+        }
+
+
+class SingleFlight:
+    """Coalesces identical concurrent calls into one
+
+    The first caller for a key runs the function, callers arriving while it
+    is in flight wait and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Dict[str, Any]] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: str, function: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Returns the result and whether it was shared from another caller"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = {"event": threading.Event()}
+                self.leaders += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call["event"].wait()
+            if "error" in call:
+                raise call["error"]
+            return call["result"], True
+
+        try:
+            call["result"] = function()
+            return call["result"], False
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call["event"].set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+            }
+
+
+# Shared by every DoubaoAPI instance, keys include the endpoint and API key
+SINGLE_FLIGHT = SingleFlight()
+
+
+class LatencyTracker:
+    """Latencies of the last window successful requests"""
+
+    def __init__(self, window: int = 200):
+        self._samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        """Nearest-rank percentile, None with fewer than min_samples samples"""
+        with self._lock:
+            if len(self._samples) < max(1, min_samples):
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+
+# Latency history outlives the API objects, which ComfyUI recreates on every run
+_latency_trackers: Dict[tuple, LatencyTracker] = {}
+_latency_trackers_lock = threading.Lock()
+
+
+def get_latency_tracker(*key: Any) -> LatencyTracker:
+    """Latency history shared by every client sending the same kind of request"""
+    with _latency_trackers_lock:
+        tracker = _latency_trackers.get(key)
+        if tracker is None:
+            tracker = LatencyTracker()
+            _latency_trackers[key] = tracker
+        return tracker
+
+
+class HedgeTimer:
+    """One thread firing the hedge callbacks of all in-flight requests at their deadlines"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._heap = []
+        self._counter = itertools.count()
+        self._thread = None
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> list:
+        """Run callback after delay seconds, returns a handle for cancel()"""
+        entry = [time.monotonic() + delay, next(self._counter), callback]
+        with self._condition:
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="doubao-hedge-timer", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+        return entry
+
+    def cancel(self, entry: list):
+        with self._condition:
+            entry[2] = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    self._condition.wait(self._heap[0][0] - now if self._heap else None)
+                callback = heapq.heappop(self._heap)[2]
+            if callback is not None:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Doubao hedge timer error: {str(e)}")
+
+
+HEDGE_TIMER = HedgeTimer()
+
+# Hedge copies run on their own pool, sized with DOUBAO_HEDGE_WORKERS. A
+# hedge is skipped rather than queued when every worker is busy.
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_hedge_slots: Optional[threading.BoundedSemaphore] = None
+_hedge_executor_lock = threading.Lock()
+
+
+def get_hedge_executor() -> Tuple[ThreadPoolExecutor, threading.BoundedSemaphore]:
+    global _hedge_executor, _hedge_slots
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            workers = int(os.getenv("DOUBAO_HEDGE_WORKERS", "64"))
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="doubao-hedge"
+            )
+            _hedge_slots = threading.BoundedSemaphore(workers)
+        return _hedge_executor, _hedge_slots
+
+
+def run_hedged(
+    call: Callable[
+        [threading.Event, Optional[Callable[[str, str], None]]], Tuple[str, DoubaoUsage]
+    ],
+    policy: HedgePolicy,
+    tracker: LatencyTracker,
+    model: str,
+    stream: bool = False,
+    on_delta: Optional[Callable[[str, str], None]] = None,
+) -> Tuple[str, DoubaoUsage]:
+    """Run call, starting a second copy if the first is slow; the first to answer wins
+
+    call(cancel, on_delta) sends one request and must stop early once cancel
+    (a CancelEvent) is set. The original runs on the caller's thread. The
+    hedge delay starts once it is actually sent (cancel.mark_sent(), after
+    rate limiting), and the hedge runs on the hedge pool, or is skipped when
+    no hedge worker is free. When streaming, the first token decides the race
+    and only the winner's deltas reach on_delta. The loser is cancelled: a
+    stream is closed at once, a plain request still waiting for its response
+    has its connection shut down and skips its remaining retries.
+    """
+    lock = threading.Lock()
+    context = contextvars.copy_context()  # Hedges are launched from the timer thread
+    cancels = []
+    winner = []
+    original_done = []
+    hedge = []  # Future of the hedge copy, once launched
+    timer = []
+
+    def claim(index: int, started: List[float]) -> bool:
+        with lock:
+            if not winner:
+                winner.append(index)
+                if started:
+                    tracker.add(time.perf_counter() - started[0])
+                for other, cancel in enumerate(cancels):
+                    if other != index:
+                        cancel.set()
+            return winner[0] == index
+
+    def copy_of(index: int):
+        started = []
+
+        def sent():
+            started.append(time.perf_counter())
+            if index == 0:
+                with lock:
+                    if not winner and not original_done:
+                        timer.append(HEDGE_TIMER.schedule(policy.get_delay(tracker), launch))
+
+        cancel = CancelEvent(on_sent=sent)
+
+        def forward(delta: str, text: str):
+            if not claim(index, started):
+                raise RequestCancelled()
+            if on_delta is not None:
+                on_delta(delta, text)
+
+        def run() -> Tuple[str, DoubaoUsage]:
+            result = call(cancel, forward if stream else None)
+            if not claim(index, started):
+                raise RequestCancelled()
+            return result
+
+        return cancel, run
+
+    def launch():
+        executor, slots = get_hedge_executor()
+        with lock:
+            # Registered under the lock so a winner claimed meanwhile cancels it
+            if winner or original_done:
+                return
+            if not slots.acquire(blocking=False):
+                METRICS.inc("doubao_hedges_skipped_total", model=model)
+                return
+            cancel, run = copy_of(1)
+            cancels.append(cancel)
+
+            def run_hedge() -> Tuple[str, DoubaoUsage]:
+                try:
+                    return run()
+                finally:
+                    slots.release()
+
+            METRICS.inc("doubao_hedges_total", model=model)
+            hedge.append(executor.submit(context.copy().run, run_hedge))
+
+    METRICS.inc("doubao_hedge_calls_total", model=model)
+    cancel, run = copy_of(0)
+    cancels.append(cancel)
+    try:
+        response, usage = run()
+        error = None
+    except RequestCancelled:
+        error = None  # The hedge won
+    except Exception as e:
+        error = e
+    finally:
+        with lock:
+            original_done.append(True)
+            if timer:
+                HEDGE_TIMER.cancel(timer[0])
+
+    if not hedge:
+        if error is not None:
+            raise error
+        usage.hedged = 0
+        return response, usage
+    if error is None and winner[0] == 0:
+        usage.hedged = 1
+        return response, usage
+
+    try:
+        response, usage = hedge[0].result()
+    except Exception as e:
+        # Both copies failed: report the original request's error
+        raise error or e
+    usage.hedged = 1
+    METRICS.inc("doubao_hedge_wins_total", model=model)
+    return response, usage
+
+
+def get_hedge_stats() -> Dict[str, float]:
+    """Hedged calls so far, hedges sent, hedges that won and the extra request rate"""
+    totals = {"calls": 0, "hedges": 0, "wins": 0}
+    names = {
+        "doubao_hedge_calls_total": "calls",
+        "doubao_hedges_total": "hedges",
+        "doubao_hedge_wins_total": "wins",
+    }
+    with METRICS._lock:
+        for (name, _), value in METRICS.counters.items():
+            if name in names:
+                totals[names[name]] += int(value)
+    totals["extra_request_rate"] = (
+        totals["hedges"] / totals["calls"] if totals["calls"] else 0.0
+    )
+    return totals
+
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Data URLs made only of these characters need no escaping in JSON, so image
+# parts are spliced into the request body as raw bytes instead of being
+# re-encoded. Shorter URLs are not worth the splice.
+_DATA_URL_CHARS = (
+    b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=:;,.-_"
+)
+INLINE_URL_MIN_LENGTH = 4096
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def dumps_json(value: Any) -> bytes:
+    """Compact UTF-8 JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _is_plain_url(url: str, chunk_size: int) -> bool:
+    """True if url needs no escaping in JSON, checked chunk by chunk to avoid a full copy"""
+    if not url.isascii():
+        return False
+    for start in range(0, len(url), chunk_size):
+        if url[start : start + chunk_size].encode("ascii").translate(None, _DATA_URL_CHARS):
+            return False
+    return True
+
+
+def data_url_fingerprint(url: str, samples: int = 65536) -> str:
+    """Cheap content fingerprint of an image URL
+
+    Short URLs are returned as is. Long data URLs hash their length and an
+    evenly strided sample of at most `samples` characters, so keying a
+    multi-MB image costs about as much as keying a short prompt.
+    """
+    if len(url) < INLINE_URL_MIN_LENGTH:
+        return url
+    step = max(1, len(url) // samples)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{len(url)}|".encode())
+    digest.update(url[::step].encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _split_request_body(
+    data: Dict[str, Any], chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> List[Union[bytes, str]]:
+    """JSON pieces of a chat request body, with large data URLs kept as str pieces
+
+    The request is encoded with placeholders in place of the data URLs, so
+    they can be written out later without another escaping pass.
+    """
+    nonce = os.urandom(8).hex()
+    urls = []
+    messages = []
+    for message in data.get("messages") or []:
+        content = message.get("content")
+        if isinstance(content, list):
+            parts = []
+            for part in content:
+                image_url = part.get("image_url") if part.get("type") == "image_url" else None
+                url = image_url.get("url") if isinstance(image_url, dict) else None
+                if (
+                    isinstance(url, str)
+                    and len(url) >= INLINE_URL_MIN_LENGTH
+                    and _is_plain_url(url, chunk_size)
+                ):
+                    placeholder = f"\x00{nonce}{len(urls)}\x00"
+                    part = dict(part, image_url=dict(image_url, url=placeholder))
+                    urls.append(url)
+                parts.append(part)
+            message = dict(message, content=parts)
+        messages.append(message)
+
+    if not urls:
+        return [dumps_json(data)]
+
+    body = dumps_json(dict(data, messages=messages))
+    head, *rest = body.split(b'"\\u0000' + nonce.encode("ascii"))
+    pieces = [head]
+    for piece in rest:
+        index, _, tail = piece.partition(b'\\u0000"')
+        pieces += [b'"', urls[int(index)], b'"' + tail]
+    return pieces
+
+
+def encode_request_body(data: Dict[str, Any]) -> bytes:
+    """Serialize a chat request body, splicing in image data URLs as raw bytes"""
+    # Writing one URL at a time keeps a single encoded copy alive besides the body
+    buffer = BytesIO()
+    for piece in _split_request_body(data):
+        buffer.write(piece.encode("ascii") if isinstance(piece, str) else piece)
+    return buffer.getvalue()
+
+
+class RequestBody:
+    """Streamed chat request body with a known length
+
+    requests sends iterables with a __len__ chunk by chunk under a regular
+    Content-Length header. Image data URLs are encoded to bytes one chunk at
+    a time while the socket is written, so the extra memory per request is
+    about one chunk however large the images are. Iterating again restarts
+    the body, which lets urllib3 resend it on a connection retry.
+    """
+
+    def __init__(self, data: Dict[str, Any], chunk_size: int = UPLOAD_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._pieces = _split_request_body(data, chunk_size)
+        # str pieces are ASCII, one byte per character
+        self._length = sum(len(piece) for piece in self._pieces)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[bytes]:
+        for piece in self._pieces:
+            if isinstance(piece, bytes):
+                yield piece
+                continue
+            for start in range(0, len(piece), self.chunk_size):
+                yield piece[start : start + self.chunk_size].encode("ascii")
+
+
+class DoubaoAPI:
+    """Doubao LLM API client"""
+
+    def __init__(
+        self,
+        api_key: str = None,
+        endpoint: str = "https://ark.cn-beijing.volces.com/api/v3",
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        max_retries: int = 0,
+        response_cache: Optional[ResponseCache] = None,
+        cache_mode: str = "when_seeded",
+        rate_limiter: Optional[RateLimiter] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 60.0,
+        context_cache: Optional[ContextCache] = None,
+        dedupe_mode: str = "when_seeded",
+        hedge_policy: Optional[HedgePolicy] = None,
+    ):
+        # API key priority: parameter > environment variable
+        self.api_key = api_key or os.getenv("DOUBAO_API_KEY")
+        self.endpoint = endpoint
+        # (connect, read) timeouts in seconds
+        self.timeout = (connect_timeout, read_timeout)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        # Response cache is only consulted when a seed is fixed, unless
+        # cache_mode is "always"
+        self.response_cache = response_cache
+        self.cache_mode = cache_mode
+        self.rate_limiter = rate_limiter
+        # Server-side caching of the shared system prompt prefix
+        self.context_cache = context_cache
+        # Identical concurrent requests share one HTTP call, same modes as cache_mode
+        self.dedupe_mode = dedupe_mode
+        # Duplicate slow requests to cut tail latency, disabled when None
+        self.hedge_policy = hedge_policy
+
+        if not self.api_key:
+            raise ValueError(
+                "API key not set. Please set DOUBAO_API_KEY environment variable or provide api_key parameter during initialization"
+            )
+
+    def with_pool_size(self, pool_maxsize: int) -> "DoubaoAPI":
+        """This client, or a copy whose session keeps at least pool_maxsize connections per host"""
+        if self.pool_maxsize >= pool_maxsize:
+            return self
+        api = copy.copy(self)
+        api.pool_maxsize = pool_maxsize
+        return api
+
+    @property
+    def session(self) -> requests.Session:
+        """Pooled keep-alive session shared by all clients of this endpoint"""
+        return get_shared_session(
+            self.endpoint, self.pool_connections, self.pool_maxsize, self.max_retries
+        )
+
+    def _get_headers(self) -> Dict[str, str]:
+        """Get request headers"""
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    def _build_request_data(
+        self,
+        messages: List[DoubaoMessage],
+        config: DoubaoConfig,
+        context_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Build chat completion request body"""
+        # Validate model format: supports Endpoint ID or Model ID
+        model = config.model.strip()
+        if not model:
+            raise ValueError("Model cannot be empty")
+
+        data = {
+            "model": config.model,
+            "messages": [msg.to_payload() for msg in messages],
+            "max_tokens": config.max_tokens,
+            "temperature": config.temperature,
+            "top_p": config.top_p,
+            "stream": config.stream,
+        }
+
+        # Add seed parameter if provided (with compatibility check)
+        if config.seed is not None:
+            data["seed"] = config.seed
+
+        if context_id is not None:
+            data["context_id"] = context_id
+
+        return data
+
+    def _completions_url(self, context_id: Optional[str] = None) -> str:
+        if context_id is not None:
+            return f"{self.endpoint}/context/chat/completions"
+        return f"{self.endpoint}/chat/completions"
+
+    def _create_context(
+        self, model: str, prefix: List[DoubaoMessage], ttl_seconds: int
+    ) -> str:
+        """Create a server-side context cache for prefix, returns its id"""
+        data = {
+            "model": model,
+            "messages": [msg.to_payload() for msg in prefix],
+            "mode": "common_prefix",
+            "ttl": int(ttl_seconds),
+        }
+        try:
+            response = self.session.post(
+                f"{self.endpoint}/context/create",
+                data=encode_request_body(data),
+                headers=self._get_headers(),
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            return response.json()["id"]
+        except requests.exceptions.RequestException as e:
+            raise self.retry_policy.classify(e)
+
+    def chat_completions(
+        self,
+        messages: List[DoubaoMessage],
+        config: DoubaoConfig,
+        on_delta: Optional[Callable[[str, str], None]] = None,
+    ) -> str:
+        """Call Doubao chat completion API
+
+        When config.stream is enabled the response is consumed incrementally and
+        on_delta(delta, text_so_far) is called for every content chunk.
+        """
+        return self.chat_completions_with_usage(messages, config, on_delta)[0]
+
+    def chat_completions_with_usage(
+        self,
+        messages: List[DoubaoMessage],
+        config: DoubaoConfig,
+        on_delta: Optional[Callable[[str, str], None]] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> Tuple[str, DoubaoUsage]:
+        """Call Doubao chat completion API, also returning token usage and timings
+
+        Setting cancel stops the request early with RequestCancelled. Such
+        calls neither share nor lead a coalesced request, so cancelling one
+        never affects another caller.
+        """
+        usage = DoubaoUsage(model=config.model, requests=1)
+        start_time = time.perf_counter()
+        status = "error"
+        try:
+            cache_key = None
+            if self._cache_enabled(config):
+                cache_key = ResponseCache.make_key(
+                    self._build_request_data(messages, config)
+                )
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    usage.cache_hits = 1
+                    if on_delta is not None:
+                        on_delta(cached, cached)
+                    status = "ok"
+                    return cached, usage
+
+            if cancel is None and self._dedupe_enabled(config):
+                flight_key = "|".join(
+                    [
+                        self.endpoint.rstrip("/"),
+                        hashlib.sha256(self.api_key.encode("utf-8")).hexdigest(),
+                        cache_key or self._flight_key(messages, config),
+                    ]
+                )
+                response, shared = SINGLE_FLIGHT.do(
+                    flight_key,
+                    lambda: self._send(messages, config, on_delta, usage),
+                )
+                if shared:
+                    usage.coalesced = 1
+                    if on_delta is not None:
+                        on_delta(response, response)
+            else:
+                response = self._send(messages, config, on_delta, usage, cancel)
+
+            if cache_key is not None:
+                self.response_cache.put(cache_key, response)
+            status = "ok"
+            return response, usage
+        except RequestCancelled:
+            status = "cancelled"
+            raise
+        finally:
+            usage.total_seconds = time.perf_counter() - start_time
+            METRICS.record_call(usage, self.endpoint, status)
+
+    def _cache_enabled(self, config: DoubaoConfig) -> bool:
+        if self.response_cache is None or self.cache_mode == "disabled":
+            return False
+        return self.cache_mode == "always" or config.seed is not None
+
+    @staticmethod
+    def _flight_key(messages: List[DoubaoMessage], config: DoubaoConfig) -> str:
+        """Key of identical in-flight requests, with images keyed by fingerprint"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(
+            dumps_json(
+                [
+                    config.model.strip(),
+                    config.max_tokens,
+                    config.temperature,
+                    config.top_p,
+                    config.seed,
+                ]
+            )
+        )
+        for message in messages:
+            parts = [
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        **part["image_url"],
+                        "url": data_url_fingerprint(part["image_url"]["url"]),
+                    },
+                }
+                if part.get("type") == "image_url"
+                else part
+                for part in message.content
+            ]
+            digest.update(dumps_json([message.role.value, parts]))
+        return digest.hexdigest()
+
+    def _dedupe_enabled(self, config: DoubaoConfig) -> bool:
+        if self.dedupe_mode == "disabled":
+            return False
+        return self.dedupe_mode == "always" or config.seed is not None
+
+    def _send(
+        self,
+        messages: List[DoubaoMessage],
+        config: DoubaoConfig,
+        on_delta: Optional[Callable[[str, str], None]],
+        usage: DoubaoUsage,
+        cancel: Optional[threading.Event] = None,
+    ) -> str:
+        """_chat_completions, raced against a hedge request when a hedge policy is set"""
+        # A caller passing cancel (e.g. a hedging pool) already races this request
+        if self.hedge_policy is None or cancel is not None:
+            return self._chat_completions(messages, config, on_delta, usage, cancel)
+
+        def call(attempt_cancel, forward):
+            attempt_usage = DoubaoUsage(model=config.model)
+            response = self._chat_completions(
+                messages, config, forward, attempt_usage, attempt_cancel
+            )
+            return response, attempt_usage
+
+        response, winner_usage = run_hedged(
+            call,
+            self.hedge_policy,
+            get_latency_tracker(self.endpoint.rstrip("/"), config.model, config.stream),
+            config.model,
+            config.stream,
+            on_delta,
+        )
+        for name, value in winner_usage.dict().items():
+            if name not in ("model", "requests"):
+                setattr(usage, name, value)
+        return response
+
+    def _chat_completions(
+        self,
+        messages: List[DoubaoMessage],
+        config: DoubaoConfig,
+        on_delta: Optional[Callable[[str, str], None]] = None,
+        usage: Optional[DoubaoUsage] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> str:
+        """Send the request, retrying retryable failures per self.retry_policy"""
+        if usage is None:
+            usage = DoubaoUsage(model=config.model)
+        policy = self.retry_policy
+
+        # Send the leading system messages as a cached context when possible
+        prefix_length = 0
+        if self.context_cache is not None:
+            prefix_length = ContextCache.split_prefix(messages)
+        use_context = prefix_length > 0
+        cancels = _cancel_events(cancel)
+
+        attempt = 1
+        while True:
+            if _is_cancelled(cancels):
+                raise RequestCancelled()
+            context_id = None
+            if use_context:
+                context_id = self.context_cache.lookup(
+                    config.model,
+                    messages[:prefix_length],
+                    functools.partial(self._create_context, config.model),
+                )
+            request_messages = messages[prefix_length:] if context_id else messages
+
+            estimated_tokens = 0
+            if self.rate_limiter is not None:
+                estimated_tokens = estimate_prompt_tokens(messages) + config.max_tokens
+                waited = self.rate_limiter.acquire(estimated_tokens)
+                METRICS.observe("doubao_rate_limit_wait_seconds", waited)
+                if waited > 1.0:
+                    print(f"Doubao rate limiter: request queued for {waited:.1f}s")
+                if _is_cancelled(cancels):
+                    # Cancelled while queued: nothing was sent
+                    self.rate_limiter.refund(1, estimated_tokens)
+                    raise RequestCancelled()
+            if isinstance(cancel, CancelEvent):
+                cancel.mark_sent()
+
+            usage.attempts = attempt
+            chunks = []
+            try:
+                if not config.stream:
+                    return self._request_completion(
+                        request_messages, config, usage, context_id, cancel
+                    )
+
+                for delta in self.chat_completions_stream(
+                    request_messages, config, usage, context_id, cancel
+                ):
+                    chunks.append(delta)
+                    if on_delta is not None:
+                        on_delta(delta, "".join(chunks))
+                return "".join(chunks)
+
+            except DoubaoAPIError as e:
+                if _is_cancelled(cancels):
+                    # The server already counted the prompt, so only the
+                    # completion it will not generate goes back to the TPM budget
+                    if self.rate_limiter is not None:
+                        generated = usage.completion_tokens or (
+                            len("".join(chunks).encode("utf-8")) // 3
+                        )
+                        self.rate_limiter.refund(
+                            tokens=max(0, config.max_tokens - generated)
+                        )
+                    if isinstance(e, RequestCancelled):
+                        raise
+                    raise RequestCancelled() from e
+                if (
+                    context_id is not None
+                    and not chunks
+                    and e.status_code in CONTEXT_UNSUPPORTED_STATUSES
+                ):
+                    # Context expired or unknown to the server: forget it and
+                    # resend with the full prefix, without counting an attempt
+                    print(f"Doubao context cache rejected, sending full prompt: {str(e)}")
+                    self.context_cache.invalidate(config.model, messages[:prefix_length])
+                    use_context = False
+                    continue
+
+                # Partial streamed output cannot be taken back, so no retry then
+                if chunks or not e.retryable or attempt >= policy.max_attempts:
+                    raise
+                delay = policy.get_delay(attempt, e.retry_after)
+                record_retry(e.reason)
+                print(
+                    f"Doubao API retry {attempt}/{policy.max_attempts - 1} in {delay:.1f}s: {str(e)}"
+                )
+                if cancels:
+                    cancels[0].wait(delay)
+                else:
+                    time.sleep(delay)
+                attempt += 1
+
+    def _request_completion(
+        self,
+        messages: List[DoubaoMessage],
+        config: DoubaoConfig,
+        usage: Optional[DoubaoUsage] = None,
+        context_id: Optional[str] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> str:
+        """Single non-streaming request
+
+        Setting a CancelEvent passed as cancel aborts the request while it
+        waits for the response.
+        """
+        url = self._completions_url(context_id)
+        data = self._build_request_data(messages, config, context_id)
+
+        reset_connection_timings()
+        start_time = time.perf_counter()
+        try:
+            _request_cancel.events = _cancel_events(cancel)
+            try:
+                response = self.session.post(
+                    url,
+                    data=RequestBody(data),
+                    headers=self._get_headers(),
+                    timeout=self.timeout,
+                )
+            finally:
+                _request_cancel.events = ()
+            if usage is not None:
+                self._record_transfer(usage, response, start_time)
+                usage.response_bytes = len(response.content)
+                usage.first_token_seconds = time.perf_counter() - start_time
+            response.raise_for_status()
+
+            result = response.json()
+
+            if "error" in result:
+                raise Exception(f"API Error: {result['error']['message']}")
+
+            if "choices" not in result or len(result["choices"]) == 0:
+                raise Exception("No response generated")
+
+            if usage is not None:
+                usage.add_server_usage(result.get("usage"))
+            return result["choices"][0]["message"]["content"]
+
+        except requests.exceptions.RequestException as e:
+            raise self.retry_policy.classify(e)
+        except json.JSONDecodeError as e:
+            raise DoubaoAPIError(f"Failed to parse response: {str(e)}")
+        except Exception as e:
+            raise DoubaoAPIError(f"API call failed: {str(e)}")
+
+    @staticmethod
+    def _record_transfer(
+        usage: DoubaoUsage, response: requests.Response, start_time: float
+    ):
+        """Fill connection timings, time to headers and request size"""
+        usage.connect_seconds, usage.tls_seconds = get_connection_timings()
+        elapsed = getattr(response, "elapsed", None)
+        usage.ttfb_seconds = (
+            elapsed.total_seconds()
+            if elapsed is not None
+            else time.perf_counter() - start_time
+        )
+        body = getattr(getattr(response, "request", None), "body", None)
+        usage.request_bytes = (
+            len(body) if isinstance(body, (bytes, str, RequestBody)) else 0
+        )
+
+    def chat_completions_stream(
+        self,
+        messages: List[DoubaoMessage],
+        config: DoubaoConfig,
+        usage: Optional[DoubaoUsage] = None,
+        context_id: Optional[str] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> Iterator[str]:
+        """Call Doubao chat completion API in streaming mode, yielding content deltas
+
+        If a DoubaoUsage is passed it is filled with timings and, once the stream
+        ends, the token usage reported in the final chunk. With a context_id the
+        messages are appended to that server-side context cache. Setting cancel
+        closes the stream at the next line with RequestCancelled; a CancelEvent
+        also aborts the wait for the response headers.
+        """
+        url = self._completions_url(context_id)
+        data = self._build_request_data(messages, config, context_id)
+        data["stream"] = True
+        data["stream_options"] = {"include_usage": True}
+
+        reset_connection_timings()
+        start_time = time.perf_counter()
+        first_token_time = None
+        cancels = _cancel_events(cancel)
+        try:
+            _request_cancel.events = cancels
+            try:
+                response = self.session.post(
+                    url,
+                    data=RequestBody(data),
+                    headers=self._get_headers(),
+                    timeout=self.timeout,
+                    stream=True,
+                )
+            finally:
+                _request_cancel.events = ()
+            with response:
+                if usage is not None:
+                    self._record_transfer(usage, response, start_time)
+                response.raise_for_status()
+
+                def counted_lines():
+                    for line in response.iter_lines():
+                        if _is_cancelled(cancels):
+                            raise RequestCancelled()
+                        if usage is not None:
+                            usage.response_bytes += len(line) + 1
+                        yield line
+
+                for event in parse_sse_events(counted_lines()):
+                    if "error" in event:
+                        raise Exception(f"API Error: {event['error']['message']}")
+
+                    if usage is not None and event.get("usage"):
+                        usage.add_server_usage(event["usage"])
+
+                    for choice in event.get("choices") or []:
+                        delta = (choice.get("delta") or {}).get("content")
+                        if not delta:
+                            continue
+                        if first_token_time is None:
+                            first_token_time = time.perf_counter()
+                            if usage is not None:
+                                usage.first_token_seconds = first_token_time - start_time
+                            print(
+                                f"Doubao stream time to first token: {first_token_time - start_time:.3f}s"
+                            )
+                        yield delta
+
+        except requests.exceptions.RequestException as e:
+            raise self.retry_policy.classify(e)
+        except json.JSONDecodeError as e:
+            raise DoubaoAPIError(f"Failed to parse response: {str(e)}")
+        except DoubaoAPIError:
+            raise
+        except Exception as e:
+            raise DoubaoAPIError(f"API call failed: {str(e)}")
+
+
+# Errors that are specific to one backend (its key, quota or Endpoint ID)
+# and worth retrying on another one. Other 4xx would fail everywhere.
+POOL_FAILOVER_STATUSES = (401, 403, 404)
+
+
+class BackendHealth:
+    """Rolling health of one pool backend (api key + endpoint + model)
+
+    Tracks requests in flight, an exponentially weighted latency of successful
+    calls and the outcome of the last window calls. Once at least min_requests
+    outcomes are known and the error rate reaches error_threshold, the backend
+    is ejected for eject_seconds and then gets traffic again with a clean window.
+    """
+
+    def __init__(
+        self,
+        window: int = 20,
+        min_requests: int = 5,
+        error_threshold: float = 0.5,
+        eject_seconds: float = 30.0,
+        latency_alpha: float = 0.2,
+    ):
+        self.min_requests = min_requests
+        self.error_threshold = error_threshold
+        self.eject_seconds = eject_seconds
+        self.latency_alpha = latency_alpha
+        self.in_flight = 0
+        self.latency = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self._outcomes = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def configure(self, error_threshold: float, eject_seconds: float):
+        with self._lock:
+            self.error_threshold = error_threshold
+            self.eject_seconds = eject_seconds
+
+    def healthy(self, now: Optional[float] = None) -> bool:
+        return (time.monotonic() if now is None else now) >= self.ejected_until
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return self._outcomes.count(False) / len(self._outcomes)
+
+    def start(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def cancel(self):
+        """A request that was cancelled tells nothing about the backend"""
+        with self._lock:
+            self.in_flight -= 1
+
+    def finish(self, seconds: float, ok: bool) -> bool:
+        """Record a finished call, returns True if it got the backend ejected"""
+        with self._lock:
+            self.in_flight -= 1
+            self.requests += 1
+            self._outcomes.append(ok)
+            if ok:
+                if self.latency:
+                    self.latency += self.latency_alpha * (seconds - self.latency)
+                else:
+                    self.latency = seconds
+                return False
+
+            self.errors += 1
+            failures = self._outcomes.count(False)
+            if (
+                len(self._outcomes) >= self.min_requests
+                and failures / len(self._outcomes) >= self.error_threshold
+                and time.monotonic() >= self.ejected_until
+            ):
+                self.ejected_until = time.monotonic() + self.eject_seconds
+                self.ejections += 1
+                self._outcomes.clear()
+                return True
+            return False
+
+
+# Health outlives the pool objects, which ComfyUI recreates on every run
+_backend_health: Dict[tuple, BackendHealth] = {}
+_backend_health_lock = threading.Lock()
+
+
+def get_backend_health(api_key: str, endpoint: str, model: str = "") -> BackendHealth:
+    """Get the health record shared by every pool using this key, endpoint and model"""
+    key = (
+        hashlib.sha256(api_key.encode("utf-8")).hexdigest(),
+        endpoint.rstrip("/"),
+        model.strip(),
+    )
+    with _backend_health_lock:
+        health = _backend_health.get(key)
+        if health is None:
+            health = BackendHealth()
+            _backend_health[key] = health
+        return health
+
+
+class PoolBackend:
+    """One DoubaoAPI in a DoubaoAPIPool
+
+    model overrides DoubaoConfig.model for requests sent here, since Endpoint
+    IDs belong to one account. weight is the relative share of traffic.
+    """
+
+    def __init__(self, api: DoubaoAPI, model: str = "", weight: float = 1.0, name: str = ""):
+        if weight <= 0:
+            raise ValueError(f"Backend weight must be positive, got {weight}")
+        if isinstance(api, DoubaoAPIPool):
+            raise ValueError("A DoubaoAPIPool cannot be a backend, add its backends instead")
+        self.api = api
+        self.model = model.strip()
+        self.weight = weight
+        self.name = name or api.endpoint.rstrip("/") + (f"#{self.model}" if self.model else "")
+        self.health = get_backend_health(api.api_key, api.endpoint, self.model)
+        self.current_weight = 0.0  # Smooth weighted round-robin state
+
+    def load(self) -> Tuple[float, float]:
+        return self.health.in_flight / self.weight, self.health.latency
+
+
+class DoubaoAPIPool:
+    """Spreads chat requests over several Doubao backends
+
+    Has the chat_completions / chat_completions_with_usage interface of
+    DoubaoAPI, so it can be passed to every chat node. Each request goes to
+    a healthy backend picked by strategy: "least_in_flight" (fewest requests
+    in flight per unit of weight, then lowest latency) or
+    "weighted_round_robin". Retryable, auth and not-found errors fail over to
+    the next healthy backend, unless part of a streamed response was already
+    delivered. If every backend is ejected, the one due back first is used.
+    With a hedge_policy a slow request is duplicated on another backend.
+    """
+
+    def __init__(
+        self,
+        backends: List[PoolBackend],
+        strategy: str = "least_in_flight",
+        hedge_policy: Optional[HedgePolicy] = None,
+    ):
+        if not backends:
+            raise ValueError("DoubaoAPIPool needs at least one backend")
+        if strategy not in POOL_STRATEGIES:
+            raise ValueError(
+                f"Unsupported pool strategy: {strategy}. Supported: {', '.join(POOL_STRATEGIES)}"
+            )
+        self.backends = backends
+        self.strategy = strategy
+        self.hedge_policy = hedge_policy
+        self._lock = threading.Lock()
+
+    def _acquire(
+        self, tried: List[PoolBackend], avoid: List[PoolBackend] = ()
+    ) -> Optional[PoolBackend]:
+        """Pick the next backend and mark a request in flight on it
+
+        Backends in avoid (those serving the request a hedge duplicates) are
+        only used when no other healthy backend is left.
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                b for b in self.backends if b not in tried and b.health.healthy(now)
+            ]
+            candidates = [b for b in candidates if b not in avoid] or candidates
+            if not candidates:
+                if tried:
+                    return None
+                candidates = [min(self.backends, key=lambda b: b.health.ejected_until)]
+
+            if self.strategy == "weighted_round_robin" and len(candidates) > 1:
+                total = sum(b.weight for b in candidates)
+                for b in candidates:
+                    b.current_weight += b.weight
+                backend = max(candidates, key=lambda b: b.current_weight)
+                backend.current_weight -= total
+            else:
+                backend = min(candidates, key=PoolBackend.load)
+            backend.health.start()
+            return backend
+
+    def with_pool_size(self, pool_maxsize: int) -> "DoubaoAPIPool":
+        """This pool, or a copy whose backends each keep at least pool_maxsize connections"""
+        if all(b.api.pool_maxsize >= pool_maxsize for b in self.backends):
+            return self
+        backends = []
+        for backend in self.backends:
+            backend = copy.copy(backend)
+            backend.api = backend.api.with_pool_size(pool_maxsize)
+            backends.append(backend)
+        return DoubaoAPIPool(backends, self.strategy, self.hedge_policy)
+
+    def _release(self, backend: PoolBackend, seconds: float, ok: bool):
+        if backend.health.finish(seconds, ok):
+            METRICS.inc("doubao_pool_ejections_total", backend=backend.name)
+            print(
+                f"Doubao pool: ejecting {backend.name} for {backend.health.eject_seconds:.0f}s after repeated errors"
+            )
+
+    def chat_completions(
+        self,
+        messages: List[DoubaoMessage],
+        config: DoubaoConfig,
+        on_delta: Optional[Callable[[str, str], None]] = None,
+    ) -> str:
+        """Call Doubao chat completion API on one of the backends"""
+        return self.chat_completions_with_usage(messages, config, on_delta)[0]
+
+    def chat_completions_with_usage(
+        self,
+        messages: List[DoubaoMessage],
+        config: DoubaoConfig,
+        on_delta: Optional[Callable[[str, str], None]] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> Tuple[str, DoubaoUsage]:
+        """Same as DoubaoAPI.chat_completions_with_usage, with failover between backends"""
+        if self.hedge_policy is None or cancel is not None:
+            return self._call(messages, config, on_delta, cancel, [])
+
+        tried_by_copy = []
+
+        def call(attempt_cancel, forward):
+            # The hedge avoids the backends the original request is using
+            tried = []
+            avoid = tried_by_copy[0] if tried_by_copy else []
+            tried_by_copy.append(tried)
+            return self._call(messages, config, forward, attempt_cancel, tried, avoid)
+
+        return run_hedged(
+            call,
+            self.hedge_policy,
+            get_latency_tracker(
+                *(b.name for b in self.backends), config.model, config.stream
+            ),
+            config.model,
+            config.stream,
+            on_delta,
+        )
+
+    def _call(
+        self,
+        messages: List[DoubaoMessage],
+        config: DoubaoConfig,
+        on_delta: Optional[Callable[[str, str], None]],
+        cancel: Optional[threading.Event],
+        tried: List[PoolBackend],
+        avoid: List[PoolBackend] = (),
+    ) -> Tuple[str, DoubaoUsage]:
+        last_error = None
+        while True:
+            backend = self._acquire(tried, avoid)
+            if backend is None:
+                raise last_error
+            tried.append(backend)
+
+            streamed = []
+            forward = None
+            if on_delta is not None:
+
+                def forward(delta, text):
+                    streamed.append(True)
+                    on_delta(delta, text)
+
+            request_config = config
+            if backend.model:
+                request_config = config.copy(update={"model": backend.model})
+
+            start_time = time.perf_counter()
+            backend_failed = cancelled = False
+            try:
+                return backend.api.chat_completions_with_usage(
+                    messages, request_config, forward, cancel
+                )
+            except RequestCancelled:
+                cancelled = True
+                raise
+            except DoubaoAPIError as e:
+                backend_failed = e.retryable or e.status_code in POOL_FAILOVER_STATUSES
+                if not backend_failed or streamed:
+                    raise
+                last_error = e
+            finally:
+                if cancelled:
+                    backend.health.cancel()
+                else:
+                    self._release(
+                        backend, time.perf_counter() - start_time, not backend_failed
+                    )
+
+            METRICS.inc("doubao_pool_failovers_total", backend=backend.name)
+            print(f"Doubao pool: {backend.name} failed, trying another backend: {str(last_error)}")
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [
+            {
+                "name": b.name,
+                "weight": b.weight,
+                "healthy": b.health.healthy(now),
+                "in_flight": b.health.in_flight,
+                "latency_ms": b.health.latency * 1000,
+                "error_rate": b.health.error_rate,
+                "requests": b.health.requests,
+                "errors": b.health.errors,
+                "ejections": b.health.ejections,
+            }
+            for b in self.backends
+        ]
+
+
+def ensure_pool_size(api: Any, pool_maxsize: int) -> Any:
+    """api sized for pool_maxsize concurrent requests, so threads do not churn connections
+
+    urllib3 discards connections returned to a full pool, so running more
+    requests at once than the session keeps alive reconnects every time.
+    Clients without a session (e.g. test doubles) are returned unchanged.
+    """
+    resize = getattr(api, "with_pool_size", None)
+    return resize(pool_maxsize) if resize is not None else api
+
+
+class AsyncDoubaoAPI:
+    """Asyncio Doubao LLM API client
+
+    Wraps a DoubaoAPI and runs its blocking calls on a dedicated worker pool,
+    so it shares the same pooled keep-alive session as the sync client. At
+    most max_concurrency requests are in flight per event loop; extra callers
+    wait on a semaphore instead of piling up in the worker queue. A wrapped
+    client keeping fewer connections than that is replaced by a larger copy.
+    """
+
+    def __init__(
+        self,
+        api: Optional[DoubaoAPI] = None,
+        max_concurrency: int = 16,
+        **api_kwargs,
+    ):
+        if api is None:
+            # Keep enough keep-alive connections for every in-flight request
+            api_kwargs.setdefault("pool_maxsize", max_concurrency)
+            api = DoubaoAPI(**api_kwargs)
+        self.api = ensure_pool_size(api, max_concurrency)
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="doubao-async"
+        )
+        # asyncio.Semaphore is bound to the loop it is first used on
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._semaphores_lock = threading.Lock()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._semaphores_lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._semaphores[loop] = semaphore
+            return semaphore
+
+    async def chat_completions(
+        self,
+        messages: List[DoubaoMessage],
+        config: DoubaoConfig,
+        on_delta: Optional[Callable[[str, str], None]] = None,
+    ) -> str:
+        """Call Doubao chat completion API (same semantics as DoubaoAPI.chat_completions)"""
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor,
+                with_call_context(
+                    functools.partial(
+                        self.api.chat_completions, messages, config, on_delta=on_delta
+                    )
+                ),
+            )
+
+    async def chat_completions_with_usage(
+        self,
+        messages: List[DoubaoMessage],
+        config: DoubaoConfig,
+        on_delta: Optional[Callable[[str, str], None]] = None,
+    ) -> Tuple[str, DoubaoUsage]:
+        """Async DoubaoAPI.chat_completions_with_usage"""
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor,
+                with_call_context(
+                    functools.partial(
+                        self.api.chat_completions_with_usage,
+                        messages,
+                        config,
+                        on_delta=on_delta,
+                    )
+                ),
+            )
+
+    async def chat_completions_many(
+        self,
+        batch: Iterable[Tuple[List[DoubaoMessage], DoubaoConfig]],
+        return_exceptions: bool = False,
+        with_usage: bool = False,
+    ) -> List[Any]:
+        """Run many (messages, config) requests concurrently, results in input order
+
+        With with_usage each result is a (text, DoubaoUsage) tuple.
+        """
+        call = self.chat_completions_with_usage if with_usage else self.chat_completions
+        return await asyncio.gather(
+            *(call(messages, config) for messages, config in batch),
+            return_exceptions=return_exceptions,
+        )
+
+    def run_many(
+        self,
+        batch: Iterable[Tuple[List[DoubaoMessage], DoubaoConfig]],
+        return_exceptions: bool = False,
+        with_usage: bool = False,
+    ) -> List[Any]:
+        """Blocking fan-out entry point for sync nodes"""
+        coro = self.chat_completions_many(list(batch), return_exceptions, with_usage)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+
+        # Already inside an event loop: run on a helper thread with its own loop
+        with ThreadPoolExecutor(max_workers=1) as helper:
+            return helper.submit(asyncio.run, coro).result()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def parse_sse_events(lines: Iterable[Any]) -> Iterator[Dict[str, Any]]:
+    """Incrementally parse server-sent events into JSON payloads
+
+    Accepts an iterable of raw lines (bytes or str, without line terminators)
+    and yields one decoded object per event until the [DONE] sentinel.
+    """
+    data_lines = []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.rstrip("\r")
+
+        # A blank line terminates the current event
+        if not line:
+            if data_lines:
+                payload = "\n".join(data_lines)
+                data_lines = []
+                if payload.strip() == "[DONE]":
+                    return
+                yield json.loads(payload)
+            continue
+
+        # Comment / keep-alive line
+        if line.startswith(":"):
+            continue
+
+        field, _, value = line.partition(":")
+        if field == "data":
+            data_lines.append(value[1:] if value.startswith(" ") else value)
+
+    # Flush the last event if the stream ended without a blank line
+    if data_lines:
+        payload = "\n".join(data_lines)
+        if payload.strip() != "[DONE]":
+            yield json.loads(payload)
+
+
+def tensor_to_uint8(tensor: torch.Tensor) -> np.ndarray:
+    """Convert a single ComfyUI image [height, width, channels] to a uint8 RGB array
+
+    Float images follow the ComfyUI [0, 1] convention. Scale, rounding, clamp and
+    cast are done with in-place ops on the source device, so only one float
+    temporary is allocated and just the uint8 result is copied to the CPU.
+    """
+    if hasattr(tensor, "cpu"):
+        if tensor.dtype != torch.uint8:
+            tensor = tensor.mul(255.0).add_(0.5).clamp_(0, 255).to(torch.uint8)
+        array = tensor.cpu().numpy()
+    else:
+        array = np.asarray(tensor)
+        if array.dtype != np.uint8:
+            scaled = np.multiply(array, 255.0, dtype=np.float32)
+            np.add(scaled, 0.5, out=scaled)
+            np.clip(scaled, 0, 255, out=scaled)
+            array = scaled.astype(np.uint8)
+
+    # Drop alpha / expand grayscale, PIL needs a C-contiguous RGB buffer
+    if array.ndim == 2:
+        array = np.stack([array] * 3, axis=-1)
+    elif array.shape[-1] == 1:
+        array = np.repeat(array, 3, axis=-1)
+    elif array.shape[-1] > 3:
+        array = array[..., :3]
+    return np.ascontiguousarray(array)
+
+
+def _encode_jpeg_turbo(array: np.ndarray, quality: int) -> Optional[bytes]:
+    """Encode with libjpeg-turbo if an optional binding is installed"""
+    try:
+        import simplejpeg
+
+        return simplejpeg.encode_jpeg(array, quality=quality, colorspace="RGB")
+    except ImportError:
+        pass
+
+    try:
+        from turbojpeg import TurboJPEG, TJPF_RGB
+
+        global _turbojpeg
+        if _turbojpeg is None:
+            _turbojpeg = TurboJPEG()
+        return _turbojpeg.encode(array, quality=quality, pixel_format=TJPF_RGB)
+    except (ImportError, RuntimeError, OSError):
+        return None
+
+
+_turbojpeg = None
+
+
+def resolve_max_pixels(model: str, max_megapixels: float = -1) -> int:
+    """Resolve the upload pixel budget: -1 uses the model default, 0 disables resizing"""
+    if max_megapixels is None or max_megapixels < 0:
+        return doubao_vision_max_pixels.get(model.strip(), DEFAULT_VISION_MAX_PIXELS)
+    return int(max_megapixels * 1_000_000)
+
+
+def fit_image_size(
+    width: int, height: int, max_pixels: int = 0, max_side: int = 0
+) -> tuple:
+    """Largest size with the same aspect ratio within max_pixels and max_side (0 = no limit)"""
+    scale = 1.0
+    if max_pixels and width * height > max_pixels:
+        scale = min(scale, (max_pixels / (width * height)) ** 0.5)
+    if max_side and max(width, height) > max_side:
+        scale = min(scale, max_side / max(width, height))
+    if scale >= 1.0:
+        return width, height
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def encode_image(
+    tensor: torch.Tensor,
+    image_format: str = "JPEG",
+    quality: int = 95,
+    backend: str = "auto",
+    max_pixels: int = 0,
+    max_side: int = 0,
+    stats: Optional[Dict[str, Any]] = None,
+) -> bytes:
+    """Encode a single ComfyUI image to JPEG / WebP / PNG bytes
+
+    backend: "auto" uses a libjpeg-turbo binding (simplejpeg or PyTurboJPEG)
+    for JPEG when installed and falls back to PIL; "pil" always uses PIL.
+    Images larger than max_pixels / max_side are downscaled before encoding.
+    If a stats dict is passed it is filled with pixel counts and payload bytes.
+    """
+    image_format = image_format.upper()
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported image format: {image_format}")
+
+    array = tensor_to_uint8(tensor)
+    height, width = array.shape[:2]
+    pil_image = None
+
+    new_width, new_height = fit_image_size(width, height, max_pixels, max_side)
+    if (new_width, new_height) != (width, height):
+        # reducing_gap does a fast integer box reduction before the bilinear pass
+        pil_image = Image.fromarray(array, mode="RGB").resize(
+            (new_width, new_height), Image.BILINEAR, reducing_gap=2.0
+        )
+        array = np.asarray(pil_image)
+
+    encoded = None
+    if image_format == "JPEG" and backend == "auto":
+        encoded = _encode_jpeg_turbo(array, quality)
+
+    if encoded is None:
+        encoded = _encode_pil(
+            pil_image or Image.fromarray(array, mode="RGB"), image_format, quality
+        )
+
+    if stats is not None:
+        original_pixels = width * height
+        encoded_pixels = new_width * new_height
+        stats.update(
+            {
+                "original_size": (width, height),
+                "encoded_size": (new_width, new_height),
+                "original_pixels": original_pixels,
+                "encoded_pixels": encoded_pixels,
+                "payload_bytes": len(encoded),
+                # Encoded size scales roughly with pixel count
+                "estimated_original_payload_bytes": int(
+                    len(encoded) * original_pixels / encoded_pixels
+                ),
+            }
+        )
+    return encoded
+
+
+def _encode_pil(pil_image: Image.Image, image_format: str, quality: int) -> bytes:
+    buffer = BytesIO()
+    if image_format == "PNG":
+        # PNG is lossless, favour speed over size
+        pil_image.save(buffer, format="PNG", compress_level=1)
+    elif image_format == "WEBP":
+        # method=0 is the fastest WebP encoder setting
+        pil_image.save(buffer, format="WEBP", quality=quality, method=0)
+    else:
+        pil_image.save(buffer, format=image_format, quality=quality)
+    return buffer.getvalue()
+
+
+def image_fingerprint(tensor: torch.Tensor, samples: int = 65536) -> str:
+    """Cheap content fingerprint of an image tensor or array
+
+    Hashes the shape, dtype, an evenly strided sample of at most `samples`
+    elements and the sum of all elements. Much cheaper than encoding, and the
+    full sum catches local edits that the sample misses.
+    """
+    if hasattr(tensor, "cpu"):
+        flat = tensor.reshape(-1)
+        step = max(1, flat.numel() // samples)
+        sample = flat[::step].cpu().numpy()
+        total = float(tensor.sum(dtype=torch.float64))
+    else:
+        array = np.asarray(tensor)
+        flat = array.reshape(-1)
+        step = max(1, flat.size // samples)
+        sample = np.ascontiguousarray(flat[::step])
+        total = float(array.sum(dtype=np.float64))
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{tuple(tensor.shape)}|{tensor.dtype}|{total!r}|".encode())
+    digest.update(sample.tobytes())
+    return digest.hexdigest()
+
+
+class ImagePayloadCache:
+    """In-memory LRU cache of base64 image payloads
+
+    Keyed on image_fingerprint() plus the encoding parameters, so the same
+    IMAGE fed to several vision nodes is only resized and encoded once.
+    Total payload size is capped at max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "collections.OrderedDict[str, Tuple[str, Dict[str, Any]]]" = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(fingerprint: str, *encode_params: Any) -> str:
+        return fingerprint + "|" + "|".join(str(p) for p in encode_params)
+
+    def get(self, key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+        METRICS.inc("doubao_image_cache_total", result="hit" if entry else "miss")
+        return entry
+
+    def put(self, key: str, payload: str, stats: Optional[Dict[str, Any]] = None):
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old[0])
+            self._entries[key] = (payload, dict(stats or {}))
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Shared by all vision nodes, size set with DOUBAO_IMAGE_CACHE_MB (0 disables)
+IMAGE_PAYLOAD_CACHE = ImagePayloadCache(
+    int(os.getenv("DOUBAO_IMAGE_CACHE_MB", "256")) * 1024 * 1024
+)
+
+
+def tensor_to_base64(
+    tensor: torch.Tensor,
+    image_format: str = "JPEG",
+    quality: int = 95,
+    backend: str = "auto",
+    max_pixels: int = 0,
+    max_side: int = 0,
+    stats: Optional[Dict[str, Any]] = None,
+    cache: Optional[ImagePayloadCache] = IMAGE_PAYLOAD_CACHE,
+) -> str:
+    """Convert ComfyUI image tensor to base64 encoding
+
+    Payloads are looked up in / stored to cache (pass None to always encode).
+    On a cache hit stats is filled from the original encode, with "cache_hit" set.
+    """
+    # ComfyUI tensor format: [batch, height, width, channels]
+    # Take the first image
+    if len(tensor.shape) == 4:
+        tensor = tensor[0]
+
+    key = None
+    if cache is not None and cache.max_bytes > 0:
+        key = cache.make_key(
+            image_fingerprint(tensor),
+            image_format.upper(),
+            quality,
+            backend,
+            max_pixels,
+            max_side,
+        )
+        entry = cache.get(key)
+        if entry is not None:
+            payload, cached_stats = entry
+            if stats is not None:
+                stats.update(cached_stats, cache_hit=True)
+            return payload
+
+    encode_stats = {} if stats is None else stats
+    img_bytes = encode_image(
+        tensor, image_format, quality, backend, max_pixels, max_side, encode_stats
+    )
+    payload = base64.b64encode(img_bytes).decode("ascii")
+    if key is not None:
+        cache.put(key, payload, encode_stats)
+    return payload
+
+
+def make_progress_callback(
+    node_id: Optional[str], min_interval: float = 0.1
+) -> Optional[Callable[[str, str], None]]:
+    """Build an on_delta callback that pushes partial text to the ComfyUI UI"""
+    if node_id is None:
+        return None
+
+    try:
+        from server import PromptServer
+    except ImportError:
+        # Not running inside ComfyUI
+        return None
+
+    last_sent = [0.0]
+
+    def on_delta(delta: str, text: str):
+        # Throttle websocket messages, long outputs produce many small chunks
+        now = time.monotonic()
+        if now - last_sent[0] < min_interval:
+            return
+        last_sent[0] = now
+        try:
+            PromptServer.instance.send_progress_text(text, node_id)
+        except Exception:
+            pass
+
+    return on_delta
+
+
+def split_image_batch(tensor: torch.Tensor) -> List[torch.Tensor]:
+    """Split a ComfyUI image batch [batch, height, width, channels] into single images"""
+    if len(tensor.shape) == 4:
+        return [tensor[i] for i in range(tensor.shape[0])]
+    return [tensor]
+
+
+def encode_images(
+    images: List[torch.Tensor],
+    image_format: str = "JPEG",
+    quality: int = 95,
+    max_pixels: int = 0,
+    max_side: int = 0,
+    max_total_bytes: int = 0,
+    max_workers: int = 4,
+) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Encode several images to base64 in parallel, returns payloads and stats
+
+    If the payloads add up to more than max_total_bytes (0 = no limit), every
+    image is encoded again with its pixel budget scaled down by the overshoot
+    (encoded size is roughly proportional to the pixel count), up to 3 times.
+    """
+
+    def encode(image, pixels):
+        stats = {}
+        payload = tensor_to_base64(
+            image,
+            image_format=image_format,
+            quality=quality,
+            max_pixels=pixels,
+            max_side=max_side,
+            stats=stats,
+        )
+        return payload, stats
+
+    budgets = [max_pixels] * len(images)
+    workers = max(1, min(max_workers, len(images)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in range(4):
+            results = list(executor.map(encode, images, budgets))
+            total = sum(len(payload) for payload, _ in results)
+            if not max_total_bytes or total <= max_total_bytes:
+                break
+            if not all(stats.get("encoded_pixels") for _, stats in results):
+                break
+            # 10% headroom, the size / pixel relation is not exactly linear
+            ratio = max_total_bytes / total * 0.9
+            budgets = [
+                max(64 * 64, int(stats["encoded_pixels"] * ratio))
+                for _, stats in results
+            ]
+
+    if max_total_bytes and total > max_total_bytes:
+        print(
+            f"Doubao images exceed payload budget: {total:,} > {max_total_bytes:,} bytes"
+        )
+    return [payload for payload, _ in results], [stats for _, stats in results]
+
+
+def _frame_thumbnails(frames: torch.Tensor, size: int = 32) -> np.ndarray:
+    """Grayscale [N, size, size] float32 thumbnails in [0, 1]
+
+    Channel mean and box downscale run on the frames' own device, only the
+    thumbnails are copied to the CPU.
+    """
+    if hasattr(frames, "cpu"):
+        scale = 255.0 if frames.dtype == torch.uint8 else 1.0
+        gray = frames[..., :3].float().mean(dim=-1)
+    else:
+        array = np.asarray(frames)
+        scale = 255.0 if array.dtype == np.uint8 else 1.0
+        gray = array[..., :3].astype(np.float32).mean(axis=-1)
+    n, height, width = gray.shape
+    by, bx = height // size, width // size
+    if by and bx:
+        gray = gray[:, : by * size, : bx * size].reshape(n, size, by, size, bx)
+        gray = gray.mean(4).mean(2)
+    if hasattr(gray, "cpu"):
+        gray = gray.cpu().numpy()
+    gray = np.asarray(gray, dtype=np.float32)
+    if not (by and bx):
+        # Frames smaller than the thumbnail: nearest-neighbour sampling
+        ys = np.linspace(0, height - 1, size).astype(int)
+        xs = np.linspace(0, width - 1, size).astype(int)
+        gray = gray[:, ys][:, :, xs]
+    return gray / scale if scale != 1.0 else gray
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+def frame_differences(frames: torch.Tensor, method: str = "scene_change") -> np.ndarray:
+    """Difference between each frame and the previous one, in [0, 1], length N - 1
+
+    scene_change: mean absolute luminance difference of 32x32 thumbnails
+    phash: fraction of differing bits of the 64-bit DCT perceptual hashes
+    """
+    thumbs = _frame_thumbnails(frames)
+    if method == "phash":
+        dct = _dct_matrix(thumbs.shape[1])
+        coefficients = (dct @ thumbs @ dct.T)[:, :8, :8].reshape(len(thumbs), 64)
+        # Median of the AC coefficients, the DC term would dominate
+        median = np.median(coefficients[:, 1:], axis=1, keepdims=True)
+        bits = coefficients > median
+        return (bits[1:] != bits[:-1]).mean(axis=1)
+    return np.abs(thumbs[1:] - thumbs[:-1]).mean(axis=(1, 2))
+
+
+def select_keyframes(
+    frames: torch.Tensor,
+    max_frames: int = 8,
+    method: str = "uniform",
+    threshold: float = 0.2,
+) -> List[int]:
+    """Indices of up to max_frames representative frames, in order
+
+    uniform: evenly spaced over the clip
+    scene_change / phash: the clip is cut where frame_differences() is at
+    least threshold (the largest max_frames - 1 cuts), each scene contributes
+    its middle frame. Spare budget goes to splitting the longest scenes.
+    """
+    count = int(frames.shape[0])
+    if count <= max_frames:
+        return list(range(count))
+    if method == "uniform":
+        return sorted(set(np.linspace(0, count - 1, max_frames).round().astype(int).tolist()))
+
+    if method not in SAMPLING_METHODS:
+        raise ValueError(f"Unknown sampling method: {method}")
+    differences = frame_differences(frames, method)
+    candidates = np.nonzero(differences >= threshold)[0]
+    strongest = candidates[np.argsort(differences[candidates])[::-1][: max_frames - 1]]
+    starts = [0] + sorted(int(i) + 1 for i in strongest)
+    segments = [[start, end] for start, end in zip(starts, starts[1:] + [count])]
+
+    while len(segments) < max_frames:
+        longest = max(segments, key=lambda segment: segment[1] - segment[0])
+        if longest[1] - longest[0] < 2:
+            break
+        middle = (longest[0] + longest[1]) // 2
+        segments.append([middle, longest[1]])
+        longest[1] = middle
+    return sorted((start + end - 1) // 2 for start, end in segments)
+
+
+IMAGE_PLACEHOLDER = "[image omitted]"
+
+
+class DoubaoConversation:
+    """Multi-turn chat history passed between nodes as DOUBAO_CONVERSATION
+
+    Conversations are immutable: append() returns a new conversation sharing
+    the earlier messages, so a graph branch that is re-run never sees turns
+    added downstream. The token estimate of every message is computed once
+    on append, and image parts keep their encoded data URL, so images from
+    earlier turns are never encoded again.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str = "",
+        messages: Tuple[DoubaoMessage, ...] = (),
+        token_counts: Tuple[int, ...] = (),
+        summary: str = "",
+    ):
+        self.system_prompt = system_prompt
+        self.messages = messages
+        self.token_counts = token_counts
+        self.summary = summary
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __repr__(self) -> str:
+        return f"DoubaoConversation(messages={len(self.messages)}, tokens~{self.estimate_tokens()})"
+
+    @staticmethod
+    def contains_image(messages: List[DoubaoMessage], url: str) -> bool:
+        """Whether an image (data URL) is part of the given request messages"""
+        return any(
+            part.get("type") == "image_url" and part["image_url"]["url"] == url
+            for message in messages
+            for part in message.content
+        )
+
+    def append(self, *messages: DoubaoMessage) -> "DoubaoConversation":
+        return DoubaoConversation(
+            self.system_prompt,
+            self.messages + messages,
+            self.token_counts
+            + tuple(estimate_prompt_tokens([message]) for message in messages),
+            self.summary,
+        )
+
+    def summarized(self, count: int, summary: str) -> "DoubaoConversation":
+        """Replace the first count messages with a summary"""
+        return DoubaoConversation(
+            self.system_prompt,
+            self.messages[count:],
+            self.token_counts[count:],
+            summary,
+        )
+
+    def _system_message(self) -> Optional[DoubaoMessage]:
+        text = self.system_prompt.strip()
+        if self.summary:
+            text = f"{text}\n\nSummary of the earlier conversation:\n{self.summary}".strip()
+        if not text:
+            return None
+        return DoubaoMessage.create_text_message(MessageRole.system, text)
+
+    def estimate_tokens(self) -> int:
+        system = self._system_message()
+        return sum(self.token_counts) + (
+            estimate_prompt_tokens([system]) if system else 0
+        )
+
+    def build_messages(
+        self,
+        new_messages: List[DoubaoMessage],
+        max_tokens: int = 0,
+        policy: str = "sliding_window",
+    ) -> Tuple[List[DoubaoMessage], int]:
+        """Request messages for the next turn, within max_tokens if possible
+
+        Returns the messages and the number of history messages dropped from
+        the front. The system prompt (with the summary) and new_messages are
+        always kept. "drop_old_images" first replaces images of earlier turns
+        with a placeholder, oldest first. Whole turns are then dropped from
+        the front so the history always starts with a user message.
+        """
+        system = self._system_message()
+        head = [system] if system else []
+        history = list(self.messages)
+        counts = list(self.token_counts)
+
+        if max_tokens <= 0:
+            return head + history + list(new_messages), 0
+
+        budget = max_tokens - estimate_prompt_tokens(head + list(new_messages))
+        total = sum(counts)
+
+        if policy == "drop_old_images":
+            for i, message in enumerate(history):
+                if total <= budget:
+                    break
+                if not any(p.get("type") == "image_url" for p in message.content):
+                    continue
+                stripped = DoubaoMessage(
+                    role=message.role,
+                    content=[
+                        {"type": "text", "text": IMAGE_PLACEHOLDER}
+                        if part.get("type") == "image_url"
+                        else part
+                        for part in message.content
+                    ],
+                )
+                new_count = estimate_prompt_tokens([stripped])
+                total += new_count - counts[i]
+                history[i], counts[i] = stripped, new_count
+
+        start = 0
+        while total > budget and start < len(history):
+            # Drop a whole turn: the user message and the replies after it
+            total -= counts[start]
+            start += 1
+            while start < len(history) and history[start].role != MessageRole.user:
+                total -= counts[start]
+                start += 1
+
+        return head + history[start:] + list(new_messages), start
+
+
+# Background executor for the async chat nodes, sized with DOUBAO_BACKGROUND_WORKERS
+_background_executor: Optional[ThreadPoolExecutor] = None
+_background_executor_lock = threading.Lock()
+
+
+def get_background_executor() -> ThreadPoolExecutor:
+    global _background_executor
+    with _background_executor_lock:
+        if _background_executor is None:
+            _background_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("DOUBAO_BACKGROUND_WORKERS", "16")),
+                thread_name_prefix="doubao-background",
+            )
+        return _background_executor
+
+
+class DoubaoFuture:
+    """Handle to a chat node call running in the background (DOUBAO_FUTURE)
+
+    result() returns the node's outputs as a dict keyed by output name and
+    re-raises the call's exception, if any.
+    """
+
+    def __init__(self, function: Callable[[], tuple], output_names: Tuple[str, ...]):
+        self.output_names = output_names
+        self.submitted_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self._cancel = CancelEvent()
+        self._future = get_background_executor().submit(self._run, function)
+
+    def _run(self, function: Callable[[], tuple]) -> tuple:
+        token = _call_cancel.set(self._cancel)
+        try:
+            return function()
+        finally:
+            _call_cancel.reset(token)
+            self.finished_at = time.monotonic()
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def cancel(self) -> bool:
+        """Stop the call: requests in flight are aborted and no new ones are sent"""
+        self._cancel.set()
+        return self._future.cancel()
+
+    def result(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        return dict(zip(self.output_names, self._future.result(timeout)))
+
+    def __repr__(self) -> str:
+        return f"DoubaoFuture(done={self.done()})"
\ No newline at end of file
@@ -0,0 +1,16 @@
+"""Option lists shared by the nodes and the API client
+
+Kept free of imports so that both nodes (loaded at ComfyUI startup) and
+doubao_client can use them without importing each other.
+"""
+
+# Supported upload formats and their MIME types
+IMAGE_FORMATS = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+# Backend selection strategies of DoubaoAPIPoolNode
+POOL_STRATEGIES = ["least_in_flight", "weighted_round_robin"]
+
+
+# Keyframe selection methods of DoubaoVideoChatNode
+SAMPLING_METHODS = ["uniform", "scene_change", "phash"]
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+本地模拟方舟(Ark)接口服务
+模拟 /chat/completions 接口（流式与非流式），用于离线测试和压测，无需网络
+
+用法:
+    python mock_server.py --port 8000 --latency lognormal:0.5,0.4 --error-rate 0.01
+然后将 DoubaoAPI 节点的 endpoint 设置为 http://127.0.0.1:8000/api/v3
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+
+def make_latency_sampler(spec: str, rng: random.Random) -> Callable[[], float]:
+    """Parse a latency distribution spec into a sampler returning seconds
+
+    Supported specs:
+        fixed:S             always S seconds
+        uniform:A,B         uniform between A and B
+        normal:MU,SIGMA     normal, clipped at 0
+        lognormal:MEDIAN,SIGMA
+        exp:MEAN            exponential
+        tail:FAST,SLOW,P    FAST seconds, SLOW seconds with probability P (stragglers)
+    """
+    name, _, args = spec.partition(":")
+    params = [float(x) for x in args.split(",")] if args else []
+    name = name.strip().lower()
+
+    if name == "fixed":
+        return lambda: params[0]
+    if name == "uniform":
+        return lambda: rng.uniform(params[0], params[1])
+    if name == "normal":
+        return lambda: max(0.0, rng.gauss(params[0], params[1]))
+    if name == "lognormal":
+        import math
+
+        mu = math.log(params[0])
+        return lambda: rng.lognormvariate(mu, params[1])
+    if name in ("exp", "exponential"):
+        return lambda: rng.expovariate(1.0 / params[0])
+    if name == "tail":
+        return lambda: params[1] if rng.random() < params[2] else params[0]
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class MockArkServer:
+    """Local stand-in for the Ark chat completions endpoint
+
+    latency: distribution spec for time to the first byte (see make_latency_sampler)
+    error_rate: fraction of requests answered with HTTP 500
+    burst_429_every / burst_429_duration: every N seconds, reject all requests
+        with 429 (and Retry-After) for D seconds
+    stream_chunk_delay: delay between streamed chunks
+    context_cache: serve /context/create and /context/chat/completions;
+        when disabled both answer 404 like endpoints without context caching
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: str = "fixed:0",
+        error_rate: float = 0.0,
+        burst_429_every: float = 0.0,
+        burst_429_duration: float = 0.0,
+        retry_after: float = 1.0,
+        stream_chunk_delay: float = 0.005,
+        context_cache: bool = True,
+        seed: Optional[int] = None,
+    ):
+        self.rng = random.Random(seed)
+        self.sample_latency = make_latency_sampler(latency, self.rng)
+        self.error_rate = error_rate
+        self.burst_429_every = burst_429_every
+        self.burst_429_duration = burst_429_duration
+        self.retry_after = retry_after
+        self.stream_chunk_delay = stream_chunk_delay
+        self.context_cache = context_cache
+        # context id -> (prefix messages, expires at)
+        self.contexts: Dict[str, Any] = {}
+
+        self.stats: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Endpoint URL to pass to DoubaoAPI"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api/v3"
+
+    def start(self) -> "MockArkServer":
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "MockArkServer":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def _in_429_burst(self) -> bool:
+        if self.burst_429_every <= 0 or self.burst_429_duration <= 0:
+            return False
+        elapsed = time.monotonic() - self._started_at
+        return elapsed % self.burst_429_every < self.burst_429_duration
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            return self.rng.random() < self.error_rate
+
+    def _latency(self) -> float:
+        with self._lock:
+            return self.sample_latency()
+
+    def _reply_for(self, request: Dict[str, Any]) -> str:
+        """Deterministic reply derived from the last user message"""
+        text = ""
+        images = 0
+        for message in request.get("messages", []):
+            if message.get("role") != "user":
+                continue
+            content = message.get("content")
+            if isinstance(content, str):
+                text = content
+                continue
+            images = 0
+            for part in content or []:
+                if part.get("type") == "text":
+                    text = part.get("text", "")
+                elif part.get("type") == "image_url":
+                    images += 1
+        reply = f"mock reply to: {text[:64]}"
+        if images:
+            reply += f" ({images} image{'s' if images > 1 else ''})"
+        return reply
+
+    @staticmethod
+    def _usage(
+        request: Dict[str, Any], reply: str, cached_tokens: int = 0
+    ) -> Dict[str, Any]:
+        prompt_tokens = len(json.dumps(request.get("messages", []))) // 4
+        completion_tokens = len(reply.split())
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        if cached_tokens:
+            usage["prompt_tokens_details"] = {"cached_tokens": cached_tokens}
+        return usage
+
+    def _create_context(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        ttl = int(request.get("ttl") or 86400)
+        with self._lock:
+            context_id = f"ctx-mock-{len(self.contexts) + 1}"
+            self.contexts[context_id] = (
+                request.get("messages", []),
+                time.monotonic() + ttl,
+            )
+        return {
+            "id": context_id,
+            "model": request.get("model"),
+            "mode": request.get("mode", "session"),
+            "ttl": ttl,
+            "usage": self._usage(request, ""),
+        }
+
+    def _resolve_context(self, request: Dict[str, Any]) -> Optional[int]:
+        """Prepend the context's prefix to request, returns its token count"""
+        with self._lock:
+            context = self.contexts.get(request.get("context_id"))
+        if context is None or context[1] < time.monotonic():
+            return None
+        prefix, _ = context
+        request["messages"] = prefix + request.get("messages", [])
+        return len(json.dumps(prefix)) // 4
+
+    def expire_contexts(self):
+        """Drop every context, as if their TTL had run out"""
+        with self._lock:
+            self.contexts.clear()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Client went away, e.g. a cancelled hedge request
+
+            def _send_json(self, status: int, payload: Dict[str, Any], headers=None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                # Counted before the body goes out, so a client that got it sees the count
+                server._count(str(status))
+                self.wfile.write(body)
+
+            def _send_error(self, status: int, message: str, headers=None):
+                self._send_json(status, {"error": {"message": message}}, headers)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length)
+
+                path = self.path.rstrip("/")
+                is_context = "/context/" in path
+                if not path.endswith(("/chat/completions", "/context/create")) or (
+                    is_context and not server.context_cache
+                ):
+                    self._send_error(404, f"Unknown path: {self.path}")
+                    return
+                if not (self.headers.get("Authorization") or "").startswith("Bearer "):
+                    self._send_error(401, "Missing API key")
+                    return
+                try:
+                    request = json.loads(raw)
+                except json.JSONDecodeError:
+                    self._send_error(400, "Invalid JSON body")
+                    return
+
+                if server._in_429_burst():
+                    self._send_error(
+                        429,
+                        "Rate limit exceeded",
+                        {"Retry-After": str(server.retry_after)},
+                    )
+                    return
+
+                time.sleep(server._latency())
+
+                if server._should_fail():
+                    self._send_error(500, "Internal server error")
+                    return
+
+                if path.endswith("/context/create"):
+                    server._count("context_create")
+                    self._send_json(200, server._create_context(request))
+                    return
+
+                cached_tokens = 0
+                if is_context:
+                    cached_tokens = server._resolve_context(request)
+                    if cached_tokens is None:
+                        self._send_error(404, "Context not found or expired")
+                        return
+
+                reply = server._reply_for(request)
+                if request.get("stream"):
+                    self._stream(request, reply, cached_tokens)
+                else:
+                    self._send_json(
+                        200,
+                        {
+                            "id": "mock",
+                            "object": "chat.completion",
+                            "model": request.get("model"),
+                            "choices": [
+                                {
+                                    "index": 0,
+                                    "message": {"role": "assistant", "content": reply},
+                                    "finish_reason": "stop",
+                                }
+                            ],
+                            "usage": server._usage(request, reply, cached_tokens),
+                        },
+                    )
+
+            def _stream(
+                self, request: Dict[str, Any], reply: str, cached_tokens: int = 0
+            ):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+                def send_event(payload):
+                    self.wfile.write(f"data: {payload}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                words = reply.split(" ")
+                for i, word in enumerate(words):
+                    chunk = word if i == 0 else " " + word
+                    send_event(
+                        json.dumps(
+                            {
+                                "object": "chat.completion.chunk",
+                                "choices": [{"index": 0, "delta": {"content": chunk}}],
+                            }
+                        )
+                    )
+                    time.sleep(server.stream_chunk_delay)
+
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    send_event(
+                        json.dumps(
+                            {
+                                "choices": [],
+                                "usage": server._usage(request, reply, cached_tokens),
+                            }
+                        )
+                    )
+                server._count("200")
+                send_event("[DONE]")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟方舟接口服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", default="fixed:0.2", help="延迟分布，如 lognormal:0.5,0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500错误的比例")
+    parser.add_argument("--burst-429-every", type=float, default=0.0, help="每隔多少秒出现一次429突发")
+    parser.add_argument("--burst-429-duration", type=float, default=0.0, help="429突发持续秒数")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429响应的Retry-After秒数")
+    parser.add_argument("--no-context-cache", action="store_true", help="模拟不支持上下文缓存的端点")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockArkServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        burst_429_every=args.burst_429_every,
+        burst_429_duration=args.burst_429_duration,
+        retry_after=args.retry_after,
+        context_cache=not args.no_context_cache,
+        seed=args.seed,
+    )
+    print(f"Mock Ark server listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,198 +1,64 @@
+from __future__ import annotations
+
 import os
 import json
-import base64
-import requests
-from io import BytesIO
-from PIL import Image
-import torch
-from typing import List, Dict, Optional, Any
-from pydantic import BaseModel
-from enum import Enum
-
-# Doubao LLM supported model list (based on latest API documentation)
-doubao_models = [
-    # Latest Doubao 1.6 series models (recommended)
-    "doubao-seed-1.6-250615",
-    "doubao-seed-1.6-flash-250615",
-    "doubao-seed-1.6-thinking-250615",
-    # Doubao 1.5 series models
-    "doubao-1.5-thinking-vision-pro-250428",
-    "doubao-1.5-thinking-pro-250415",
-    "doubao-1.5-thinking-pro-m-250428",
-    "doubao-1.5-vision-pro-250328",
-    "doubao-1.5-pro-32k",
-    "doubao-1.5-pro-256k",
-    "doubao-1.5-lite-32k",
-    # DeepSeek models
-    "deepseek-r1-250528",
-    "deepseek-r1-250120",
-    "deepseek-r1-distill-qwen-32b-250120",
-    "deepseek-r1-distill-qwen-7b-250120",
-]
-
-# Models that support vision understanding
-doubao_vision_models = [
-    # Latest Doubao 1.6 series vision models (recommended)
-    "doubao-seed-1.6-250615",
-    "doubao-seed-1.6-flash-250615",
-    "doubao-seed-1.6-thinking-250615",
-    # Doubao 1.5 series vision models
-    "doubao-1.5-thinking-vision-pro-250428",
-    "doubao-1.5-thinking-pro-m-250428",
-    "doubao-1.5-vision-pro-250328",
-    "doubao-1.5-vision-pro-32k",
-]
-
-
-class DoubaoConfig(BaseModel):
-    """Doubao LLM configuration"""
-
-    model: str = (
-        "doubao-seed-1.6-flash-250615"  # Default to latest Doubao 1.6 model, can also use Endpoint ID
-    )
-    max_tokens: int = 1000
-    temperature: float = 0.7
-    top_p: float = 0.9
-    stream: bool = False
-    seed: Optional[int] = None
-
-
-class MessageRole(str, Enum):
-    """Message role enumeration"""
+import functools
+import importlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Dict, Optional, Any, Callable, Tuple
 
-    system = "system"
-    user = "user"
-    assistant = "assistant"
+if TYPE_CHECKING:
+    import torch
 
+if __package__:
+    from .doubao_constants import IMAGE_FORMATS, POOL_STRATEGIES, SAMPLING_METHODS
+else:
+    from doubao_constants import IMAGE_FORMATS, POOL_STRATEGIES, SAMPLING_METHODS
 
-class DoubaoMessage(BaseModel):
-    """Doubao message format"""
-
-    role: MessageRole
-    content: List[Dict[str, Any]]
-
-    @classmethod
-    def create_text_message(cls, role: MessageRole, text: str):
-        """Create text-only message"""
-        return cls(role=role, content=[{"type": "text", "text": text}])
-
-    @classmethod
-    def create_multimodal_message(cls, role: MessageRole, text: str, image_base64: str):
-        """Create multimodal message (text + image)"""
-        return cls(
-            role=role,
-            content=[
-                {"type": "text", "text": text},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"},
-                },
-            ],
-        )
+# Loading this module must stay cheap: ComfyUI imports every custom node
+# package at startup. The API client and everything that needs torch, PIL,
+# numpy, requests or pydantic live in doubao_client and are only imported
+# when a node first executes.
+_client_module = None
 
 
-class DoubaoAPI:
-    """Doubao LLM API client"""
+def _load_client():
+    global _client_module
+    if _client_module is None:
+        if __package__:
+            _client_module = importlib.import_module(".doubao_client", __package__)
+        else:
+            _client_module = importlib.import_module("doubao_client")
+    return _client_module
 
-    def __init__(
-        self,
-        api_key: str = None,
-        endpoint: str = "https://ark.cn-beijing.volces.com/api/v3",
-    ):
-        # API key priority: parameter > environment variable
-        self.api_key = api_key or os.getenv("DOUBAO_API_KEY")
-        self.endpoint = endpoint
-        self.timeout = 60
 
-        if not self.api_key:
-            raise ValueError(
-                "API key not set. Please set DOUBAO_API_KEY environment variable or provide api_key parameter during initialization"
-            )
+class _LazyClient:
+    """Module proxy that imports doubao_client on first attribute access"""
 
-    def _get_headers(self) -> Dict[str, str]:
-        """Get request headers"""
-        return {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-
-    def chat_completions(
-        self, messages: List[DoubaoMessage], config: DoubaoConfig
-    ) -> str:
-        """Call Doubao chat completion API"""
-        # Validate model format: supports Endpoint ID or Model ID
-        model = config.model.strip()
-        if not model:
-            raise ValueError("Model cannot be empty")
-
-        url = f"{self.endpoint}/chat/completions"
-
-        # Build request data
-        data = {
-            "model": config.model,
-            "messages": [msg.dict() for msg in messages],
-            "max_tokens": config.max_tokens,
-            "temperature": config.temperature,
-            "top_p": config.top_p,
-            "stream": config.stream,
-        }
-        
-        # Add seed parameter if provided (with compatibility check)
-        if config.seed is not None:
-            data["seed"] = config.seed
-
-        try:
-            response = requests.post(
-                url, json=data, headers=self._get_headers(), timeout=self.timeout
-            )
-            response.raise_for_status()
-
-            result = response.json()
-
-            if "error" in result:
-                raise Exception(f"API Error: {result['error']['message']}")
-
-            if "choices" not in result or len(result["choices"]) == 0:
-                raise Exception("No response generated")
-
-            return result["choices"][0]["message"]["content"]
-
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"Request failed: {str(e)}")
-        except json.JSONDecodeError as e:
-            raise Exception(f"Failed to parse response: {str(e)}")
-        except Exception as e:
-            raise Exception(f"API call failed: {str(e)}")
+    def __getattr__(self, name: str) -> Any:
+        return getattr(_load_client(), name)
 
 
-def tensor_to_base64(tensor: torch.Tensor) -> str:
-    """Convert ComfyUI image tensor to base64 encoding"""
-    # Ensure tensor is on CPU
-    if tensor.device != torch.device("cpu"):
-        tensor = tensor.cpu()
+client = _LazyClient()
 
-    # Convert to numpy array and adjust dimension order
-    # ComfyUI tensor format: [batch, height, width, channels]
-    # Take the first image
-    if len(tensor.shape) == 4:
-        tensor = tensor[0]
 
-    # Convert to PIL Image
-    # Ensure value range is 0-255
-    if tensor.max() <= 1.0:
-        tensor = tensor * 255
+def __getattr__(name: str) -> Any:
+    # Keep `from nodes import DoubaoAPI` and friends working
+    if name.startswith("__"):
+        raise AttributeError(name)
+    try:
+        return getattr(_load_client(), name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
 
-    tensor = tensor.clamp(0, 255).byte()
 
-    # Convert to PIL Image
-    pil_image = Image.fromarray(tensor.numpy(), mode="RGB")
+# Response cache modes selectable on DoubaoAPINode
+CACHE_MODES = ["disabled", "when_seeded", "always"]
 
-    # Convert to base64
-    buffer = BytesIO()
-    pil_image.save(buffer, format="JPEG", quality=95)
-    img_bytes = buffer.getvalue()
 
-    return base64.b64encode(img_bytes).decode("utf-8")
+# Resolution hints accepted in image_url parts
+IMAGE_DETAILS = ["auto", "low", "high"]
 
 
 class DoubaoAPINode:
@@ -219,6 +85,159 @@ class DoubaoAPINode:
                     },
                 ),
             },
+            "optional": {
+                "pool_connections": (
+                    "INT",
+                    {
+                        "default": 10,
+                        "min": 1,
+                        "max": 100,
+                        "step": 1,
+                        "tooltip": "Number of host connection pools kept alive",
+                    },
+                ),
+                "pool_maxsize": (
+                    "INT",
+                    {
+                        "default": 10,
+                        "min": 1,
+                        "max": 256,
+                        "step": 1,
+                        "tooltip": "Maximum keep-alive connections per host",
+                    },
+                ),
+                "max_retries": (
+                    "INT",
+                    {
+                        "default": 0,
+                        "min": 0,
+                        "max": 10,
+                        "step": 1,
+                        "tooltip": "Retries for failed connection attempts (requests that were never sent)",
+                    },
+                ),
+                "response_cache": (
+                    CACHE_MODES,
+                    {
+                        "default": "disabled",
+                        "tooltip": "On-disk response cache: 'when_seeded' only caches requests with a fixed seed, 'always' caches every request",
+                    },
+                ),
+                "cache_ttl_hours": (
+                    "FLOAT",
+                    {
+                        "default": 168.0,
+                        "min": 0.0,
+                        "max": 8760.0,
+                        "step": 1.0,
+                        "tooltip": "Cached responses older than this are discarded",
+                    },
+                ),
+                "cache_max_mb": (
+                    "INT",
+                    {
+                        "default": 64,
+                        "min": 1,
+                        "max": 10240,
+                        "step": 1,
+                        "tooltip": "Maximum size of cached responses, least recently used entries are evicted first",
+                    },
+                ),
+                "requests_per_minute": (
+                    "INT",
+                    {
+                        "default": 0,
+                        "min": 0,
+                        "max": 100000,
+                        "step": 1,
+                        "tooltip": "Client-side request rate limit shared by all nodes using this API key and endpoint. Requests over the limit are queued. 0 disables the limit",
+                    },
+                ),
+                "tokens_per_minute": (
+                    "INT",
+                    {
+                        "default": 0,
+                        "min": 0,
+                        "max": 100000000,
+                        "step": 1000,
+                        "tooltip": "Client-side token rate limit (estimated prompt tokens + max_tokens). 0 disables the limit",
+                    },
+                ),
+                "max_attempts": (
+                    "INT",
+                    {
+                        "default": 3,
+                        "min": 1,
+                        "max": 10,
+                        "step": 1,
+                        "tooltip": "Total attempts per request. 429, 5xx, connection errors and timeouts are retried with exponential backoff and jitter, honoring Retry-After",
+                    },
+                ),
+                "retry_backoff": (
+                    "FLOAT",
+                    {
+                        "default": 1.0,
+                        "min": 0.0,
+                        "max": 60.0,
+                        "step": 0.1,
+                        "tooltip": "Delay in seconds before the first retry, doubled on every further attempt",
+                    },
+                ),
+                "connect_timeout": (
+                    "FLOAT",
+                    {
+                        "default": 10.0,
+                        "min": 1.0,
+                        "max": 120.0,
+                        "step": 1.0,
+                        "tooltip": "Seconds to wait for the connection to be established",
+                    },
+                ),
+                "read_timeout": (
+                    "FLOAT",
+                    {
+                        "default": 60.0,
+                        "min": 1.0,
+                        "max": 1800.0,
+                        "step": 1.0,
+                        "tooltip": "Seconds to wait for response data (between streamed chunks when streaming)",
+                    },
+                ),
+                "dedupe_requests": (
+                    CACHE_MODES,
+                    {
+                        "default": "when_seeded",
+                        "tooltip": "Identical requests running at the same time share one API call. 'when_seeded' only merges requests with a fixed seed, so unseeded duplicates are still sampled independently; 'always' merges them too",
+                    },
+                ),
+                "context_cache": (
+                    "BOOLEAN",
+                    {
+                        "default": False,
+                        "tooltip": "Cache long system prompts on the server (Ark context caching) so repeated requests skip reprocessing them. Falls back to sending the full prompt when the model does not support it",
+                    },
+                ),
+                "context_cache_ttl_minutes": (
+                    "INT",
+                    {
+                        "default": 60,
+                        "min": 10,
+                        "max": 10080,
+                        "step": 10,
+                        "tooltip": "Lifetime of server-side context caches, they are recreated shortly before expiring",
+                    },
+                ),
+                "hedge_percentile": (
+                    "FLOAT",
+                    {
+                        "default": 0.0,
+                        "min": 0.0,
+                        "max": 99.9,
+                        "step": 0.5,
+                        "tooltip": "Send a duplicate request when no response (first token when streaming) has arrived within this percentile of recent latencies. The first answer wins and the other request is cancelled. 0 disables hedging",
+                    },
+                ),
+            },
         }
 
     RETURN_TYPES = ("DOUBAO_API",)
@@ -226,7 +245,27 @@ class DoubaoAPINode:
     FUNCTION = "create_api"
     CATEGORY = "Doubao LLM"
 
-    def create_api(self, api_key: str, endpoint: str):
+    def create_api(
+        self,
+        api_key: str,
+        endpoint: str,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        max_retries: int = 0,
+        response_cache: str = "disabled",
+        cache_ttl_hours: float = 168.0,
+        cache_max_mb: int = 64,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_attempts: int = 3,
+        retry_backoff: float = 1.0,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 60.0,
+        dedupe_requests: str = "when_seeded",
+        context_cache: bool = False,
+        context_cache_ttl_minutes: int = 60,
+        hedge_percentile: float = 0.0,
+    ):
         # If no API key is provided, try to get it from environment variable
         if not api_key or api_key.strip() == "":
             api_key = os.environ.get("DOUBAO_API_KEY")
@@ -236,7 +275,168 @@ class DoubaoAPINode:
                 "Doubao API key is required. Please provide API key or set DOUBAO_API_KEY environment variable."
             )
 
-        return (DoubaoAPI(api_key=api_key, endpoint=endpoint),)
+        cache = None
+        if response_cache != "disabled":
+            cache = client.get_response_cache(
+                max_bytes=cache_max_mb * 1024 * 1024,
+                ttl_seconds=cache_ttl_hours * 3600,
+            )
+
+        rate_limiter = None
+        if requests_per_minute > 0 or tokens_per_minute > 0:
+            rate_limiter = client.get_rate_limiter(
+                api_key, endpoint, requests_per_minute, tokens_per_minute
+            )
+
+        shared_context_cache = None
+        if context_cache:
+            shared_context_cache = client.get_context_cache(
+                api_key, endpoint, context_cache_ttl_minutes * 60
+            )
+
+        return (
+            client.DoubaoAPI(
+                api_key=api_key,
+                endpoint=endpoint,
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+                max_retries=max_retries,
+                response_cache=cache,
+                cache_mode=response_cache,
+                rate_limiter=rate_limiter,
+                retry_policy=client.RetryPolicy(
+                    max_attempts=max_attempts, backoff_base=retry_backoff
+                ),
+                connect_timeout=connect_timeout,
+                read_timeout=read_timeout,
+                context_cache=shared_context_cache,
+                dedupe_mode=dedupe_requests,
+                hedge_policy=_hedge_policy(hedge_percentile),
+            ),
+        )
+
+
+def _hedge_policy(percentile: float):
+    """HedgePolicy for a node's hedge_percentile input, None when disabled"""
+    if percentile <= 0:
+        return None
+    return client.HedgePolicy(percentile=percentile)
+
+
+class DoubaoAPIPoolNode:
+    """Combines several Doubao API nodes (accounts / regions) into one load-balanced API"""
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        optional = {}
+        for i in range(1, 5):
+            if i > 1:
+                optional[f"api_{i}"] = ("DOUBAO_API",)
+            optional[f"model_{i}"] = (
+                "STRING",
+                {
+                    "multiline": False,
+                    "default": "",
+                    "tooltip": "Model or Endpoint ID to use on this backend instead of the config's model (Endpoint IDs belong to one account). Empty keeps the config's model",
+                },
+            )
+            optional[f"weight_{i}"] = (
+                "FLOAT",
+                {
+                    "default": 1.0,
+                    "min": 0.1,
+                    "max": 100.0,
+                    "step": 0.1,
+                    "tooltip": "Relative share of requests sent to this backend",
+                },
+            )
+        return {
+            "required": {
+                "api_1": ("DOUBAO_API",),
+                "strategy": (
+                    POOL_STRATEGIES,
+                    {
+                        "default": "least_in_flight",
+                        "tooltip": "'least_in_flight' sends each request to the backend with the fewest requests in flight per unit of weight, 'weighted_round_robin' rotates by weight",
+                    },
+                ),
+                "error_threshold": (
+                    "FLOAT",
+                    {
+                        "default": 0.5,
+                        "min": 0.05,
+                        "max": 1.0,
+                        "step": 0.05,
+                        "tooltip": "Error rate over the last 20 requests at which a backend is temporarily ejected",
+                    },
+                ),
+                "eject_seconds": (
+                    "INT",
+                    {
+                        "default": 30,
+                        "min": 1,
+                        "max": 3600,
+                        "tooltip": "How long an ejected backend gets no traffic",
+                    },
+                ),
+                "hedge_percentile": (
+                    "FLOAT",
+                    {
+                        "default": 0.0,
+                        "min": 0.0,
+                        "max": 99.9,
+                        "step": 0.5,
+                        "tooltip": "Send a duplicate request to another backend when no response (first token when streaming) has arrived within this percentile of recent latencies. The first answer wins and the other request is cancelled. 0 disables hedging",
+                    },
+                ),
+            },
+            "optional": optional,
+        }
+
+    RETURN_TYPES = ("DOUBAO_API",)
+    RETURN_NAMES = ("doubao_api",)
+    FUNCTION = "create_pool"
+    CATEGORY = "Doubao LLM"
+
+    def create_pool(
+        self,
+        api_1: client.DoubaoAPI,
+        strategy: str = "least_in_flight",
+        error_threshold: float = 0.5,
+        eject_seconds: int = 30,
+        hedge_percentile: float = 0.0,
+        **kwargs,
+    ):
+        kwargs["api_1"] = api_1
+        backends = []
+        for i in range(1, 5):
+            api = kwargs.get(f"api_{i}")
+            if api is None:
+                continue
+            model = kwargs.get(f"model_{i}") or ""
+            weight = kwargs.get(f"weight_{i}", 1.0)
+            if isinstance(api, client.DoubaoAPIPool):
+                # A pool connected here contributes its backends, sharing this slot's weight
+                total = sum(b.weight for b in api.backends)
+                members = [
+                    (b.api, model or b.model, weight * b.weight / total)
+                    for b in api.backends
+                ]
+            else:
+                members = [(api, model, weight)]
+            for member_api, member_model, member_weight in members:
+                backend = client.PoolBackend(
+                    member_api, model=member_model, weight=member_weight
+                )
+                backend.health.configure(error_threshold, eject_seconds)
+                backends.append(backend)
+        return (
+            client.DoubaoAPIPool(
+                backends,
+                strategy=strategy,
+                hedge_policy=_hedge_policy(hedge_percentile),
+            ),
+        )
 
 
 class DoubaoConfigNode:
@@ -296,6 +496,13 @@ class DoubaoConfigNode:
                         "tooltip": "Random seed for reproducible results. Set to -1 or leave empty for random generation",
                     },
                 ),
+                "stream": (
+                    "BOOLEAN",
+                    {
+                        "default": False,
+                        "tooltip": "Stream the response and show partial text in the UI as it arrives",
+                    },
+                ),
             },
         }
 
@@ -305,22 +512,83 @@ class DoubaoConfigNode:
     CATEGORY = "Doubao LLM"
 
     def create_config(
-        self, model: str, max_tokens: int, temperature: float, top_p: float, seed: int = -1
+        self,
+        model: str,
+        max_tokens: int,
+        temperature: float,
+        top_p: float,
+        seed: int = -1,
+        stream: bool = False,
     ):
         # Handle seed parameter with compatibility
         seed_value = None if seed == -1 else seed
         
         return (
-            DoubaoConfig(
+            client.DoubaoConfig(
                 model=model, 
                 max_tokens=max_tokens, 
                 temperature=temperature, 
                 top_p=top_p,
-                seed=seed_value
+                seed=seed_value,
+                stream=stream,
             ),
         )
 
 
+# How DoubaoTextChatNode splits user_prompt into several prompts
+PROMPT_MODES = ["single", "lines", "jsonl"]
+
+
+def split_prompts(text: str, prompt_mode: str = "single") -> List[str]:
+    """Split a multi-prompt input
+
+    lines: one prompt per non-empty line
+    jsonl: one JSON value per non-empty line, either a string or an object
+           with a "prompt" (or "user_prompt") field
+    """
+    if prompt_mode == "single":
+        return [text]
+
+    prompts = []
+    for line_number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        if prompt_mode == "lines":
+            prompts.append(line)
+            continue
+
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSONL prompt on line {line_number}: {str(e)}")
+        if isinstance(item, dict):
+            item = item.get("prompt", item.get("user_prompt"))
+        if not isinstance(item, str):
+            raise ValueError(
+                f"JSONL line {line_number} must be a string or have a 'prompt' field"
+            )
+        prompts.append(item)
+    return prompts
+
+
+def _unwrap(value: Any, default: Any = None) -> Any:
+    """First element of an INPUT_IS_LIST input"""
+    if isinstance(value, list):
+        return value[0] if value else default
+    return value
+
+
+def _unwrap_single(value: Any, name: str, default: Any = None) -> Any:
+    """Only element of an INPUT_IS_LIST input that cannot vary per item"""
+    if isinstance(value, list) and len(value) > 1:
+        raise ValueError(
+            f"{name} received a list of {len(value)} values, but all prompts of one "
+            "DoubaoTextChat node share a single value. Use one node per value instead"
+        )
+    return _unwrap(value, default)
+
+
 class DoubaoTextChatNode:
     """Doubao text-only chat node"""
 
@@ -351,47 +619,122 @@ class DoubaoTextChatNode:
                         "tooltip": "When enabled, API errors (timeout, network issues, etc.) will be ignored and return empty string instead of throwing exceptions",
                     },
                 ),
+                "prompt_mode": (
+                    PROMPT_MODES,
+                    {
+                        "default": "single",
+                        "tooltip": "'lines': one prompt per line, 'jsonl': one JSON prompt per line. A list of prompts connected to user_prompt is always run as a batch",
+                    },
+                ),
+                "max_concurrency": (
+                    "INT",
+                    {
+                        "default": 8,
+                        "min": 1,
+                        "max": 128,
+                        "step": 1,
+                        "tooltip": "Maximum number of requests in flight for multiple prompts",
+                    },
+                ),
             },
+            "hidden": {"unique_id": "UNIQUE_ID"},
         }
 
-    RETURN_TYPES = ("STRING",)
-    RETURN_NAMES = ("response",)
+    # Receive a connected list of prompts in one call instead of one call per item
+    INPUT_IS_LIST = True
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "DOUBAO_USAGE")
+    RETURN_NAMES = ("response", "responses", "errors", "usage")
+    OUTPUT_IS_LIST = (False, True, True, False)
     FUNCTION = "chat"
     CATEGORY = "Doubao LLM"
 
-    def chat(
-        self,
-        user_prompt: str,
-        doubao_api: DoubaoAPI,
-        doubao_config: DoubaoConfig,
-        system_prompt: str = "",
-        ignore_errors: bool = True,
-    ):
+    @staticmethod
+    def _build_messages(user_prompt: str, system_prompt: str) -> List[client.DoubaoMessage]:
         messages = []
 
         # Add system prompt (if provided)
         if system_prompt and system_prompt.strip():
             messages.append(
-                DoubaoMessage.create_text_message(
-                    MessageRole.system, system_prompt.strip()
+                client.DoubaoMessage.create_text_message(
+                    client.MessageRole.system, system_prompt.strip()
                 )
             )
 
         # Add user prompt
         messages.append(
-            DoubaoMessage.create_text_message(MessageRole.user, user_prompt)
+            client.DoubaoMessage.create_text_message(client.MessageRole.user, user_prompt)
         )
+        return messages
 
-        # Call API with error handling
+    def chat(
+        self,
+        user_prompt: str,
+        doubao_api: client.DoubaoAPI,
+        doubao_config: client.DoubaoConfig,
+        system_prompt: str = "",
+        ignore_errors: bool = True,
+        prompt_mode: str = "single",
+        max_concurrency: int = 8,
+        unique_id: Optional[str] = None,
+    ):
+        doubao_api = _unwrap_single(doubao_api, "doubao_api")
+        doubao_config = _unwrap_single(doubao_config, "doubao_config")
+        system_prompt = _unwrap_single(system_prompt, "system_prompt", "")
+        ignore_errors = _unwrap(ignore_errors, True)
+        prompt_mode = _unwrap(prompt_mode, "single")
+        max_concurrency = _unwrap(max_concurrency, 8)
+        unique_id = _unwrap(unique_id)
+
+        prompts = []
+        for text in user_prompt if isinstance(user_prompt, list) else [user_prompt]:
+            prompts.extend(split_prompts(text, prompt_mode))
+
+        if len(prompts) == 1:
+            messages = self._build_messages(prompts[0], system_prompt)
+
+            # Call API with error handling
+            try:
+                response, usage = doubao_api.chat_completions_with_usage(
+                    messages, doubao_config, on_delta=client.make_progress_callback(unique_id)
+                )
+                return (response, [response], [""], usage)
+            except Exception as e:
+                if ignore_errors:
+                    print(f"Doubao API error (ignored): {str(e)}")
+                    return ("", [""], [str(e)], client.DoubaoUsage(model=doubao_config.model))
+                else:
+                    raise e
+
+        # Multiple prompts: shared config and system prompt, dispatched
+        # concurrently. Failures are reported per item in the errors output.
+        async_api = client.AsyncDoubaoAPI(doubao_api, max_concurrency=max_concurrency)
         try:
-            response = doubao_api.chat_completions(messages, doubao_config)
-            return (response,)
-        except Exception as e:
-            if ignore_errors:
-                print(f"Doubao API error (ignored): {str(e)}")
-                return ("",)
+            results = async_api.run_many(
+                [
+                    (self._build_messages(prompt, system_prompt), doubao_config)
+                    for prompt in prompts
+                ],
+                return_exceptions=True,
+                with_usage=True,
+            )
+        finally:
+            async_api.close()
+
+        responses, errors = [], []
+        usage = client.DoubaoUsage(model=doubao_config.model)
+        for result in results:
+            if isinstance(result, Exception):
+                responses.append("")
+                errors.append(str(result))
             else:
-                raise e
+                responses.append(result[0])
+                errors.append("")
+                usage = usage.merge(result[1])
+
+        failed = sum(1 for error in errors if error)
+        if failed:
+            print(f"Doubao API errors: {failed}/{len(prompts)} prompts failed")
+        return ("\n".join(responses), responses, errors, usage)
 
 
 class DoubaoVisionChatNode:
@@ -429,67 +772,759 @@ class DoubaoVisionChatNode:
                         "tooltip": "When enabled, API errors (timeout, network issues, etc.) will be ignored and return empty string instead of throwing exceptions",
                     },
                 ),
+                "batch_mode": (
+                    "BOOLEAN",
+                    {
+                        "default": False,
+                        "tooltip": "When enabled, every image in the batch is described instead of only the first one",
+                    },
+                ),
+                "max_concurrency": (
+                    "INT",
+                    {
+                        "default": 4,
+                        "min": 1,
+                        "max": 64,
+                        "step": 1,
+                        "tooltip": "Maximum number of requests in flight when batch mode is enabled",
+                    },
+                ),
+                "image_format": (
+                    list(IMAGE_FORMATS.keys()),
+                    {
+                        "default": "JPEG",
+                        "tooltip": "Upload format, JPEG is fastest to encode (uses libjpeg-turbo when simplejpeg or PyTurboJPEG is installed)",
+                    },
+                ),
+                "image_quality": (
+                    "INT",
+                    {
+                        "default": 95,
+                        "min": 1,
+                        "max": 100,
+                        "step": 1,
+                        "tooltip": "JPEG / WebP quality, ignored for PNG",
+                    },
+                ),
+                "max_megapixels": (
+                    "FLOAT",
+                    {
+                        "default": -1.0,
+                        "min": -1.0,
+                        "max": 64.0,
+                        "step": 0.1,
+                        "tooltip": "Downscale images above this many megapixels before upload. -1 uses the model's default budget, 0 disables resizing",
+                    },
+                ),
+                "max_side": (
+                    "INT",
+                    {
+                        "default": 0,
+                        "min": 0,
+                        "max": 16384,
+                        "step": 64,
+                        "tooltip": "Downscale images whose longest side exceeds this many pixels. 0 disables the limit",
+                    },
+                ),
+                "multi_image": (
+                    "BOOLEAN",
+                    {
+                        "default": False,
+                        "tooltip": "Send every image (the whole batch and image_2..image_4) in one request, e.g. to compare them",
+                    },
+                ),
+                "image_2": ("IMAGE", {"tooltip": "Extra images, used in batch mode and multi-image mode"}),
+                "image_3": ("IMAGE",),
+                "image_4": ("IMAGE",),
+                "image_detail": (
+                    IMAGE_DETAILS,
+                    {
+                        "default": "auto",
+                        "tooltip": "Resolution hint for the model: 'low' is cheaper and faster, 'high' keeps fine detail",
+                    },
+                ),
+                "image_details": (
+                    "STRING",
+                    {
+                        "multiline": False,
+                        "default": "",
+                        "tooltip": "Optional per-image hints in image order, e.g. 'high,low,low'. Empty entries use image_detail",
+                    },
+                ),
+                "max_payload_mb": (
+                    "FLOAT",
+                    {
+                        "default": 0.0,
+                        "min": 0.0,
+                        "max": 256.0,
+                        "step": 0.5,
+                        "tooltip": "Total encoded image size per request. Images are downscaled further until they fit. 0 disables the limit",
+                    },
+                ),
             },
+            "hidden": {"unique_id": "UNIQUE_ID"},
         }
 
-    RETURN_TYPES = ("STRING",)
-    RETURN_NAMES = ("response",)
+    RETURN_TYPES = ("STRING", "STRING", "DOUBAO_USAGE")
+    RETURN_NAMES = ("response", "responses", "usage")
+    OUTPUT_IS_LIST = (False, True, False)
     FUNCTION = "vision_chat"
     CATEGORY = "Doubao LLM"
 
-    def vision_chat(
+    def _describe_image(
         self,
-        image: torch.Tensor,
+        images: List[torch.Tensor],
         user_prompt: str,
-        doubao_api: DoubaoAPI,
-        doubao_config: DoubaoConfig,
-        system_prompt: str = "",
-        ignore_errors: bool = True,
-    ):
+        doubao_api: client.DoubaoAPI,
+        doubao_config: client.DoubaoConfig,
+        system_prompt: str,
+        ignore_errors: bool,
+        encode_options: Dict[str, Any],
+        on_delta: Optional[Callable[[str, str], None]] = None,
+        details: Optional[List[str]] = None,
+    ) -> Tuple[str, client.DoubaoUsage]:
         try:
             messages = []
 
             # Add system prompt (if provided)
             if system_prompt and system_prompt.strip():
                 messages.append(
-                    DoubaoMessage.create_text_message(
-                        MessageRole.system, system_prompt.strip()
+                    client.DoubaoMessage.create_text_message(
+                        client.MessageRole.system, system_prompt.strip()
                     )
                 )
 
-            # Convert image to base64
-            image_base64 = tensor_to_base64(image)
+            # Convert images to base64 in parallel (downscaled to the upload budget)
+            payloads, all_stats = client.encode_images(images, **encode_options)
+            for stats in all_stats:
+                if (
+                    stats
+                    and not stats.get("cache_hit")
+                    and stats["encoded_pixels"] != stats["original_pixels"]
+                ):
+                    print(
+                        "Doubao image resized: {}x{} ({:,} px, ~{:,} bytes) -> {}x{} ({:,} px, {:,} bytes)".format(
+                            *stats["original_size"],
+                            stats["original_pixels"],
+                            stats["estimated_original_payload_bytes"],
+                            *stats["encoded_size"],
+                            stats["encoded_pixels"],
+                            stats["payload_bytes"],
+                        )
+                    )
 
-            # Add user message (containing image and text)
+            # Add user message (containing images and text)
             messages.append(
-                DoubaoMessage.create_multimodal_message(
-                    MessageRole.user, user_prompt, image_base64
+                client.DoubaoMessage.create_multimodal_message(
+                    client.MessageRole.user,
+                    user_prompt,
+                    payloads,
+                    mime_type=IMAGE_FORMATS[encode_options["image_format"]],
+                    detail=details,
                 )
             )
 
             # Call API
-            response = doubao_api.chat_completions(messages, doubao_config)
-            return (response,)
+            return doubao_api.chat_completions_with_usage(
+                messages, doubao_config, on_delta=on_delta
+            )
         except Exception as e:
             if ignore_errors:
                 print(f"Doubao Vision API error (ignored): {str(e)}")
-                return ("",)
+                return "", client.DoubaoUsage(model=doubao_config.model)
+            else:
+                raise e
+
+    def vision_chat(
+        self,
+        image: torch.Tensor,
+        user_prompt: str,
+        doubao_api: client.DoubaoAPI,
+        doubao_config: client.DoubaoConfig,
+        system_prompt: str = "",
+        ignore_errors: bool = True,
+        batch_mode: bool = False,
+        max_concurrency: int = 4,
+        image_format: str = "JPEG",
+        image_quality: int = 95,
+        max_megapixels: float = -1.0,
+        max_side: int = 0,
+        multi_image: bool = False,
+        image_2: Optional[torch.Tensor] = None,
+        image_3: Optional[torch.Tensor] = None,
+        image_4: Optional[torch.Tensor] = None,
+        image_detail: str = "auto",
+        image_details: str = "",
+        max_payload_mb: float = 0.0,
+        unique_id: Optional[str] = None,
+    ):
+        images = client.split_image_batch(image)
+        for extra in (image_2, image_3, image_4):
+            if extra is not None:
+                images.extend(client.split_image_batch(extra))
+
+        details = [d.strip() or image_detail for d in image_details.split(",")]
+        details = (details + [image_detail] * len(images))[: len(images)]
+        for detail in details:
+            if detail not in IMAGE_DETAILS:
+                raise ValueError(
+                    f"Invalid image detail '{detail}', expected one of {IMAGE_DETAILS}"
+                )
+
+        # Default behaviour: only the first image of the batch is described
+        if multi_image:
+            groups = [list(range(len(images)))]
+        elif batch_mode:
+            groups = [[i] for i in range(len(images))]
+        else:
+            groups = [[0]]
+
+        encode_options = {
+            "image_format": image_format,
+            "quality": image_quality,
+            "max_pixels": client.resolve_max_pixels(doubao_config.model, max_megapixels),
+            "max_side": max_side,
+            "max_total_bytes": int(max_payload_mb * 1024 * 1024),
+            "max_workers": max_concurrency,
+        }
+
+        def describe(group, on_delta=None):
+            return self._describe_image(
+                [images[i] for i in group],
+                user_prompt,
+                doubao_api,
+                doubao_config,
+                system_prompt,
+                ignore_errors,
+                encode_options,
+                on_delta,
+                [details[i] for i in group],
+            )
+
+        if len(groups) == 1:
+            # Partial text is only pushed to the UI for single requests
+            results = [describe(groups[0], client.make_progress_callback(unique_id))]
+        else:
+            # Bounded fan-out: at most max_concurrency requests in flight,
+            # results are returned in the original batch order
+            workers = max(1, min(max_concurrency, len(groups)))
+            doubao_api = client.ensure_pool_size(doubao_api, workers)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Worker threads keep the call's cancel event (e.g. a DoubaoAwait timeout)
+                results = list(executor.map(client.with_call_context(describe), groups))
+
+        responses = [text for text, _ in results]
+        usage = functools.reduce(
+            client.DoubaoUsage.merge, (usage for _, usage in results), client.DoubaoUsage()
+        )
+        return ("\n".join(responses), responses, usage)
+
+
+class DoubaoVideoChatNode(DoubaoVisionChatNode):
+    """Doubao video / frame-sequence understanding node"""
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "frames": ("IMAGE", {"tooltip": "Video frames as an image batch"}),
+                "user_prompt": (
+                    "STRING",
+                    {
+                        "multiline": True,
+                        "default": "Please describe what happens in this video.",
+                        "tooltip": "User input prompt",
+                    },
+                ),
+                "doubao_api": ("DOUBAO_API",),
+                "doubao_config": ("DOUBAO_CONFIG",),
+            },
+            "optional": {
+                "system_prompt": (
+                    "STRING",
+                    {
+                        "multiline": True,
+                        "default": "You are a professional video analysis AI assistant. The images are keyframes of one video in chronological order.",
+                        "tooltip": "System prompt that defines AI's role and behavior",
+                    },
+                ),
+                "ignore_errors": (
+                    "BOOLEAN",
+                    {
+                        "default": True,
+                        "tooltip": "When enabled, API errors (timeout, network issues, etc.) will be ignored and return empty string instead of throwing exceptions",
+                    },
+                ),
+                "sampling": (
+                    SAMPLING_METHODS,
+                    {
+                        "default": "scene_change",
+                        "tooltip": "'uniform' spaces keyframes evenly, 'scene_change' cuts on luminance changes, 'phash' cuts on perceptual hash changes. Scene-based methods take the middle frame of each scene",
+                    },
+                ),
+                "max_frames": (
+                    "INT",
+                    {
+                        "default": 8,
+                        "min": 1,
+                        "max": 64,
+                        "step": 1,
+                        "tooltip": "Maximum number of keyframes sent in the request",
+                    },
+                ),
+                "scene_threshold": (
+                    "FLOAT",
+                    {
+                        "default": 0.2,
+                        "min": 0.0,
+                        "max": 1.0,
+                        "step": 0.01,
+                        "tooltip": "Minimum difference between consecutive frames counted as a scene cut (mean luminance change, or fraction of changed hash bits for phash)",
+                    },
+                ),
+                "fps": (
+                    "FLOAT",
+                    {
+                        "default": 0.0,
+                        "min": 0.0,
+                        "max": 240.0,
+                        "step": 0.01,
+                        "tooltip": "Frame rate of the clip. When set, keyframe timestamps are added to the prompt",
+                    },
+                ),
+                "max_total_megapixels": (
+                    "FLOAT",
+                    {
+                        "default": 4.0,
+                        "min": 0.1,
+                        "max": 64.0,
+                        "step": 0.1,
+                        "tooltip": "Pixel budget shared by all keyframes, each frame is downscaled to its share",
+                    },
+                ),
+                "image_format": (list(IMAGE_FORMATS.keys()), {"default": "JPEG"}),
+                "image_quality": (
+                    "INT",
+                    {"default": 90, "min": 1, "max": 100, "step": 1},
+                ),
+                "image_detail": (IMAGE_DETAILS, {"default": "auto"}),
+                "max_payload_mb": (
+                    "FLOAT",
+                    {
+                        "default": 0.0,
+                        "min": 0.0,
+                        "max": 256.0,
+                        "step": 0.5,
+                        "tooltip": "Total encoded image size per request. 0 disables the limit",
+                    },
+                ),
+            },
+            "hidden": {"unique_id": "UNIQUE_ID"},
+        }
+
+    RETURN_TYPES = ("STRING", "IMAGE", "STRING", "DOUBAO_USAGE")
+    RETURN_NAMES = ("response", "keyframes", "frame_indices", "usage")
+    OUTPUT_IS_LIST = (False, False, False, False)
+    FUNCTION = "video_chat"
+    CATEGORY = "Doubao LLM"
+
+    def video_chat(
+        self,
+        frames: torch.Tensor,
+        user_prompt: str,
+        doubao_api: client.DoubaoAPI,
+        doubao_config: client.DoubaoConfig,
+        system_prompt: str = "",
+        ignore_errors: bool = True,
+        sampling: str = "scene_change",
+        max_frames: int = 8,
+        scene_threshold: float = 0.2,
+        fps: float = 0.0,
+        max_total_megapixels: float = 4.0,
+        image_format: str = "JPEG",
+        image_quality: int = 90,
+        image_detail: str = "auto",
+        max_payload_mb: float = 0.0,
+        unique_id: Optional[str] = None,
+    ):
+        if len(frames.shape) == 3:
+            frames = frames[None]
+        if frames.shape[0] == 0:
+            raise ValueError("DoubaoVideoChat received no frames, connect a non-empty image batch")
+        indices = client.select_keyframes(frames, max_frames, sampling, scene_threshold)
+        keyframes = frames[indices]
+
+        # Keyframes share the pixel budget, capped by the model's per-image budget
+        max_pixels = min(
+            client.resolve_max_pixels(doubao_config.model),
+            int(max_total_megapixels * 1_000_000 / len(indices)),
+        )
+        encode_options = {
+            "image_format": image_format,
+            "quality": image_quality,
+            "max_pixels": max_pixels,
+            "max_side": 0,
+            "max_total_bytes": int(max_payload_mb * 1024 * 1024),
+        }
+
+        # Tell the model where the keyframes sit in the clip
+        if fps > 0:
+            timestamps = ", ".join(f"{i / fps:.2f}s" for i in indices)
+            context = f"Keyframes at {timestamps} of a {frames.shape[0] / fps:.2f}s video."
+        else:
+            context = f"{len(indices)} keyframes of a {frames.shape[0]}-frame video."
+        prompt = f"{context}\n{user_prompt}"
+
+        print(
+            f"Doubao video: {len(indices)}/{frames.shape[0]} frames selected ({sampling}): {indices}"
+        )
+        response, usage = self._describe_image(
+            [frames[i] for i in indices],
+            prompt,
+            doubao_api,
+            doubao_config,
+            system_prompt,
+            ignore_errors,
+            encode_options,
+            client.make_progress_callback(unique_id),
+            [image_detail] * len(indices),
+        )
+        return (response, keyframes, ",".join(str(i) for i in indices), usage)
+
+
+# How DoubaoConversation keeps a request within max_context_tokens
+TRUNCATION_POLICIES = ["sliding_window", "drop_old_images", "summarize"]
+
+
+class DoubaoConversationNode:
+    """Doubao multi-turn conversation node"""
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "user_prompt": (
+                    "STRING",
+                    {"multiline": True, "default": "", "tooltip": "User input for this turn"},
+                ),
+                "doubao_api": ("DOUBAO_API",),
+                "doubao_config": ("DOUBAO_CONFIG",),
+            },
+            "optional": {
+                "conversation": (
+                    "DOUBAO_CONVERSATION",
+                    {"tooltip": "History from a previous turn. Leave unconnected to start a new conversation"},
+                ),
+                "system_prompt": (
+                    "STRING",
+                    {
+                        "multiline": True,
+                        "default": "You are a helpful AI assistant.",
+                        "tooltip": "System prompt, only used when starting a new conversation",
+                    },
+                ),
+                "image": ("IMAGE", {"tooltip": "Optional image attached to this turn"}),
+                "max_context_tokens": (
+                    "INT",
+                    {
+                        "default": 0,
+                        "min": 0,
+                        "max": 1000000,
+                        "step": 256,
+                        "tooltip": "Estimated prompt token budget per request. Older turns are truncated by the truncation policy when exceeded. 0 sends the whole history",
+                    },
+                ),
+                "truncation": (
+                    TRUNCATION_POLICIES,
+                    {
+                        "default": "sliding_window",
+                        "tooltip": "'sliding_window' drops the oldest turns, 'drop_old_images' first removes images from earlier turns, 'summarize' replaces the oldest turns with a model-written summary",
+                    },
+                ),
+                "ignore_errors": (
+                    "BOOLEAN",
+                    {
+                        "default": True,
+                        "tooltip": "When enabled, API errors return an empty response and the conversation unchanged",
+                    },
+                ),
+                "image_format": (list(IMAGE_FORMATS.keys()), {"default": "JPEG"}),
+                "image_quality": (
+                    "INT",
+                    {"default": 95, "min": 1, "max": 100, "step": 1},
+                ),
+                "max_megapixels": (
+                    "FLOAT",
+                    {
+                        "default": -1.0,
+                        "min": -1.0,
+                        "max": 64.0,
+                        "step": 0.1,
+                        "tooltip": "Downscale images above this many megapixels before upload. -1 uses the model's default budget, 0 disables resizing",
+                    },
+                ),
+            },
+            "hidden": {"unique_id": "UNIQUE_ID"},
+        }
+
+    RETURN_TYPES = ("STRING", "DOUBAO_CONVERSATION", "DOUBAO_USAGE")
+    RETURN_NAMES = ("response", "conversation", "usage")
+    FUNCTION = "chat"
+    CATEGORY = "Doubao LLM"
+
+    @staticmethod
+    def _summarize(
+        conversation: client.DoubaoConversation,
+        count: int,
+        doubao_api: client.DoubaoAPI,
+        doubao_config: client.DoubaoConfig,
+    ) -> Tuple[str, client.DoubaoUsage]:
+        """Fold the first count messages (and any earlier summary) into a summary"""
+        lines = [f"Earlier summary: {conversation.summary}"] if conversation.summary else []
+        for message in conversation.messages[:count]:
+            text = " ".join(
+                part["text"] if part.get("type") == "text" else client.IMAGE_PLACEHOLDER
+                for part in message.content
+            )
+            lines.append(f"{message.role.value}: {text}")
+        messages = [
+            client.DoubaoMessage.create_text_message(
+                client.MessageRole.system,
+                "Summarize the following conversation in a few sentences. Keep facts, names, decisions and open questions.",
+            ),
+            client.DoubaoMessage.create_text_message(client.MessageRole.user, "\n".join(lines)),
+        ]
+        config = doubao_config.copy(
+            update={"stream": False, "max_tokens": min(doubao_config.max_tokens, 500)}
+        )
+        return doubao_api.chat_completions_with_usage(messages, config)
+
+    def chat(
+        self,
+        user_prompt: str,
+        doubao_api: client.DoubaoAPI,
+        doubao_config: client.DoubaoConfig,
+        conversation: Optional[client.DoubaoConversation] = None,
+        system_prompt: str = "",
+        image: Optional[torch.Tensor] = None,
+        max_context_tokens: int = 0,
+        truncation: str = "sliding_window",
+        ignore_errors: bool = True,
+        image_format: str = "JPEG",
+        image_quality: int = 95,
+        max_megapixels: float = -1.0,
+        unique_id: Optional[str] = None,
+    ):
+        if conversation is None:
+            conversation = client.DoubaoConversation(system_prompt=system_prompt or "")
+
+        usage = client.DoubaoUsage(model=doubao_config.model)
+        try:
+            user_message = client.DoubaoMessage.create_text_message(client.MessageRole.user, user_prompt)
+            if image is not None:
+                image_base64 = client.tensor_to_base64(
+                    image,
+                    image_format,
+                    image_quality,
+                    max_pixels=client.resolve_max_pixels(doubao_config.model, max_megapixels),
+                )
+                candidate = client.DoubaoMessage.create_multimodal_message(
+                    client.MessageRole.user,
+                    user_prompt,
+                    image_base64,
+                    mime_type=IMAGE_FORMATS[image_format],
+                )
+                # The same image connected on every turn is only sent again
+                # once the turn carrying it no longer fits in the context
+                history, _ = conversation.build_messages(
+                    [user_message], max_context_tokens, truncation
+                )
+                if not conversation.contains_image(
+                    history, candidate.content[1]["image_url"]["url"]
+                ):
+                    user_message = candidate
+
+            messages, dropped = conversation.build_messages(
+                [user_message], max_context_tokens, truncation
+            )
+            if dropped and truncation == "summarize":
+                summary, summary_usage = self._summarize(
+                    conversation, dropped, doubao_api, doubao_config
+                )
+                usage = usage.merge(summary_usage)
+                conversation = conversation.summarized(dropped, summary)
+                messages, dropped = conversation.build_messages(
+                    [user_message], max_context_tokens, truncation
+                )
+            if dropped:
+                print(f"Doubao conversation truncated: {dropped} earlier messages not sent")
+
+            response, turn_usage = doubao_api.chat_completions_with_usage(
+                messages, doubao_config, on_delta=client.make_progress_callback(unique_id)
+            )
+            usage = usage.merge(turn_usage)
+        except Exception as e:
+            if ignore_errors:
+                print(f"Doubao API error (ignored): {str(e)}")
+                return ("", conversation, usage)
             else:
                 raise e
 
+        conversation = conversation.append(
+            user_message,
+            client.DoubaoMessage.create_text_message(client.MessageRole.assistant, response),
+        )
+        return (response, conversation, usage)
+
+
+class DoubaoTextChatAsyncNode(DoubaoTextChatNode):
+    """Doubao text chat node that returns immediately with a DOUBAO_FUTURE"""
+
+    RETURN_TYPES = ("DOUBAO_FUTURE",)
+    RETURN_NAMES = ("future",)
+    OUTPUT_IS_LIST = (False,)
+    FUNCTION = "submit"
+
+    def submit(self, **kwargs):
+        return (
+            client.DoubaoFuture(
+                functools.partial(self.chat, **kwargs), DoubaoTextChatNode.RETURN_NAMES
+            ),
+        )
+
+
+class DoubaoVisionChatAsyncNode(DoubaoVisionChatNode):
+    """Doubao vision chat node that returns immediately with a DOUBAO_FUTURE"""
+
+    RETURN_TYPES = ("DOUBAO_FUTURE",)
+    RETURN_NAMES = ("future",)
+    OUTPUT_IS_LIST = (False,)
+    FUNCTION = "submit"
+
+    def submit(self, **kwargs):
+        return (
+            client.DoubaoFuture(
+                functools.partial(self.vision_chat, **kwargs),
+                DoubaoVisionChatNode.RETURN_NAMES,
+            ),
+        )
+
+
+class DoubaoAwaitNode:
+    """Wait for a DOUBAO_FUTURE and output its result"""
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "future": ("DOUBAO_FUTURE",),
+            },
+            "optional": {
+                "timeout": (
+                    "FLOAT",
+                    {
+                        "default": 0.0,
+                        "min": 0.0,
+                        "max": 3600.0,
+                        "step": 1.0,
+                        "tooltip": "Seconds to wait before failing and cancelling the call's requests. 0 waits until the call finishes",
+                    },
+                ),
+            },
+        }
+
+    RETURN_TYPES = ("STRING", "STRING", "DOUBAO_USAGE")
+    RETURN_NAMES = ("response", "responses", "usage")
+    OUTPUT_IS_LIST = (False, True, False)
+    FUNCTION = "wait"
+    CATEGORY = "Doubao LLM"
+
+    @staticmethod
+    def _check_interrupted():
+        try:
+            import comfy.model_management
+        except ImportError:
+            # Not running inside ComfyUI
+            return
+        comfy.model_management.throw_exception_if_processing_interrupted()
+
+    def wait(self, future: client.DoubaoFuture, timeout: float = 0.0):
+        start = time.monotonic()
+        # Poll so that a ComfyUI interrupt is noticed while waiting
+        while not future.done():
+            self._check_interrupted()
+            if timeout and time.monotonic() - start >= timeout:
+                future.cancel()
+                raise TimeoutError(f"Doubao call did not finish within {timeout:.0f}s")
+            time.sleep(0.05)
+
+        result = future.result()
+        waited = time.monotonic() - start
+        took = (future.finished_at or time.monotonic()) - future.submitted_at
+        print(f"Doubao await: call took {took:.2f}s, blocked {waited:.2f}s")
+        return (result["response"], result["responses"], result["usage"])
+
+
+class DoubaoUsageNode:
+    """Doubao token usage / timing breakdown node"""
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "usage": ("DOUBAO_USAGE",),
+            },
+        }
+
+    RETURN_TYPES = ("INT", "INT", "INT", "INT", "FLOAT", "STRING")
+    RETURN_NAMES = (
+        "prompt_tokens",
+        "completion_tokens",
+        "reasoning_tokens",
+        "total_tokens",
+        "total_seconds",
+        "summary",
+    )
+    FUNCTION = "get_usage"
+    CATEGORY = "Doubao LLM"
+
+    def get_usage(self, usage: client.DoubaoUsage):
+        return (
+            usage.prompt_tokens,
+            usage.completion_tokens,
+            usage.reasoning_tokens,
+            usage.total_tokens,
+            usage.total_seconds,
+            json.dumps(usage.dict(), ensure_ascii=False),
+        )
+
 
 # Node mappings
 NODE_CLASS_MAPPINGS = {
     "DoubaoAPI": DoubaoAPINode,
+    "DoubaoAPIPool": DoubaoAPIPoolNode,
     "DoubaoConfig": DoubaoConfigNode,
     "DoubaoTextChat": DoubaoTextChatNode,
     "DoubaoVisionChat": DoubaoVisionChatNode,
+    "DoubaoVideoChat": DoubaoVideoChatNode,
+    "DoubaoConversation": DoubaoConversationNode,
+    "DoubaoTextChatAsync": DoubaoTextChatAsyncNode,
+    "DoubaoVisionChatAsync": DoubaoVisionChatAsyncNode,
+    "DoubaoAwait": DoubaoAwaitNode,
+    "DoubaoUsage": DoubaoUsageNode,
 }
 
 # Node display names
 NODE_DISPLAY_NAME_MAPPINGS = {
     "DoubaoAPI": "Doubao API",
+    "DoubaoAPIPool": "Doubao API Pool",
     "DoubaoConfig": "Doubao Config",
     "DoubaoTextChat": "Doubao Text Chat",
     "DoubaoVisionChat": "Doubao Vision Chat",
-}
+    "DoubaoVideoChat": "Doubao Video Chat",
+    "DoubaoConversation": "Doubao Conversation",
+    "DoubaoTextChatAsync": "Doubao Text Chat (Async)",
+    "DoubaoVisionChatAsync": "Doubao Vision Chat (Async)",
+    "DoubaoAwait": "Doubao Await",
+    "DoubaoUsage": "Doubao Usage",
+}
\ No newline at end of file
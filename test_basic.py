@@ -19,6 +19,25 @@ from nodes import (
     DoubaoMessage, 
     MessageRole,
     DoubaoAPI,
+    get_shared_session,
+    parse_sse_events,
+    ResponseCache,
+    encode_image,
+    tensor_to_uint8,
+    fit_image_size,
+    resolve_max_pixels,
+    DEFAULT_VISION_MAX_PIXELS,
+    AsyncDoubaoAPI,
+    RateLimiter,
+    get_rate_limiter,
+    estimate_prompt_tokens,
+    RetryPolicy,
+    DoubaoAPIError,
+    get_retry_stats,
+    DoubaoUsage,
+    METRICS,
+    split_prompts,
+    DoubaoConversation,
     doubao_models,
     doubao_vision_models,
     NODE_CLASS_MAPPINGS,
@@ -155,9 +174,16 @@ def test_node_mappings():
     
     expected_nodes = [
         "DoubaoAPI",
+        "DoubaoAPIPool",
         "DoubaoConfig", 
         "DoubaoTextChat",
-        "DoubaoVisionChat"
+        "DoubaoVisionChat",
+        "DoubaoVideoChat",
+        "DoubaoConversation",
+        "DoubaoTextChatAsync",
+        "DoubaoVisionChatAsync",
+        "DoubaoAwait",
+        "DoubaoUsage",
     ]
     
     for node in expected_nodes:
@@ -175,7 +201,8 @@ def test_node_input_types():
     api_node = NODE_CLASS_MAPPINGS["DoubaoAPI"]
     input_types = api_node.INPUT_TYPES()
     assert "required" in input_types
-    # DoubaoAPI节点没有optional字段，这是正常的
+    assert "optional" in input_types
+    assert "pool_maxsize" in input_types["optional"]
     print("✓ DoubaoAPI输入类型定义正确")
     
     # 测试DoubaoConfig节点
@@ -251,6 +278,1474 @@ def test_seed_parameter():
         assert config_without_seed.seed is None
         print("✓ 无seed参数配置正确")
 
+def test_session_pool():
+    """测试连接池复用"""
+    print("\n测试连接池...")
+    
+    # 相同端点的多个客户端应共享同一个会话
+    api1 = DoubaoAPI(api_key="test_key", endpoint="https://test.com")
+    api2 = DoubaoAPI(api_key="other_key", endpoint="https://test.com/")
+    assert api1.session is api2.session
+    print("✓ 相同端点共享会话")
+    
+    # 不同端点或不同连接池配置应使用不同会话
+    api3 = DoubaoAPI(api_key="test_key", endpoint="https://other.com")
+    api4 = DoubaoAPI(api_key="test_key", endpoint="https://test.com", pool_maxsize=32)
+    assert api1.session is not api3.session
+    assert api1.session is not api4.session
+    adapter = api4.session.get_adapter("https://test.com")
+    assert adapter._pool_maxsize == 32
+    print("✓ 不同配置使用独立会话")
+    
+    # 多线程并发获取同一会话
+    import threading
+    sessions = []
+    threads = [
+        threading.Thread(target=lambda: sessions.append(get_shared_session("https://threads.com")))
+        for _ in range(8)
+    ]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert all(s is sessions[0] for s in sessions)
+    print("✓ 多线程共享会话测试通过")
+
+def test_vision_batch_mode():
+    """测试视觉节点批量模式"""
+    print("\n测试视觉批量模式...")
+    import threading
+    import numpy as np
+    import doubao_client
+    
+    # 8张图片、8个并发：编码和发送都要等全部8个调用同时到达才放行，串行执行会超时失败
+    encode_barrier = threading.Barrier(8, timeout=5)
+    send_barrier = threading.Barrier(8, timeout=5)
+    
+    def fake_encode(t, **kwargs):
+        encode_barrier.wait()
+        return str(int(t[0, 0, 0]))
+    
+    class FakeAPI:
+        def __init__(self, barrier=None):
+            self.barrier = barrier
+        
+        def chat_completions_with_usage(self, messages, config, **kwargs):
+            if self.barrier:
+                self.barrier.wait()
+            usage = DoubaoUsage(requests=1, prompt_tokens=10, total_tokens=15)
+            return messages[-1].content[1]["image_url"]["url"].split(",")[1], usage
+    
+    # 用图片的像素值作为"描述"，以验证返回顺序
+    batch = np.arange(8).reshape(8, 1, 1, 1) * np.ones((8, 2, 2, 3))
+    node = NODE_CLASS_MAPPINGS["DoubaoVisionChat"]()
+    with patch.object(doubao_client, "tensor_to_base64", lambda t, **kwargs: str(int(t[0, 0, 0]))):
+        # 默认只处理第一张图片
+        joined, responses, usage = node.vision_chat(batch, "describe", FakeAPI(), DoubaoConfig())
+        assert responses == ["0"]
+        print("✓ 默认只处理第一张图片")
+    
+    with patch.object(doubao_client, "tensor_to_base64", fake_encode):
+        joined, responses, usage = node.vision_chat(
+            batch, "describe", FakeAPI(send_barrier), DoubaoConfig(),
+            batch_mode=True, max_concurrency=8
+        )
+    assert responses == [str(i) for i in range(8)]
+    assert joined == "\n".join(responses)
+    assert usage.requests == 8 and usage.total_tokens == 120
+    print("✓ 批量编码与请求并发执行并保持原始顺序")
+
+def test_streaming():
+    """测试流式响应解析"""
+    print("\n测试流式响应...")
+    import json
+    
+    # SSE解析：多行data、注释行、[DONE]结束标记
+    lines = [
+        b": keep-alive",
+        b'data: {"choices": [{"delta": {"content": "Hel"}}]}',
+        b"",
+        b'data: {"choices": [{"delta": {"content": "lo"}}]}',
+        b"",
+        b"data: [DONE]",
+        b"",
+        b'data: {"choices": [{"delta": {"content": "ignored"}}]}',
+    ]
+    events = list(parse_sse_events(lines))
+    assert len(events) == 2
+    assert events[1]["choices"][0]["delta"]["content"] == "lo"
+    print("✓ SSE事件解析测试通过")
+    
+    class FakeResponse:
+        def __init__(self, lines):
+            self.lines = lines
+        def __enter__(self):
+            return self
+        def __exit__(self, *args):
+            return False
+        def raise_for_status(self):
+            pass
+        def iter_lines(self):
+            return iter(self.lines)
+    
+    chunks = ["思考", "完成", "。"]
+    sse_lines = []
+    for chunk in chunks:
+        event = {"choices": [{"delta": {"content": chunk}}]}
+        sse_lines += [("data: " + json.dumps(event)).encode("utf-8"), b""]
+    sse_lines += [b"data: [DONE]", b""]
+    
+    fake_session = Mock()
+    fake_session.post.return_value = FakeResponse(sse_lines)
+    api = DoubaoAPI(api_key="test_key", endpoint="https://test.com")
+    with patch.object(DoubaoAPI, "session", fake_session):
+        deltas = []
+        text = api.chat_completions(
+            [DoubaoMessage.create_text_message(MessageRole.user, "hi")],
+            DoubaoConfig(stream=True),
+            on_delta=lambda delta, so_far: deltas.append((delta, so_far)),
+        )
+    assert text == "思考完成。"
+    assert deltas[-1] == ("。", "思考完成。")
+    assert fake_session.post.call_args.kwargs["stream"] is True
+    assert json.loads(b"".join(fake_session.post.call_args.kwargs["data"]))["stream"] is True
+    print("✓ 流式增量输出测试通过")
+
+def test_response_cache():
+    """测试磁盘响应缓存"""
+    print("\n测试响应缓存...")
+    import tempfile
+    import time
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(os.path.join(tmp, "responses.sqlite"), max_bytes=100)
+        
+        # 缓存键对字段顺序稳定，且与stream无关
+        key = ResponseCache.make_key({"model": "m", "messages": [], "seed": 1, "stream": False})
+        assert key == ResponseCache.make_key({"seed": 1, "stream": True, "messages": [], "model": "m"})
+        assert key != ResponseCache.make_key({"model": "m", "messages": [], "seed": 2})
+        print("✓ 缓存键稳定性测试通过")
+        
+        assert cache.get(key) is None
+        cache.put(key, "cached response")
+        assert cache.get(key) == "cached response"
+        assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+        print("✓ 命中/未命中计数测试通过")
+        
+        # 超出容量时淘汰最久未使用的条目
+        cache.put("a", "x" * 40)
+        cache.put("b", "y" * 40)
+        cache.get("a")
+        cache.put("c", "z" * 40)
+        assert cache.get("a") is not None
+        assert cache.get("b") is None
+        assert cache.stats()["bytes"] <= 100
+        print("✓ 容量淘汰测试通过")
+        
+        # 过期条目不再返回
+        cache.ttl_seconds = 0.01
+        time.sleep(0.02)
+        assert cache.get("a") is None
+        print("✓ TTL过期测试通过")
+        
+        # 仅在固定seed或always模式下启用缓存
+        cache.ttl_seconds = 3600
+        api = DoubaoAPI(api_key="test_key", response_cache=cache, cache_mode="when_seeded")
+        messages = [DoubaoMessage.create_text_message(MessageRole.user, "hi")]
+        with patch.object(DoubaoAPI, "_chat_completions", return_value="fresh") as call:
+            assert api.chat_completions(messages, DoubaoConfig(seed=7)) == "fresh"
+            assert api.chat_completions(messages, DoubaoConfig(seed=7)) == "fresh"
+            assert call.call_count == 1
+            api.chat_completions(messages, DoubaoConfig())
+            api.chat_completions(messages, DoubaoConfig())
+            assert call.call_count == 3
+            api.cache_mode = "always"
+            api.chat_completions(messages, DoubaoConfig())
+            api.chat_completions(messages, DoubaoConfig())
+            assert call.call_count == 4
+        print("✓ 缓存启用条件测试通过")
+
+def test_image_encoding():
+    """测试图像编码"""
+    print("\n测试图像编码...")
+    from io import BytesIO
+    import numpy as np
+    from PIL import Image
+    
+    # 浮点图像按 [0, 1] 缩放并四舍五入，超出范围的值被截断
+    image = np.array([[[0.0, 0.5, 1.0], [-0.2, 1.3, 0.002]]], dtype=np.float32)
+    array = tensor_to_uint8(image)
+    assert array.dtype == np.uint8
+    assert array.tolist() == [[[0, 128, 255], [0, 255, 1]]]
+    print("✓ 缩放/截断/类型转换测试通过")
+    
+    # RGBA去除alpha通道，灰度图扩展为RGB
+    assert tensor_to_uint8(np.zeros((2, 2, 4), dtype=np.float32)).shape == (2, 2, 3)
+    assert tensor_to_uint8(np.zeros((2, 2, 1), dtype=np.float32)).shape == (2, 2, 3)
+    print("✓ 通道处理测试通过")
+    
+    rng = np.random.default_rng(0)
+    image = rng.random((16, 24, 3), dtype=np.float32)
+    for image_format, pil_format in [("JPEG", "JPEG"), ("webp", "WEBP"), ("PNG", "PNG")]:
+        decoded = Image.open(BytesIO(encode_image(image, image_format, 90)))
+        assert decoded.format == pil_format
+        assert decoded.size == (24, 16)
+    decoded = np.asarray(Image.open(BytesIO(encode_image(image, "PNG"))))
+    assert (decoded == tensor_to_uint8(image)).all()
+    print("✓ JPEG/WebP/PNG编码测试通过")
+    
+    try:
+        encode_image(image, "GIF")
+        assert False, "应该抛出异常"
+    except ValueError:
+        pass
+    print("✓ 不支持格式校验测试通过")
+
+def test_image_downscale():
+    """测试上传前图像缩放"""
+    print("\n测试图像缩放...")
+    from io import BytesIO
+    import numpy as np
+    from PIL import Image
+    
+    # 保持宽高比，同时满足像素和最长边限制
+    assert fit_image_size(3840, 2160) == (3840, 2160)
+    assert fit_image_size(3840, 2160, max_side=1920) == (1920, 1080)
+    width, height = fit_image_size(3840, 2160, max_pixels=2048 * 2048)
+    assert width * height <= 2048 * 2048 and abs(width / height - 16 / 9) < 0.01
+    assert fit_image_size(800, 600, max_pixels=2048 * 2048, max_side=1024) == (800, 600)
+    print("✓ 尺寸计算测试通过")
+    
+    # 每个视觉模型都有默认像素预算，Endpoint ID使用全局默认值
+    for model in doubao_vision_models:
+        assert resolve_max_pixels(model) > 0
+    assert resolve_max_pixels("ep-20241201-xxxxxx") == DEFAULT_VISION_MAX_PIXELS
+    assert resolve_max_pixels("ep-20241201-xxxxxx", 0) == 0
+    assert resolve_max_pixels("ep-20241201-xxxxxx", 1.5) == 1_500_000
+    print("✓ 模型默认像素预算测试通过")
+    
+    image = np.random.default_rng(0).random((300, 400, 3), dtype=np.float32)
+    stats = {}
+    encoded = encode_image(image, "JPEG", max_side=200, stats=stats)
+    assert Image.open(BytesIO(encoded)).size == (200, 150)
+    assert stats["original_pixels"] == 120000
+    assert stats["encoded_pixels"] == 30000
+    assert stats["payload_bytes"] == len(encoded)
+    assert stats["estimated_original_payload_bytes"] > len(encoded)
+    print("✓ 编码前缩放及统计测试通过")
+
+def test_async_client():
+    """测试异步客户端"""
+    print("\n测试异步客户端...")
+    import asyncio
+    import threading
+    import time
+    from nodes import DoubaoAPIPool, PoolBackend
+    
+    in_flight = [0]
+    peak = [0]
+    lock = threading.Lock()
+    
+    def fake_call(messages, config, on_delta=None):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.1)
+        with lock:
+            in_flight[0] -= 1
+        if messages[0].content[0]["text"] == "fail":
+            raise Exception("boom")
+        return messages[0].content[0]["text"].upper()
+    
+    client = AsyncDoubaoAPI(api_key="test_key", max_concurrency=4)
+    assert client.api.pool_maxsize == 4
+    assert client.api.session is DoubaoAPI(api_key="k", pool_maxsize=4).session
+    # 包装的客户端连接池小于并发上限时扩大，避免连接反复丢弃重建
+    small = DoubaoAPI(api_key="test_key", pool_maxsize=2)
+    wrapped = AsyncDoubaoAPI(small, max_concurrency=32)
+    assert small.pool_maxsize == 2 and wrapped.api.pool_maxsize == 32
+    assert wrapped.api.rate_limiter is small.rate_limiter
+    wrapped.close()
+    large = DoubaoAPI(api_key="test_key", pool_maxsize=64)
+    assert AsyncDoubaoAPI(large, max_concurrency=32).api is large
+    pool = DoubaoAPIPool([PoolBackend(small), PoolBackend(large)])
+    resized = pool.with_pool_size(32)
+    assert [b.api.pool_maxsize for b in resized.backends] == [32, 64]
+    assert resized.backends[0].health is pool.backends[0].health
+    print("✓ 与同步客户端共享连接池")
+    
+    prompts = ["p%d" % i for i in range(8)]
+    batch = [
+        ([DoubaoMessage.create_text_message(MessageRole.user, p)], DoubaoConfig())
+        for p in prompts
+    ]
+    with patch.object(client.api, "chat_completions", side_effect=fake_call):
+        start = time.time()
+        results = client.run_many(batch)
+        elapsed = time.time() - start
+        assert results == [p.upper() for p in prompts]
+        assert peak[0] == 4
+        assert elapsed < 0.5
+        print(f"✓ 并发上限及结果顺序测试通过 ({elapsed:.2f}s)")
+        
+        # 单个失败不影响其他请求
+        batch.append(([DoubaoMessage.create_text_message(MessageRole.user, "fail")], DoubaoConfig()))
+        results = client.run_many(batch, return_exceptions=True)
+        assert isinstance(results[-1], Exception)
+        assert results[0] == "P0"
+        
+        # 在已有事件循环中调用
+        async def inside_loop():
+            return client.run_many(batch[:2])
+        assert asyncio.run(inside_loop()) == ["P0", "P1"]
+        print("✓ 异常返回及事件循环内调用测试通过")
+    client.close()
+
+def test_rate_limiter():
+    """测试客户端限流"""
+    print("\n测试客户端限流...")
+    import threading
+    import time
+    
+    # 相同API密钥和端点共享同一个限流器
+    limiter = get_rate_limiter("key-a", "https://test.com", 60, 0)
+    assert get_rate_limiter("key-a", "https://test.com/", 60, 0) is limiter
+    assert get_rate_limiter("key-b", "https://test.com", 60, 0) is not limiter
+    print("✓ 限流器共享测试通过")
+    
+    # token预估：文本按字节估算，图片按固定值估算
+    messages = [
+        DoubaoMessage.create_text_message(MessageRole.system, "a" * 300),
+        DoubaoMessage.create_multimodal_message(MessageRole.user, "描述", "data"),
+    ]
+    assert estimate_prompt_tokens(messages) == 101 + 3 + 1000
+    print("✓ token预估测试通过")
+    
+    # 每分钟6000 token（100/s）：用完后下一个请求排队等待而不是失败
+    limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=6000)
+    assert limiter.acquire(6000) < 0.05
+    
+    depth = []
+    thread = threading.Thread(target=lambda: depth.append(limiter.acquire(50)))
+    thread.start()
+    time.sleep(0.1)
+    assert limiter.stats()["queue_depth"] == 1
+    thread.join()
+    assert 0.3 < depth[0] < 1.0
+    stats = limiter.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["requests"] == 2
+    assert stats["max_wait_seconds"] >= depth[0]
+    print(f"✓ 超出预算排队等待测试通过 ({depth[0]:.2f}s)")
+    
+    # 每分钟600个请求（10/s）
+    limiter = RateLimiter(requests_per_minute=600)
+    for _ in range(600):
+        limiter.acquire()
+    assert 0.05 < limiter.acquire() < 0.3
+    print("✓ 请求数限流测试通过")
+
+def test_retry_policy():
+    """测试重试策略"""
+    print("\n测试重试策略...")
+    import requests
+    
+    # 指数退避 + 抖动，Retry-After优先
+    policy = RetryPolicy(backoff_base=1.0, backoff_max=8.0, jitter=0.5)
+    for attempt, upper in [(1, 1.0), (2, 2.0), (3, 4.0), (6, 8.0)]:
+        delay = policy.get_delay(attempt)
+        assert upper / 2 <= delay <= upper
+    assert policy.get_delay(1, retry_after=5.0) == 5.0
+    assert policy.get_delay(1, retry_after=1000.0) == policy.max_retry_after
+    print("✓ 退避时间计算测试通过")
+    
+    def http_error(status, headers=None):
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers or {})
+        return requests.exceptions.HTTPError(f"{status} error", response=response)
+    
+    # 错误分类
+    error = policy.classify(http_error(429, {"Retry-After": "3"}))
+    assert error.retryable and error.retry_after == 3.0 and error.status_code == 429
+    assert policy.classify(http_error(503)).retryable
+    assert not policy.classify(http_error(401)).retryable
+    assert policy.classify(requests.exceptions.ConnectTimeout()).retryable
+    assert policy.classify(requests.exceptions.ReadTimeout()).retryable
+    assert not RetryPolicy(retry_on_read_timeout=False).classify(
+        requests.exceptions.ReadTimeout()
+    ).retryable
+    print("✓ 错误分类测试通过")
+    
+    # 可重试错误重试后成功，并记录重试次数
+    api = DoubaoAPI(api_key="test_key", retry_policy=RetryPolicy(backoff_base=0.01))
+    assert api.timeout == (10.0, 60.0)
+    messages = [DoubaoMessage.create_text_message(MessageRole.user, "hi")]
+    before = get_retry_stats().get("http_503", 0)
+    failures = [DoubaoAPIError("busy", 503, retryable=True, reason="http_503")] * 2
+    with patch.object(DoubaoAPI, "_request_completion", side_effect=failures + ["ok"]) as call:
+        assert api.chat_completions(messages, DoubaoConfig()) == "ok"
+        assert call.call_count == 3
+    assert get_retry_stats()["http_503"] == before + 2
+    print("✓ 重试成功测试通过")
+    
+    # 超过最大次数或不可重试错误直接抛出
+    with patch.object(DoubaoAPI, "_request_completion", side_effect=failures * 2) as call:
+        try:
+            api.chat_completions(messages, DoubaoConfig())
+            assert False, "应该抛出异常"
+        except DoubaoAPIError:
+            assert call.call_count == 3
+    with patch.object(
+        DoubaoAPI, "_request_completion", side_effect=DoubaoAPIError("bad", 400)
+    ) as call:
+        try:
+            api.chat_completions(messages, DoubaoConfig())
+            assert False, "应该抛出异常"
+        except DoubaoAPIError:
+            assert call.call_count == 1
+    print("✓ 重试上限及不可重试错误测试通过")
+
+def test_metrics():
+    """测试延迟与token用量统计"""
+    print("\n测试用量统计...")
+    import json
+    import tempfile
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            body = json.dumps({
+                "choices": [{"message": {"content": "ok"}}],
+                "usage": {
+                    "prompt_tokens": 12,
+                    "completion_tokens": 30,
+                    "total_tokens": 42,
+                    "completion_tokens_details": {"reasoning_tokens": 20},
+                    "prompt_tokens_details": {"cached_tokens": 8},
+                },
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    METRICS.reset()
+    try:
+        api = DoubaoAPI(api_key="test_key", endpoint=f"http://127.0.0.1:{server.server_port}")
+        messages = [DoubaoMessage.create_text_message(MessageRole.user, "hi")]
+        text, usage = api.chat_completions_with_usage(messages, DoubaoConfig())
+        assert text == "ok"
+        assert (usage.prompt_tokens, usage.completion_tokens, usage.total_tokens) == (12, 30, 42)
+        assert usage.reasoning_tokens == 20 and usage.cached_tokens == 8
+        assert usage.request_bytes > 0 and usage.response_bytes > 0
+        assert usage.connect_seconds > 0
+        assert usage.total_seconds >= usage.ttfb_seconds > 0
+        print("✓ 单次调用用量及耗时测试通过")
+        
+        # 长连接复用时不再产生连接耗时
+        _, usage = api.chat_completions_with_usage(messages, DoubaoConfig())
+        assert usage.connect_seconds == 0
+        print("✓ 长连接复用测试通过")
+    finally:
+        server.shutdown()
+        server.server_close()
+    
+    assert METRICS.get_counter("doubao_requests_total", model=DoubaoConfig().model, status="ok") == 2
+    assert METRICS.get_histogram("doubao_request_seconds", phase="total").count == 2
+    text = METRICS.to_prometheus()
+    assert "# TYPE doubao_request_seconds histogram" in text
+    assert 'doubao_tokens_total{kind="completion",model="%s"} 60' % DoubaoConfig().model in text
+    assert 'doubao_request_seconds_bucket{phase="total",le="+Inf"} 2' in text
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "metrics.jsonl")
+        assert METRICS.export_jsonl(path) == 2
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        assert records[0]["total_tokens"] == 42 and records[0]["status"] == "ok"
+    print("✓ Prometheus/JSONL导出测试通过")
+    
+    # 批量用量汇总与用量节点
+    total = DoubaoUsage(prompt_tokens=1, requests=1).merge(DoubaoUsage(prompt_tokens=2, requests=1))
+    assert total.prompt_tokens == 3 and total.requests == 2
+    outputs = NODE_CLASS_MAPPINGS["DoubaoUsage"]().get_usage(usage)
+    assert outputs[:4] == (12, 30, 20, 42)
+    assert json.loads(outputs[5])["cached_tokens"] == 8
+    print("✓ 用量节点测试通过")
+
+def test_mock_server():
+    """测试本地模拟服务"""
+    print("\n测试本地模拟服务...")
+    from mock_server import MockArkServer, make_latency_sampler
+    import random
+    
+    rng = random.Random(0)
+    assert make_latency_sampler("fixed:0.5", rng)() == 0.5
+    assert 0.1 <= make_latency_sampler("uniform:0.1,0.2", rng)() <= 0.2
+    assert make_latency_sampler("lognormal:0.3,0.5", rng)() > 0
+    assert {make_latency_sampler("tail:0.1,2,0.5", rng)() for _ in range(50)} == {0.1, 2.0}
+    print("✓ 延迟分布解析测试通过")
+    
+    messages = [DoubaoMessage.create_text_message(MessageRole.user, "hello mock")]
+    with MockArkServer(latency="fixed:0.01") as server:
+        api = DoubaoAPI(api_key="mock-key", endpoint=server.url)
+        text, usage = api.chat_completions_with_usage(messages, DoubaoConfig())
+        assert text == "mock reply to: hello mock"
+        assert usage.completion_tokens > 0
+        
+        deltas = []
+        text, usage = api.chat_completions_with_usage(
+            messages, DoubaoConfig(stream=True), on_delta=lambda d, so_far: deltas.append(d)
+        )
+        assert text == "mock reply to: hello mock"
+        assert len(deltas) > 1 and usage.total_tokens > 0
+    print("✓ 流式与非流式响应测试通过")
+    
+    # 429突发期间按Retry-After重试，突发结束后成功
+    with MockArkServer(burst_429_every=100, burst_429_duration=0.3, retry_after=0.4) as server:
+        api = DoubaoAPI(api_key="mock-key", endpoint=server.url)
+        text, usage = api.chat_completions_with_usage(messages, DoubaoConfig())
+        assert text.startswith("mock reply")
+        assert usage.attempts == 2
+        assert server.stats["429"] == 1
+    print("✓ 429突发与重试测试通过")
+
+def test_text_batch_prompts():
+    """测试文本节点多提示词批量模式"""
+    print("\n测试多提示词批量模式...")
+    import time
+    
+    assert split_prompts("a\n\n b \n", "lines") == ["a", "b"]
+    assert split_prompts('"x"\n{"prompt": "y"}\n{"user_prompt": "z"}', "jsonl") == ["x", "y", "z"]
+    assert split_prompts("a\nb", "single") == ["a\nb"]
+    try:
+        split_prompts("{bad", "jsonl")
+        assert False, "应该抛出异常"
+    except ValueError as e:
+        assert "line 1" in str(e)
+    print("✓ 提示词拆分测试通过")
+    
+    class FakeAPI:
+        def chat_completions_with_usage(self, messages, config, on_delta=None):
+            time.sleep(0.1)
+            prompt = messages[-1].content[0]["text"]
+            if prompt == "fail":
+                raise Exception("boom")
+            assert messages[0].content[0]["text"] == "shared system"
+            return prompt.upper(), DoubaoUsage(requests=1, total_tokens=5)
+    
+    node = NODE_CLASS_MAPPINGS["DoubaoTextChat"]()
+    prompts = "\n".join(["p%d" % i for i in range(20)] + ["fail"])
+    start = time.time()
+    response, responses, errors, usage = node.chat(
+        [prompts], [FakeAPI()], [DoubaoConfig()],
+        system_prompt=["shared system"], prompt_mode=["lines"], max_concurrency=[10],
+    )
+    elapsed = time.time() - start
+    assert responses[:20] == ["P%d" % i for i in range(20)]
+    assert responses[20] == "" and errors[20] == "boom"
+    assert errors[:20] == [""] * 20
+    assert usage.requests == 20 and usage.total_tokens == 100
+    assert response.split("\n")[:2] == ["P0", "P1"]
+    assert elapsed < 0.6, f"应并发执行，耗时 {elapsed:.2f}s"
+    print(f"✓ 多行提示词并发执行及逐项错误测试通过 ({elapsed:.2f}s)")
+    
+    # 上游传入提示词列表
+    response, responses, errors, usage = node.chat(
+        ["a", "b", "c"], [FakeAPI()], [DoubaoConfig()], system_prompt=["shared system"]
+    )
+    assert responses == ["A", "B", "C"]
+    # 多个API或配置无法与提示词逐项配对，直接报错
+    try:
+        node.chat(["a", "b"], [FakeAPI()], [DoubaoConfig(), DoubaoConfig(seed=1)])
+        assert False, "应该抛出异常"
+    except ValueError as e:
+        assert "doubao_config" in str(e)
+    
+    # 单个提示词保持原有行为
+    response, responses, errors, usage = node.chat(
+        "hello", FakeAPI(), DoubaoConfig(), system_prompt="shared system"
+    )
+    assert response == "HELLO" and responses == ["HELLO"]
+    print("✓ 列表输入及单提示词测试通过")
+
+def test_conversation():
+    """测试多轮对话节点"""
+    print("\n测试多轮对话...")
+    import numpy as np
+    
+    class FakeAPI:
+        def __init__(self):
+            self.calls = []
+        
+        def chat_completions_with_usage(self, messages, config, on_delta=None):
+            self.calls.append(messages)
+            if messages[0].content[0]["text"].startswith("Summarize"):
+                return "summary of early turns", DoubaoUsage(requests=1, total_tokens=3)
+            return "reply %d" % len(self.calls), DoubaoUsage(requests=1, total_tokens=10)
+    
+    node = NODE_CLASS_MAPPINGS["DoubaoConversation"]()
+    api = FakeAPI()
+    config = DoubaoConfig()
+    
+    response, conv1, usage = node.chat("hello", api, config, system_prompt="be brief")
+    assert response == "reply 1" and len(conv1) == 2
+    response, conv2, usage = node.chat("again", api, config, conversation=conv1)
+    sent = api.calls[-1]
+    assert [m.role for m in sent] == ["system", "user", "assistant", "user"]
+    assert sent[0].content[0]["text"] == "be brief"
+    assert sent[-1].content[0]["text"] == "again"
+    # 追加返回新对象，原对话不变，历史消息对象共享
+    assert len(conv1) == 2 and len(conv2) == 4
+    assert conv2.messages[0] is conv1.messages[0]
+    assert conv2.token_counts[:2] == conv1.token_counts
+    print("✓ 增量追加测试通过")
+    
+    # 相同图片只发送一次
+    image = np.random.default_rng(0).random((1, 16, 16, 3)).astype(np.float32)
+    _, conv3, _ = node.chat("look", api, config, conversation=conv2, image=image)
+    assert conv3.messages[-2].content[1]["type"] == "image_url"
+    _, conv4, _ = node.chat("look more", api, config, conversation=conv3, image=image)
+    assert len(conv4.messages[-2].content) == 1
+    assert sum(len(m.content) for m in api.calls[-1]) == len(api.calls[-1]) + 1
+    # 携带图片的轮次被截断后，图片重新发送
+    _, conv5, _ = node.chat("y" * 2000, api, config, conversation=conv4)
+    _, conv6, _ = node.chat("look again", api, config, conversation=conv5, image=image,
+                            max_context_tokens=800)
+    assert conv6.messages[-2].content[1]["type"] == "image_url"
+    assert sum(len(m.content) for m in api.calls[-1]) == len(api.calls[-1]) + 1
+    _, conv7, _ = node.chat("and again", api, config, conversation=conv3, image=image,
+                            max_context_tokens=800, truncation="drop_old_images")
+    assert conv7.messages[-2].content[1]["type"] == "image_url"
+    print("✓ 图片只存储发送一次测试通过")
+    
+    # 滑动窗口：只保留最近的完整轮次
+    long_conv = DoubaoConversation("sys")
+    for i in range(20):
+        long_conv = long_conv.append(
+            DoubaoMessage.create_text_message(MessageRole.user, "question %d " % i + "x" * 300),
+            DoubaoMessage.create_text_message(MessageRole.assistant, "answer %d " % i + "y" * 300),
+        )
+    new = [DoubaoMessage.create_text_message(MessageRole.user, "latest")]
+    messages, dropped = long_conv.build_messages(new, max_tokens=1000)
+    assert dropped > 0 and dropped % 2 == 0
+    assert messages[1].role == "user" and messages[-1].content[0]["text"] == "latest"
+    assert estimate_prompt_tokens(messages) <= 1000
+    assert long_conv.build_messages(new)[1] == 0
+    
+    # 先移除旧图片
+    image_conv = DoubaoConversation().append(
+        DoubaoMessage.create_multimodal_message(MessageRole.user, "pic", "AAAA"),
+        DoubaoMessage.create_text_message(MessageRole.assistant, "a cat"),
+    )
+    messages, dropped = image_conv.build_messages(new, 500, "drop_old_images")
+    assert dropped == 0 and messages[0].content[1]["text"] == "[image omitted]"
+    messages, dropped = image_conv.build_messages(new, 500, "sliding_window")
+    assert dropped == 2
+    print("✓ 上下文截断策略测试通过")
+    
+    # 摘要策略：旧轮次被替换为摘要并保留在对话中
+    api = FakeAPI()
+    response, summarized, usage = node.chat(
+        "latest", api, config, conversation=long_conv,
+        max_context_tokens=1000, truncation="summarize",
+    )
+    assert len(api.calls) == 2 and usage.total_tokens == 13
+    assert summarized.summary == "summary of early turns"
+    assert len(summarized) < len(long_conv)
+    assert "summary of early turns" in api.calls[1][0].content[0]["text"]
+    print("✓ 摘要策略测试通过")
+
+def test_image_payload_cache():
+    """测试图像编码结果缓存"""
+    print("\n测试图像编码缓存...")
+    import numpy as np
+    from nodes import ImagePayloadCache, image_fingerprint, tensor_to_base64
+    
+    rng = np.random.default_rng(0)
+    image = rng.random((1, 256, 256, 3)).astype(np.float32)
+    edited = image.copy()
+    edited[0, 7, 9, 1] = 0.0  # 不在采样点上的单像素修改
+    assert image_fingerprint(image) == image_fingerprint(image.copy())
+    assert image_fingerprint(image, samples=1024) != image_fingerprint(edited, samples=1024)
+    assert image_fingerprint(image) != image_fingerprint(image[:, :128])
+    print("✓ 图像指纹测试通过")
+    
+    cache = ImagePayloadCache(max_bytes=10 * 1024 * 1024)
+    stats = {}
+    first = tensor_to_base64(image, "JPEG", 90, max_side=128, stats=stats, cache=cache)
+    assert stats["encoded_size"] == (128, 128) and "cache_hit" not in stats
+    stats = {}
+    with patch("doubao_client.encode_image", side_effect=AssertionError("应命中缓存")):
+        second = tensor_to_base64(image, "JPEG", 90, max_side=128, stats=stats, cache=cache)
+    assert second == first and stats["cache_hit"] and stats["encoded_size"] == (128, 128)
+    # 编码参数不同则重新编码
+    lower_quality = tensor_to_base64(image, "JPEG", 80, max_side=128, cache=cache)
+    assert lower_quality != first
+    assert tensor_to_base64(image, "JPEG", 90, max_side=128, cache=None) == first
+    info = cache.stats()
+    assert info["hits"] == 1 and info["misses"] == 2 and info["entries"] == 2
+    assert info["hit_rate"] == 1 / 3
+    assert info["bytes"] == len(first) + len(lower_quality)
+    print(f"✓ 缓存命中测试通过 (hit_rate={info['hit_rate']:.2f})")
+    
+    # 按字节上限淘汰最久未使用的条目
+    small = ImagePayloadCache(max_bytes=len(first) * 2 + 10)
+    for quality in (90, 80, 70):
+        tensor_to_base64(image, "JPEG", quality, max_side=128, cache=small)
+    info = small.stats()
+    assert info["bytes"] <= small.max_bytes and info["evictions"] >= 1
+    tensor_to_base64(image, "JPEG", 90, max_side=128, cache=small)
+    assert small.stats()["misses"] == 4
+    print("✓ 字节上限及LRU淘汰测试通过")
+
+def test_context_cache():
+    """测试上下文缓存生命周期"""
+    print("\n测试上下文缓存...")
+    import time
+    from mock_server import MockArkServer
+    from nodes import ContextCache
+    
+    system = DoubaoMessage.create_text_message(MessageRole.system, "You are an expert. " * 300)
+    
+    def ask(text):
+        return [system, DoubaoMessage.create_text_message(MessageRole.user, text)]
+    
+    with MockArkServer() as server:
+        cache = ContextCache(ttl_seconds=3600)
+        api = DoubaoAPI(api_key="mock-key", endpoint=server.url, context_cache=cache)
+        text, usage = api.chat_completions_with_usage(ask("first"), DoubaoConfig())
+        assert text == "mock reply to: first" and usage.cached_tokens > 0
+        text, usage = api.chat_completions_with_usage(
+            ask("second"), DoubaoConfig(stream=True)
+        )
+        assert text == "mock reply to: second" and usage.cached_tokens > 0
+        assert server.stats["context_create"] == 1
+        assert cache.stats()["created"] == 1 and cache.stats()["hit"] == 1
+        print("✓ 上下文创建及复用测试通过")
+        
+        # 短前缀不使用上下文缓存
+        short = [
+            DoubaoMessage.create_text_message(MessageRole.system, "short"),
+            DoubaoMessage.create_text_message(MessageRole.user, "hi"),
+        ]
+        assert api.chat_completions_with_usage(short, DoubaoConfig())[1].cached_tokens == 0
+        
+        # 服务端上下文过期：回退为完整请求并重新创建
+        server.expire_contexts()
+        text, usage = api.chat_completions_with_usage(ask("third"), DoubaoConfig())
+        assert text == "mock reply to: third" and usage.attempts == 1
+        assert cache.stats()["invalidated"] == 1
+        api.chat_completions_with_usage(ask("fourth"), DoubaoConfig())
+        assert server.stats["context_create"] == 2
+        print("✓ 过期回退及重新创建测试通过")
+        
+        # TTL即将到期时后台刷新，期间继续使用旧上下文
+        cache.refresh_margin = 3600
+        api.chat_completions_with_usage(ask("fifth"), DoubaoConfig())
+        for _ in range(100):
+            if server.stats["context_create"] == 3:
+                break
+            time.sleep(0.01)
+        assert server.stats["context_create"] == 3
+        print("✓ 到期前刷新测试通过")
+    
+    # 端点不支持上下文缓存：回退且不再尝试创建
+    with MockArkServer(context_cache=False) as server:
+        cache = ContextCache()
+        api = DoubaoAPI(api_key="mock-key", endpoint=server.url, context_cache=cache)
+        for text in ("a", "b"):
+            reply, usage = api.chat_completions_with_usage(ask(text), DoubaoConfig())
+            assert reply == f"mock reply to: {text}" and usage.cached_tokens == 0
+        assert cache.stats()["unsupported"] == 1 and server.stats["404"] == 1
+    print("✓ 不支持时回退测试通过")
+
+def test_multi_image():
+    """测试多图单次请求"""
+    print("\n测试多图请求...")
+    import numpy as np
+    from nodes import encode_images
+    
+    message = DoubaoMessage.create_multimodal_message(
+        MessageRole.user, "compare", ["AAA", "BBB"], detail=["high", "auto"]
+    )
+    assert [p["type"] for p in message.content] == ["text", "image_url", "image_url"]
+    assert message.content[1]["image_url"]["detail"] == "high"
+    assert "detail" not in message.content[2]["image_url"]
+    single = DoubaoMessage.create_multimodal_message(MessageRole.user, "x", "CCC")
+    assert single.content[1]["image_url"] == {"url": "data:image/jpeg;base64,CCC"}
+    print("✓ 多图消息构建测试通过")
+    
+    class FakeAPI:
+        def __init__(self):
+            self.calls = []
+        
+        def chat_completions_with_usage(self, messages, config, **kwargs):
+            self.calls.append(messages[-1])
+            return "ok", DoubaoUsage(requests=1)
+    
+    rng = np.random.default_rng(1)
+    batch = rng.random((2, 32, 32, 3)).astype(np.float32)
+    extra = rng.random((1, 16, 16, 3)).astype(np.float32)
+    node = NODE_CLASS_MAPPINGS["DoubaoVisionChat"]()
+    api = FakeAPI()
+    response, responses, usage = node.vision_chat(
+        batch, "compare", api, DoubaoConfig(),
+        multi_image=True, image_2=extra, image_details="high,,low",
+    )
+    assert responses == ["ok"] and len(api.calls) == 1
+    parts = api.calls[0].content
+    assert len(parts) == 4
+    assert [p["image_url"].get("detail") for p in parts[1:]] == ["high", None, "low"]
+    
+    # 批量模式：每张图片（包括额外输入）一次请求，提示对应各自的图片
+    api = FakeAPI()
+    response, responses, usage = node.vision_chat(
+        batch, "describe", api, DoubaoConfig(),
+        batch_mode=True, image_2=extra, image_detail="low",
+    )
+    assert responses == ["ok"] * 3 and usage.requests == 3
+    assert all(call.content[1]["image_url"]["detail"] == "low" for call in api.calls)
+    try:
+        node.vision_chat(batch, "x", api, DoubaoConfig(), image_details="huge")
+        assert False, "应该抛出异常"
+    except ValueError:
+        pass
+    print("✓ 多图及逐图分辨率提示测试通过")
+    
+    # 总数据量预算：超出时进一步缩小图片
+    images = [rng.random((256, 256, 3)).astype(np.float32) for _ in range(3)]
+    payloads, stats = encode_images(images, "PNG", max_workers=3)
+    unlimited = sum(len(p) for p in payloads)
+    payloads, stats = encode_images(
+        images, "PNG", max_total_bytes=unlimited // 3, max_workers=3
+    )
+    assert sum(len(p) for p in payloads) <= unlimited // 3
+    assert all(s["encoded_pixels"] < 256 * 256 for s in stats)
+    print("✓ 总数据量预算测试通过")
+
+def test_video_keyframes():
+    """测试视频关键帧采样"""
+    print("\n测试视频关键帧采样...")
+    import time
+    import numpy as np
+    from nodes import select_keyframes, frame_differences
+    
+    # 三个不同纹理的场景各30帧，场景内有轻微噪声和亮度变化
+    rng = np.random.default_rng(0)
+    scenes = [np.kron(rng.random((8, 8)), np.ones((8, 8))) for _ in range(3)]
+    frames = np.stack([
+        np.clip(scene * (0.9 + 0.002 * i) + rng.normal(0, 0.01, (64, 64)), 0, 1)
+        for scene in scenes for i in range(30)
+    ])[..., None].repeat(3, axis=-1).astype(np.float32)
+    
+    assert select_keyframes(frames, 4, "uniform") == [0, 30, 59, 89]
+    assert select_keyframes(frames[:3], 8, "scene_change") == [0, 1, 2]
+    for method in ("scene_change", "phash"):
+        differences = frame_differences(frames, method)
+        assert len(differences) == 89
+        assert set(np.argsort(differences)[-2:]) == {29, 59}
+        assert select_keyframes(frames, 3, method) == [14, 44, 74]
+        # 预算多于场景数时拆分最长的场景
+        keyframes = select_keyframes(frames, 6, method)
+        assert len(keyframes) == 6 and all(0 <= i < 90 for i in keyframes)
+        assert {0, 1, 2} == {i // 30 for i in keyframes}
+    
+    # 长片段采样开销：向量化计算
+    long_clip = np.random.default_rng(0).random((600, 64, 64, 3)).astype(np.float32)
+    start = time.time()
+    select_keyframes(long_clip, 8, "phash")
+    assert time.time() - start < 2.0
+    print("✓ 均匀/场景切换/感知哈希采样测试通过")
+    
+    class FakeAPI:
+        def __init__(self):
+            self.calls = []
+        
+        def chat_completions_with_usage(self, messages, config, **kwargs):
+            self.calls.append(messages)
+            return "a video", DoubaoUsage(requests=1)
+    
+    api = FakeAPI()
+    node = NODE_CLASS_MAPPINGS["DoubaoVideoChat"]()
+    response, keyframes, indices, usage = node.video_chat(
+        frames, "what happens?", api, DoubaoConfig(), max_frames=3, fps=30
+    )
+    assert response == "a video" and len(api.calls) == 1
+    assert indices == "14,44,74" and keyframes.shape == (3, 64, 64, 3)
+    parts = api.calls[0][-1].content
+    assert len(parts) == 4 and "Keyframes at 0.47s, 1.47s, 2.47s" in parts[0]["text"]
+    try:
+        node.video_chat(frames[:0], "what happens?", api, DoubaoConfig())
+        assert False, "应该抛出异常"
+    except ValueError as e:
+        assert "no frames" in str(e)
+    print("✓ 视频节点单次多图请求测试通过")
+
+def test_async_nodes():
+    """测试非阻塞节点与等待节点"""
+    print("\n测试非阻塞节点...")
+    import time
+    import numpy as np
+    
+    class FakeAPI:
+        def chat_completions_with_usage(self, messages, config, **kwargs):
+            time.sleep(0.3)
+            text = messages[-1].content[0]["text"]
+            if text == "fail":
+                raise DoubaoAPIError("boom")
+            return text.upper(), DoubaoUsage(requests=1, total_tokens=7)
+    
+    text_node = NODE_CLASS_MAPPINGS["DoubaoTextChatAsync"]()
+    vision_node = NODE_CLASS_MAPPINGS["DoubaoVisionChatAsync"]()
+    await_node = NODE_CLASS_MAPPINGS["DoubaoAwait"]()
+    assert NODE_CLASS_MAPPINGS["DoubaoTextChatAsync"].RETURN_TYPES == ("DOUBAO_FUTURE",)
+    assert "user_prompt" in NODE_CLASS_MAPPINGS["DoubaoVisionChatAsync"].INPUT_TYPES()["required"]
+    
+    start = time.time()
+    (text_future,) = text_node.submit(
+        user_prompt=["hello"], doubao_api=[FakeAPI()], doubao_config=[DoubaoConfig()]
+    )
+    (vision_future,) = vision_node.submit(
+        image=np.zeros((1, 8, 8, 3), dtype=np.float32), user_prompt="look",
+        doubao_api=FakeAPI(), doubao_config=DoubaoConfig(),
+    )
+    assert time.time() - start < 0.1, "提交应立即返回"
+    time.sleep(0.3)  # 模拟同一工作流中的本地GPU节点
+    response, responses, usage = await_node.wait(text_future)
+    assert response == "HELLO" and responses == ["HELLO"] and usage.total_tokens == 7
+    response, responses, usage = await_node.wait(vision_future)
+    assert response == "LOOK"
+    elapsed = time.time() - start
+    assert elapsed < 0.5, f"网络请求应与其他工作重叠，耗时 {elapsed:.2f}s"
+    print(f"✓ 后台执行并重叠等待测试通过 ({elapsed:.2f}s)")
+    
+    # 错误在等待节点处抛出
+    (future,) = text_node.submit(
+        user_prompt=["fail"], doubao_api=[FakeAPI()], doubao_config=[DoubaoConfig()],
+        ignore_errors=[False],
+    )
+    try:
+        await_node.wait(future)
+        assert False, "应该抛出异常"
+    except DoubaoAPIError as e:
+        assert str(e) == "boom"
+    
+    (future,) = text_node.submit(
+        user_prompt=["slow"], doubao_api=[FakeAPI()], doubao_config=[DoubaoConfig()]
+    )
+    try:
+        await_node.wait(future, timeout=0.1)
+        assert False, "应该超时"
+    except TimeoutError:
+        pass
+    
+    # 超时后取消仍在进行的请求，而不只是停止等待
+    from mock_server import MockArkServer
+    with MockArkServer(latency="fixed:5") as server:
+        api = DoubaoAPI(api_key="mock-key", endpoint=server.url)
+        for prompts, mode in (("one", "single"), ("a\nb\nc", "lines")):
+            (future,) = text_node.submit(
+                user_prompt=[prompts], doubao_api=[api], doubao_config=[DoubaoConfig()],
+                prompt_mode=[mode],
+            )
+            try:
+                await_node.wait(future, timeout=0.3)
+                assert False, "应该超时"
+            except TimeoutError:
+                pass
+            deadline = time.monotonic() + 2
+            while not future.done() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert future.done(), "超时后请求应被中止"
+            errors = future.result()["errors"]
+            assert errors and all("cancelled" in error for error in errors)
+    print("✓ 错误传递及超时取消测试通过")
+
+def test_single_flight():
+    """测试相同并发请求合并"""
+    print("\n测试请求合并...")
+    from concurrent.futures import ThreadPoolExecutor
+    from mock_server import MockArkServer
+    from nodes import SINGLE_FLIGHT
+    
+    messages = [DoubaoMessage.create_text_message(MessageRole.user, "same question")]
+    with MockArkServer(latency="fixed:0.3") as server:
+        api = DoubaoAPI(api_key="mock-key", endpoint=server.url, dedupe_mode="always")
+        before = SINGLE_FLIGHT.stats()["coalesced"]
+        coalesced_metric = METRICS.get_counter(
+            "doubao_coalesced_requests_total", model=DoubaoConfig().model
+        )
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = list(executor.map(
+                lambda _: api.chat_completions_with_usage(messages, DoubaoConfig()), range(5)
+            ))
+        assert server.stats["200"] == 1
+        assert all(text == "mock reply to: same question" for text, _ in results)
+        assert sum(usage.coalesced for _, usage in results) == 4
+        assert SINGLE_FLIGHT.stats()["coalesced"] - before == 4
+        assert METRICS.get_counter(
+            "doubao_coalesced_requests_total", model=DoubaoConfig().model
+        ) - coalesced_metric == 4
+        print("✓ 5个相同并发请求只发送1次")
+        
+        # 不同请求或关闭合并时各自发送
+        api_no_dedupe = DoubaoAPI(api_key="mock-key", endpoint=server.url, dedupe_mode="disabled")
+        api_seeded = DoubaoAPI(api_key="mock-key", endpoint=server.url)
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            list(executor.map(
+                lambda i: api.chat_completions_with_usage(
+                    [DoubaoMessage.create_text_message(MessageRole.user, f"q{i}")], DoubaoConfig()
+                ),
+                range(3),
+            ))
+            list(executor.map(
+                lambda _: api_no_dedupe.chat_completions_with_usage(messages, DoubaoConfig()), range(3)
+            ))
+            list(executor.map(
+                lambda _: api_seeded.chat_completions_with_usage(messages, DoubaoConfig()), range(3)
+            ))
+        assert server.stats["200"] == 1 + 3 + 3 + 3
+        print("✓ 不同请求及关闭合并测试通过")
+    
+    # 错误同样共享给等待中的调用
+    with MockArkServer(latency="fixed:0.3", error_rate=1.0) as server:
+        api = DoubaoAPI(
+            api_key="mock-key",
+            endpoint=server.url,
+            retry_policy=RetryPolicy(max_attempts=1),
+            dedupe_mode="always",
+        )
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [
+                executor.submit(api.chat_completions_with_usage, messages, DoubaoConfig())
+                for _ in range(3)
+            ]
+        errors = [f.exception() for f in futures]
+        assert all(isinstance(e, DoubaoAPIError) for e in errors)
+        assert server.stats["500"] == 1
+    print("✓ 错误共享测试通过")
+    
+    # 合并键按图片指纹计算，不序列化整个请求体
+    image_url = "data:image/jpeg;base64," + "A" * 200000
+    with_image = lambda url, text="look": [
+        DoubaoMessage.create_multimodal_message(MessageRole.user, text, url.split(",", 1)[1])
+    ]
+    key = DoubaoAPI._flight_key(with_image(image_url), DoubaoConfig())
+    assert key == DoubaoAPI._flight_key(with_image("".join(image_url)), DoubaoConfig())
+    assert key != DoubaoAPI._flight_key(with_image(image_url[:-4] + "BBBB"), DoubaoConfig())
+    assert key != DoubaoAPI._flight_key(with_image(image_url, "other"), DoubaoConfig())
+    assert key != DoubaoAPI._flight_key(with_image(image_url), DoubaoConfig(seed=1))
+    print("✓ 图片请求合并键测试通过")
+
+def test_batch_runner():
+    """测试离线批量任务及断点续跑"""
+    print("\n测试离线批量任务...")
+    import json
+    import tempfile
+    import numpy as np
+    from PIL import Image
+    from mock_server import MockArkServer
+    from batch_runner import BatchRunner, iter_manifest
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        Image.fromarray(np.zeros((32, 48, 3), dtype=np.uint8)).save(os.path.join(tmp, "img.png"))
+        manifest = os.path.join(tmp, "manifest.jsonl")
+        with open(manifest, "w", encoding="utf-8") as f:
+            for i in range(5):
+                f.write(json.dumps({"id": i, "prompt": f"task {i}"}) + "\n")
+            f.write(json.dumps({"id": "image", "prompt": "look", "image": "img.png"}) + "\n")
+        
+        tasks = list(iter_manifest(manifest))
+        assert [t["id"] for t in tasks] == ["0", "1", "2", "3", "4", "image"]
+        assert tasks[-1]["image"] == os.path.join(tmp, "img.png")
+        assert [t["id"] for t in iter_manifest(tmp, "caption")] == ["img.png"]
+        print("✓ 清单解析测试通过")
+        
+        output = os.path.join(tmp, "results.jsonl")
+        with MockArkServer(latency="fixed:0.01") as server:
+            api = DoubaoAPI(api_key="mock-key", endpoint=server.url)
+            runner = BatchRunner(api, DoubaoConfig(), output, concurrency=3)
+            
+            # 第一次运行中途停止，模拟崩溃
+            summary = runner.run(iter_manifest(manifest), max_tasks=2)
+            assert summary["done"] == 2 and summary["failed"] == 0
+            # 崩溃时写了一半的行在续跑前被截掉
+            with open(output, "a", encoding="utf-8") as f:
+                f.write('{"id": "3", "respo')
+            with open(output + ".idx", "a", encoding="utf-8") as f:
+                f.write("3")
+            
+            # 重启后只处理剩余任务
+            summary = runner.run(iter_manifest(manifest))
+            assert summary["total"] == 4 and summary["done"] == 4
+            assert runner.run(iter_manifest(manifest))["total"] == 0
+            
+            # 索引丢失后续跑：重建的索引写回磁盘，之后的运行不再重复已完成的任务
+            os.remove(output + ".idx")
+            sent = server.stats["200"]
+            assert runner.run(iter_manifest(manifest))["total"] == 0
+            assert runner.run(iter_manifest(manifest))["total"] == 0
+            assert server.stats["200"] == sent
+        
+        with open(output, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        assert sorted(r["id"] for r in records) == ["0", "1", "2", "3", "4", "image"]
+        by_id = {r["id"]: r for r in records}
+        assert by_id["3"]["response"] == "mock reply to: task 3"
+        assert by_id["image"]["response"] == "mock reply to: look (1 image)"
+        assert by_id["0"]["usage"]["total_tokens"] > 0
+        
+        # 索引丢失时从输出文件重建
+        os.remove(output + ".idx")
+        assert len(runner.load_completed()) == 6
+    print("✓ 追加写入及断点续跑测试通过")
+
+def test_request_serialization():
+    """测试请求体序列化"""
+    print("\n测试请求体序列化...")
+    import base64
+    import json
+    import doubao_client
+    from nodes import encode_request_body
+    
+    image = base64.b64encode(os.urandom(64 * 1024)).decode("ascii")
+    messages = [
+        DoubaoMessage.create_text_message(MessageRole.system, '系统提示 "引号" \\ \x00'),
+        DoubaoMessage.create_multimodal_message(
+            MessageRole.user, "describe", [image, "c2hvcnQ="], detail="low"
+        ),
+    ]
+    api = DoubaoAPI(api_key="test_key")
+    data = api._build_request_data(messages, DoubaoConfig(seed=7))
+    # 消息直接共享内容，不再经过pydantic的dict()复制
+    assert data["messages"][1]["content"] is messages[1].content
+    expected = {
+        **data,
+        "messages": [
+            {"role": msg.role.value, "content": msg.content} for msg in messages
+        ],
+    }
+    
+    for encoder in [doubao_client.orjson, None]:
+        with patch.object(doubao_client, "orjson", encoder):
+            body = encode_request_body(data)
+        assert isinstance(body, bytes)
+        assert json.loads(body) == expected
+        # 大图片的data URL原样拼接进请求体
+        assert f'"data:image/jpeg;base64,{image}"'.encode("ascii") in body
+    print("✓ 请求体与标准JSON编码一致（orjson与标准库）")
+    
+    # 含需转义字符的URL走常规编码
+    odd_url = "data:image/png;base64," + "A" * 5000 + '"\n'
+    odd = {"messages": [{"role": "user", "content": [
+        {"type": "image_url", "image_url": {"url": odd_url}}
+    ]}]}
+    assert json.loads(encode_request_body(odd)) == odd
+    print("✓ 需转义的URL回退为常规编码")
+
+def test_streamed_upload():
+    """测试流式上传请求体"""
+    print("\n测试流式上传...")
+    import base64
+    import json
+    import tracemalloc
+    from mock_server import MockArkServer
+    from nodes import RequestBody, encode_request_body, UPLOAD_CHUNK_SIZE
+    
+    image = base64.b64encode(os.urandom(6 * 1024 * 1024)).decode("ascii")
+    messages = [
+        DoubaoMessage.create_multimodal_message(MessageRole.user, "describe", [image, image])
+    ]
+    api = DoubaoAPI(api_key="mock-key")
+    data = api._build_request_data(messages, DoubaoConfig())
+    body = RequestBody(data)
+    expected = encode_request_body(data)
+    assert len(body) == len(expected)
+    # 可重复迭代，供连接重试时重新发送
+    assert b"".join(body) == expected and b"".join(body) == expected
+    
+    tracemalloc.start()
+    for chunk in body:
+        assert len(chunk) <= UPLOAD_CHUNK_SIZE or chunk is body._pieces[0]
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert peak < 4 * UPLOAD_CHUNK_SIZE, peak
+    print(f"✓ 16MiB请求体发送时的额外内存峰值 {peak / 1024:.0f}KiB")
+    
+    with MockArkServer(latency="fixed:0") as server:
+        api = DoubaoAPI(api_key="mock-key", endpoint=server.url)
+        for stream in [False, True]:
+            response, usage = api.chat_completions_with_usage(
+                messages, DoubaoConfig(stream=stream)
+            )
+            assert response == "mock reply to: describe (2 images)"
+            assert usage.request_bytes > 16 * 1024 * 1024
+    print("✓ 模拟服务接收流式请求体测试通过")
+
+def test_api_pool():
+    """测试多后端负载均衡与健康检查"""
+    print("\n测试多后端负载均衡...")
+    from concurrent.futures import ThreadPoolExecutor
+    from mock_server import MockArkServer
+    from nodes import DoubaoAPIPool, PoolBackend
+    
+    def ask(i):
+        return [DoubaoMessage.create_text_message(MessageRole.user, f"hello {i}")]
+    
+    config = DoubaoConfig()
+    no_retry = RetryPolicy(max_attempts=1)
+    
+    with MockArkServer() as first, MockArkServer() as second:
+        pool = DoubaoAPIPool(
+            [
+                PoolBackend(DoubaoAPI(api_key="key-a", endpoint=first.url), weight=3),
+                PoolBackend(DoubaoAPI(api_key="key-b", endpoint=second.url), weight=1),
+            ],
+            strategy="weighted_round_robin",
+        )
+        for i in range(8):
+            assert pool.chat_completions(ask(i), config) == f"mock reply to: hello {i}"
+        assert (first.stats["200"], second.stats["200"]) == (6, 2)
+        print("✓ 加权轮询测试通过")
+    
+    with MockArkServer(latency="fixed:0.2") as first, MockArkServer(latency="fixed:0.2") as second:
+        pool = NODE_CLASS_MAPPINGS["DoubaoAPIPool"]().create_pool(
+            DoubaoAPI(api_key="key-a", endpoint=first.url),
+            api_2=DoubaoAPI(api_key="key-b", endpoint=second.url),
+            model_2="ep-20250101-abcde",
+        )[0]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(
+                lambda i: pool.chat_completions_with_usage(ask(i), config), range(8)
+            ))
+        assert (first.stats["200"], second.stats["200"]) == (4, 4)
+        models = [usage.model for _, usage in results]
+        assert models.count("ep-20250101-abcde") == 4 and models.count(config.model) == 4
+        assert all(stats["in_flight"] == 0 for stats in pool.stats())
+        print("✓ 最少在途请求分配及逐后端模型测试通过")
+        
+        # 后端池节点接入另一个后端池：展开其后端，平分该位置的权重
+        third = DoubaoAPI(api_key="key-c", endpoint="https://third.test/api/v3")
+        nested = NODE_CLASS_MAPPINGS["DoubaoAPIPool"]().create_pool(
+            pool, api_2=third, weight_1=2.0
+        )[0]
+        assert [b.api for b in nested.backends] == [b.api for b in pool.backends] + [third]
+        assert [b.weight for b in nested.backends] == [1.0, 1.0, 1.0]
+        assert nested.backends[1].model == "ep-20250101-abcde"
+        assert nested.chat_completions(ask(0), config) == "mock reply to: hello 0"
+        try:
+            PoolBackend(pool)
+            assert False, "应抛出异常"
+        except ValueError as e:
+            assert "DoubaoAPIPool" in str(e)
+        print("✓ 嵌套后端池展开测试通过")
+    
+    with MockArkServer(error_rate=1.0) as bad, MockArkServer() as good:
+        bad_api = DoubaoAPI(api_key="key-bad", endpoint=bad.url, retry_policy=no_retry)
+        good_api = DoubaoAPI(api_key="key-good", endpoint=good.url, retry_policy=no_retry)
+        pool = DoubaoAPIPool([PoolBackend(bad_api), PoolBackend(good_api)])
+        for i in range(10):
+            assert pool.chat_completions(ask(i), config)
+        bad_stats, good_stats = pool.stats()
+        # 出错的后端先被尝试并失败转移，错误率达到阈值后被摘除
+        assert bad.stats["500"] == 5 and good.stats["200"] == 10
+        assert bad_stats["ejections"] == 1 and not bad_stats["healthy"]
+        assert good_stats["error_rate"] == 0.0 and good_stats["requests"] == 10
+        assert METRICS.get_counter("doubao_pool_ejections_total", backend=pool.backends[0].name) == 1
+        
+        # 全部后端都被摘除时仍然发送请求，而不是直接失败
+        pool = DoubaoAPIPool([PoolBackend(bad_api)])
+        try:
+            pool.chat_completions(ask(0), config)
+            assert False, "应抛出异常"
+        except DoubaoAPIError as e:
+            assert e.retryable
+        assert bad.stats["500"] == 6
+    print("✓ 失败转移及不健康后端摘除测试通过")
+
+def test_hedged_requests():
+    """测试对冲请求"""
+    print("\n测试对冲请求...")
+    import threading
+    import time
+    from mock_server import MockArkServer
+    from nodes import (
+        DoubaoAPIPool, HedgePolicy, PoolBackend, RequestCancelled, get_hedge_executor,
+        get_hedge_stats,
+    )
+    
+    messages = [DoubaoMessage.create_text_message(MessageRole.user, "hedge me")]
+    # 没有足够的延迟样本时使用max_delay
+    policy = HedgePolicy(percentile=90, max_delay=0.1)
+    calls = []
+    primary_cancelled = threading.Event()
+    
+    def fake_chat(self, messages, config, on_delta=None, usage=None, cancel=None):
+        calls.append(cancel)
+        cancel.mark_sent()  # 对冲计时从请求发出时开始
+        if len(calls) == 1:
+            # 第一个请求卡住，直到被取消
+            assert cancel.wait(5)
+            primary_cancelled.set()
+            raise RequestCancelled()
+        usage.prompt_tokens = 7
+        return "fast"
+    
+    api = DoubaoAPI(api_key="test_key", endpoint="https://hedge.test/api/v3", hedge_policy=policy)
+    before = get_hedge_stats()
+    with patch.object(DoubaoAPI, "_chat_completions", fake_chat):
+        start = time.perf_counter()
+        response, usage = api.chat_completions_with_usage(messages, DoubaoConfig())
+        assert response == "fast" and time.perf_counter() - start < 1.0
+        assert usage.hedged == 1 and usage.prompt_tokens == 7 and usage.requests == 1
+        assert primary_cancelled.wait(1), "落后的请求应被取消"
+        
+        calls.clear()
+        calls.append(None)  # 之后的请求直接返回，不触发对冲
+        response, usage = api.chat_completions_with_usage(messages, DoubaoConfig())
+        assert response == "fast" and usage.hedged == 0 and len(calls) == 2
+        
+        # 原请求在调用线程执行，限流排队时间不计入对冲等待
+        caller = threading.current_thread()
+        
+        def queued_chat(self, messages, config, on_delta=None, usage=None, cancel=None):
+            assert threading.current_thread() is caller
+            time.sleep(0.3)  # 超过max_delay的排队
+            cancel.mark_sent()
+            return "queued"
+        
+        with patch.object(DoubaoAPI, "_chat_completions", queued_chat):
+            response, usage = api.chat_completions_with_usage(messages, DoubaoConfig())
+        assert response == "queued" and usage.hedged == 0
+        
+        # 对冲线程池已满时跳过对冲，而不是排队等待
+        def slow_chat(self, messages, config, on_delta=None, usage=None, cancel=None):
+            cancel.mark_sent()
+            time.sleep(0.3)
+            return "slow"
+        
+        _, slots = get_hedge_executor()
+        taken = 0
+        while slots.acquire(blocking=False):
+            taken += 1
+        skipped = METRICS.get_counter("doubao_hedges_skipped_total", model=DoubaoConfig().model)
+        try:
+            with patch.object(DoubaoAPI, "_chat_completions", slow_chat):
+                response, usage = api.chat_completions_with_usage(messages, DoubaoConfig())
+        finally:
+            for _ in range(taken):
+                slots.release()
+        assert response == "slow" and usage.hedged == 0
+        assert METRICS.get_counter(
+            "doubao_hedges_skipped_total", model=DoubaoConfig().model
+        ) - skipped == 1
+    after = get_hedge_stats()
+    assert after["calls"] - before["calls"] == 4
+    assert after["hedges"] - before["hedges"] == 1
+    assert after["wins"] - before["wins"] == 1
+    assert 0 < after["extra_request_rate"] <= 1
+    print("✓ 慢请求触发对冲、先返回者胜出并取消落后请求测试通过")
+    
+    # 后端池：对冲请求发往另一个后端，流式时以首个token决定胜负
+    with MockArkServer(latency="fixed:1.5") as slow, MockArkServer() as fast:
+        pool = DoubaoAPIPool(
+            [
+                PoolBackend(DoubaoAPI(api_key="key-slow", endpoint=slow.url)),
+                PoolBackend(DoubaoAPI(api_key="key-fast", endpoint=fast.url)),
+            ],
+            hedge_policy=HedgePolicy(max_delay=0.2),
+        )
+        deltas = []
+        start = time.perf_counter()
+        response, usage = pool.chat_completions_with_usage(
+            messages, DoubaoConfig(stream=True), on_delta=lambda delta, text: deltas.append(delta)
+        )
+        assert time.perf_counter() - start < 1.0
+        assert response == "mock reply to: hedge me" == "".join(deltas)
+        assert usage.hedged == 1 and fast.stats["200"] == 1
+        # 落后的流在收到响应头后关闭，不计为后端错误
+        deadline = time.monotonic() + 5
+        while any(stats["in_flight"] for stats in pool.stats()) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert all(stats["in_flight"] == 0 and stats["errors"] == 0 for stats in pool.stats())
+    print("✓ 后端池流式对冲测试通过")
+    
+    # 非流式的落后请求：关闭连接立即结束，并退还TPM预算
+    with MockArkServer(latency="fixed:5") as slow, MockArkServer() as fast:
+        limiter = RateLimiter(tokens_per_minute=60000)
+        pool = DoubaoAPIPool(
+            [
+                PoolBackend(DoubaoAPI(api_key="key-slow", endpoint=slow.url, rate_limiter=limiter)),
+                PoolBackend(DoubaoAPI(api_key="key-fast", endpoint=fast.url)),
+            ],
+            hedge_policy=HedgePolicy(max_delay=0.2),
+        )
+        long_messages = [DoubaoMessage.create_text_message(MessageRole.user, "x" * 9000)]
+        response, usage = pool.chat_completions_with_usage(long_messages, DoubaoConfig())
+        assert response.startswith("mock reply to: xxx") and usage.hedged == 1
+        deadline = time.monotonic() + 1.0
+        while any(stats["in_flight"] for stats in pool.stats()) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert all(stats["in_flight"] == 0 for stats in pool.stats()), "落后的请求应被中止"
+        # 已发送的提示词仍计入预算，只退还未生成的回复部分
+        assert limiter._token_bucket.tokens == 60000 - estimate_prompt_tokens(long_messages)
+    print("✓ 非流式落后请求中止及预算退还测试通过")
+
+def test_lazy_import():
+    """测试延迟导入"""
+    print("\n测试延迟导入...")
+    import json
+    import subprocess
+    
+    here = os.path.dirname(os.path.abspath(__file__))
+    # 在全新的解释器中检查，避免受本进程已加载模块的影响
+    script = """
+import json, sys
+import nodes
+for cls in nodes.NODE_CLASS_MAPPINGS.values():
+    cls.INPUT_TYPES()
+heavy = [
+    m for m in ("doubao_client", "torch", "PIL", "numpy", "requests", "pydantic")
+    if m in sys.modules
+]
+print(json.dumps({"heavy": heavy}))
+"""
+    result = json.loads(subprocess.check_output([sys.executable, "-c", script], cwd=here))
+    assert result["heavy"] == [], f"导入节点时加载了重量级依赖: {result['heavy']}"
+    print("✓ 导入节点模块时未加载客户端及重量级依赖")
+    
+    # 以ComfyUI的方式作为包加载，首次执行时才导入客户端
+    script = """
+import importlib.util, os, sys
+from unittest.mock import Mock
+sys.modules["torch"] = Mock()
+spec = importlib.util.spec_from_file_location(
+    "doubao_package", os.path.join(os.getcwd(), "__init__.py"),
+    submodule_search_locations=[os.getcwd()],
+)
+package = importlib.util.module_from_spec(spec)
+sys.modules["doubao_package"] = package
+spec.loader.exec_module(package)
+assert "doubao_package.doubao_client" not in sys.modules
+nodes = sys.modules["doubao_package.nodes"]
+assert nodes.DoubaoConfig().model
+assert "doubao_package.doubao_client" in sys.modules
+assert "doubao_client" not in sys.modules
+"""
+    subprocess.check_call([sys.executable, "-c", script], cwd=here)
+    print("✓ 作为包加载时按需导入客户端")
+
 def main():
     """运行所有测试"""
     print("开始测试豆包节点基础功能...\n")
@@ -263,6 +1758,31 @@ def main():
         test_node_mappings()
         test_node_input_types()
         test_seed_parameter()
+        test_session_pool()
+        test_vision_batch_mode()
+        test_streaming()
+        test_response_cache()
+        test_image_encoding()
+        test_image_downscale()
+        test_async_client()
+        test_rate_limiter()
+        test_retry_policy()
+        test_metrics()
+        test_mock_server()
+        test_text_batch_prompts()
+        test_batch_runner()
+        test_conversation()
+        test_image_payload_cache()
+        test_context_cache()
+        test_multi_image()
+        test_video_keyframes()
+        test_async_nodes()
+        test_single_flight()
+        test_request_serialization()
+        test_streamed_upload()
+        test_api_pool()
+        test_hedged_requests()
+        test_lazy_import()
         
         print("\n🎉 所有测试通过！")
         print("\n节点功能验证：")
@@ -273,6 +1793,31 @@ def main():
         print("✅ 节点映射正确")
         print("✅ 输入类型定义正确")
         print("✅ Seed参数功能正常")
+        print("✅ 连接池复用正常")
+        print("✅ 视觉批量模式正常")
+        print("✅ 流式响应正常")
+        print("✅ 响应缓存正常")
+        print("✅ 图像编码正常")
+        print("✅ 图像缩放正常")
+        print("✅ 异步客户端正常")
+        print("✅ 客户端限流正常")
+        print("✅ 重试策略正常")
+        print("✅ 用量统计正常")
+        print("✅ 模拟服务正常")
+        print("✅ 多提示词批量模式正常")
+        print("✅ 离线批量任务正常")
+        print("✅ 多轮对话正常")
+        print("✅ 图像编码缓存正常")
+        print("✅ 上下文缓存正常")
+        print("✅ 多图请求正常")
+        print("✅ 视频关键帧采样正常")
+        print("✅ 非阻塞节点正常")
+        print("✅ 请求合并正常")
+        print("✅ 请求体序列化正常")
+        print("✅ 流式上传正常")
+        print("✅ 多后端负载均衡正常")
+        print("✅ 对冲请求正常")
+        print("✅ 延迟导入正常")
         
         print("\n🚀 豆包节点已准备就绪，可以在ComfyUI中使用！")
         